@@ -0,0 +1,200 @@
+from threading import Thread, Lock, Event
+import json
+import os
+import time
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+# разделы справочника по ENTITY_ID метода crm.status.list, остальные справочники хранятся под своим ENTITY_ID
+STATUS_SECTIONS = {'DEAL_STAGE': 'stage', 'DEAL_TYPE': 'type', 'SOURCE': 'source'}
+
+
+def normalize_name(name) -> str:
+    """Функция приводит литерал к виду ключа справочника: нижний регистр, е вместо ё, одиночные пробелы
+
+    :param name: -- литерал, например 'Иванов  Иван' или 'Новая'
+    :return: str -- ключ справочника
+    """
+    return ' '.join(str(name).casefold().replace('ё', 'е').split())
+
+
+class ReferenceResolver(object):
+    """Класс сопоставляет литералы Битрикс24 (имя пользователя, воронка, стадия, тип сделки,
+    значение списочного поля) и их ID. Справочники загружаются целиком несколькими запросами,
+    хранятся в памяти и в файле, поэтому поиск не обращается к API и переживает перезапуск.
+    Устаревшие справочники обновляются в фоновом потоке, до окончания обновления используются прежние
+
+    Разделы справочника:
+        user -- пользователи по 'Фамилия Имя', 'Имя Фамилия', 'Фамилия Имя Отчество' и email
+        category -- воронки сделок
+        stage -- стадии общей воронки, stage/<ID воронки> -- стадии остальных воронок
+        type, source -- типы и источники сделок, остальные справочники crm.status.list -- по ENTITY_ID
+        UF_CRM_... -- значения пользовательских полей сделки типа список
+
+    Атрибуты:
+    :param bx24: BX24 -- портал Битрикс24
+    :param path: str -- путь к файлу справочников
+    :param ttl: int -- время, в течение которого справочники считаются свежими, сек., по умолчанию 1 час
+    :param retry_interval: int -- пауза перед повторным обновлением после ошибки, сек., по умолчанию 60 сек.
+    :param background: bool -- обновлять справочники в фоновом потоке раз в ttl, по умолчанию True
+
+    Использование:
+        >>> reference = ReferenceResolver(bx24, '../../../data/bx24_reference.json')
+        >>> reference.get_id('user', 'Иванов Иван')
+        '15'
+        >>> reference.get_id('stage/5', 'Подготовка заявки')
+        'C5:PREPARATION'
+        >>> reference.close()
+    """
+
+    def __init__(self, bx24, path='../../../data/bx24_reference.json', ttl=3600, retry_interval=60,
+                 background=True):
+        self.bx24 = bx24
+        self.path = path
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._lock = Lock()
+        self._stop = Event()
+        self.sections, self.loaded_at = {}, 0
+        self.refreshing, self.attempted_at = None, 0
+        self.load()
+        if not self.sections:
+            # справочников на диске нет: первая загрузка синхронная, иначе искать не в чем
+            self.refresh()
+        elif not self.is_fresh():
+            self.refresh(wait=False)
+        self.updater = None
+        if background:
+            self.updater = Thread(target=self.update, name='bx24-reference', daemon=True)
+            self.updater.start()
+
+    def is_fresh(self) -> bool:
+        """Функция проверяет, не истек ли TTL справочников"""
+        return time.time() - self.loaded_at < self.ttl
+
+    def get_id(self, kind: str, name, default=None):
+        """Функция возвращает ID по литералу
+
+        :param kind: str -- раздел справочника, см. описание класса
+        :param name: -- литерал, регистр, ё/е и число пробелов не учитываются
+        :param default: -- значение, если литерал не найден
+        :return: -- ID в Битрикс24
+        """
+        if not self.is_fresh() and time.time() - self.attempted_at >= self.retry_interval:
+            self.refresh(wait=False)
+        return self.sections.get(kind, {}).get(normalize_name(name), default)
+
+    def load(self):
+        """Функция читает справочники из файла"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            msg = f'Failed to read Bitrix24 reference data from {self.path}. {e!r}'
+            logging.error(logger(msg))
+            return
+        self.sections, self.loaded_at = snapshot['sections'], snapshot['loaded_at']
+
+    def save(self, sections: dict, loaded_at: float):
+        """Функция записывает справочники в файл через временный файл, чтобы не оставить его недописанным"""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'loaded_at': loaded_at, 'sections': sections}, f, ensure_ascii=False)
+        os.replace(temp, self.path)
+
+    def refresh(self, wait=True):
+        """Функция загружает справочники из Битрикс24 и подменяет текущие
+        Одновременно выполняется не больше одного обновления, при ошибке остаются прежние справочники
+
+        :param wait: bool -- дождаться окончания обновления
+        :return: Thread -- поток обновления
+        """
+        with self._lock:
+            if self.refreshing is None or not self.refreshing.is_alive():
+                self.attempted_at = time.time()
+                self.refreshing = Thread(target=self.reload, name='bx24-reference-refresh', daemon=True)
+                self.refreshing.start()
+            thread = self.refreshing
+        if wait:
+            thread.join()
+        return thread
+
+    def reload(self):
+        try:
+            sections = {'user': self.load_users(), 'category': self.load_categories()}
+            sections.update(self.load_statuses())
+            sections.update(self.load_enums())
+            loaded_at = time.time()
+            self.save(sections, loaded_at)
+        except Exception as e:
+            msg = f'Failed to refresh Bitrix24 reference data, keeping previous. {e!r}'
+            logging.error(logger(msg))
+            return
+        self.sections, self.loaded_at = sections, loaded_at
+        counts = ', '.join(f'{kind} {len(names)}' for kind, names in sections.items())
+        msg = f'Bitrix24 reference data refreshed: {counts}'
+        logging.info(logger(msg))
+
+    def call(self, method: str, params=None) -> dict:
+        response = self.bx24.callMethod(method, params)
+        if 'error' in response:
+            raise RuntimeError(f"Bitrix24 {method} failed: {response['error']} {response.get('error_description')}")
+        return response
+
+    def load_users(self) -> dict:
+        """Функция загружает пользователей, user.get отдает страницы по start и номер следующей в next"""
+        users = {}
+        start = 0
+        while start is not None:
+            response = self.call('user.get', {'FILTER': {'ACTIVE': 'Y'}, 'start': start})
+            for user in response.get('result') or []:
+                last_name, first_name, second_name = (user.get(field) or '' for field in
+                                                      ('LAST_NAME', 'NAME', 'SECOND_NAME'))
+                for name in (f'{last_name} {first_name}', f'{first_name} {last_name}',
+                             f'{last_name} {first_name} {second_name}', user.get('EMAIL') or ''):
+                    if normalize_name(name):
+                        users.setdefault(normalize_name(name), user['ID'])
+            start = response.get('next')
+        return users
+
+    def load_categories(self) -> dict:
+        """Функция загружает воронки сделок"""
+        response = self.call('crm.category.list', {'entityTypeId': 2})
+        return {normalize_name(category['name']): category['id']
+                for category in (response.get('result') or {}).get('categories', [])}
+
+    def load_statuses(self) -> dict:
+        """Функция загружает стадии, типы, источники сделок и остальные справочники crm.status.list"""
+        sections = {}
+        for status in self.bx24.get_list('crm.status.list'):
+            entity_id = status['ENTITY_ID']
+            if entity_id.startswith('DEAL_STAGE_'):
+                kind = f"stage/{entity_id[len('DEAL_STAGE_'):]}"
+            else:
+                kind = STATUS_SECTIONS.get(entity_id, entity_id)
+            sections.setdefault(kind, {})[normalize_name(status['NAME'])] = status['STATUS_ID']
+        return sections
+
+    def load_enums(self) -> dict:
+        """Функция загружает значения пользовательских полей сделки типа список"""
+        sections = {}
+        for field in self.bx24.get_list('crm.deal.userfield.list', {'filter': {'USER_TYPE_ID': 'enumeration'}}):
+            sections[field['FIELD_NAME']] = {normalize_name(item['VALUE']): item['ID']
+                                             for item in field.get('LIST') or []}
+        return sections
+
+    def update(self):
+        while not self._stop.wait(self.ttl if self.is_fresh() else self.retry_interval):
+            self.refresh()
+
+    def close(self):
+        """Функция останавливает фоновое обновление"""
+        self._stop.set()
+        if self.updater is not None:
+            self.updater.join()
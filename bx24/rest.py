@@ -1,5 +1,24 @@
 from urllib.parse import quote
+from functools import lru_cache
+from threading import Lock
+import random
+import time
+import re
 import requests
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from piplines.etl.extract.session import SessionPool
+from piplines.etl.extract.limiter import TokenBucket
+from bx24.reference import ReferenceResolver
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+BATCH_SIZE = 50  # максимальное число команд в одном вызове batch
+WRITE_METHODS = ('add', 'update', 'delete', 'set')  # методы, которые изменяют данные портала
+PAGE_SIZE = 50  # число записей на странице методов *.list
+RETRY_ERRORS = ('QUERY_LIMIT_EXCEEDED', 'INTERNAL_SERVER_ERROR', 'OPERATION_TIME_LIMIT')  # временные ошибки API
+REFERENCE = re.compile(r'\$result\[([^\]]+)\]((?:\[[^\]]*\])*)')  # ссылка на результат команды пакета
 
 
 class BX24(object):
@@ -11,6 +30,18 @@ class BX24(object):
     :param uid: -- идентификационный номер пользователя, от имени которого осуществляется доступ к API Битрикс24
     :param webhook: -- вебхук для доступа к API Битрикс24
     :param timeout: -- задержка для отправки запросов к API Битрикс24, по умолчанию 60 сек.
+    :param sessions: -- объект SessionPool с keep-alive соединениями, по умолчанию создается собственный
+    :param rate: float -- скорость, с которой портал восстанавливает лимит запросов, запросов в секунду,
+                          по умолчанию 2 (для тарифа Энтерпрайз -- 5)
+    :param burst: float -- лимит запросов портала подряд, по умолчанию 50 (для тарифа Энтерпрайз -- 250)
+    :param retries: int -- число повторов при превышении лимита и ошибках 5xx, по умолчанию 5
+    :param backoff_factor: float -- множитель экспоненциальной задержки между повторами, по умолчанию 1 сек.
+    :param reference_path: str -- путь к файлу справочников для get_id, см. ReferenceResolver
+
+    Лимит портала устроен как протекающее ведро: каждый запрос добавляет единицу, ведро вытекает
+    со скоростью rate, при переполнении burst портал отвечает QUERY_LIMIT_EXCEEDED.
+    Клиент ведет такую же корзину (TokenBucket) с запасом 10% и ждет, пока в ней есть место,
+    поэтому всплеск запросов уходит с максимальной допустимой скоростью, а не отклоняется порталом
 
     Использование:
         >>> from bx24.rest import BX24
@@ -18,31 +49,423 @@ class BX24(object):
         >>>             uid=0,
         >>>             webhook='yoursecretwebhook')
     """
-    # TODO: добавить обработчик ошибок
-    def __init__(self, domain: str, uid: int, webhook: str, timeout=60):
+    def __init__(self, domain: str, uid: int, webhook: str, timeout=60, sessions: SessionPool = None,
+                 rate=2.0, burst=50, retries=5, backoff_factor=1.0, reference_path='../../../data/bx24_reference.json'):
         self.url = f"{domain}/{uid}/{webhook}"
         self.timeout = timeout
-
-    def callMethod(self, api_method, params=None):
+        # повторы выполняет callMethod с учетом лимита портала, поэтому в собственном пуле они отключены
+        self.sessions = sessions if sessions is not None else SessionPool(retries=0)
+        # лимит портала считает запросы, а не время их выполнения: пакет из 50 команд может идти дольше 5 сек.,
+        # поэтому скорость снижается только по ответам портала, а не по времени ответа
+        self.bucket = TokenBucket(rate=rate, capacity=burst * 0.9, min_rate=rate / 4, max_rate=rate,
+                                  increase=rate / 20, decrease=0.5, slow_response=float('inf'))
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.reference_path = reference_path
+        self.reference = None  # справочники загружаются при первом вызове get_id
+        self._lock = Lock()
+
+    def callMethod(self, api_method, params=None, idempotent=None):
         """Функция обращается к API Битрикс24
+        Запросы, которые изменяют данные, после таймаута или ошибки 5xx не повторяются: портал мог
+        их уже выполнить, и повтор создал бы дубль сделки. Для них повторяются только отклоненные
+        по лимиту (QUERY_LIMIT_EXCEEDED, 429) и не дошедшие до портала (ошибка установки соединения)
 
         :param api_method: метод API
         :param params: параметры метода
+        :param idempotent: bool -- запрос можно безопасно повторить, по умолчанию -- если метод не изменяет данные
         :return: ответ сервера
         """
         query = f"{self.url}/{api_method}"
-        data = http_build_query(params)
-
-        if api_method.split('.')[-1] in ['add', 'update', 'delete', 'set']:
+        data = http_build_query(params) if params else ''
+        post = api_method.split('.')[-1] in WRITE_METHODS + ('batch',)
+        if post:
             query += '.json'
-            response = requests.post(query, data=data).json()
-        else:
-            response = requests.get(query, params=data).json()
-        return response
+        if idempotent is None:
+            idempotent = not post
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            start = time.monotonic()
+            try:
+                if post:
+                    response = self.sessions.post(query, data=data, timeout=self.timeout)
+                else:
+                    response = self.sessions.get(query, params=data, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.bucket.feedback(503, time.monotonic() - start)
+                result, retry_after = {'error': 'CONNECTION_ERROR', 'error_description': str(e)}, None
+                safe = idempotent or is_connect_error(e)
+            else:
+                self.bucket.feedback(response.status_code, response.elapsed.total_seconds())
+                result, retry_after = parse_response(response), response.headers.get('Retry-After')
+                limited = result.get('error') == 'QUERY_LIMIT_EXCEEDED' or response.status_code == 429
+                if not limited and result.get('error') not in RETRY_ERRORS and response.status_code < 500:
+                    return result
+                if limited and response.status_code not in (429, 503):
+                    # ведро портала переполнено, в том числе чужими запросами: корзина клиента опустошается
+                    self.bucket.feedback(429, 0)
+                safe = idempotent or limited
+            if attempt == self.retries or not safe:
+                break
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else \
+                self.backoff_factor * 2 ** attempt * random.uniform(0.5, 1.5)
+            msg = f"Bitrix24 {api_method} failed with {result.get('error')}, retry {attempt + 1} in {delay:.1f} s"
+            logging.warning(logger(msg))
+            time.sleep(delay)
+
+        msg = f"Bitrix24 {api_method} failed after {attempt + 1} attempts: {result.get('error')} " \
+              f"{result.get('error_description')}"
+        logging.error(logger(msg))
+        return result
+
+    def batch(self, halt=False):
+        """Функция создает пакет вызовов, см. Batch
+
+        :param halt: bool -- прерывать пакет на первой ошибке, по умолчанию False
+        :return: объект Batch
+        """
+        return Batch(self, halt=halt)
+
+    def get_list(self, method: str, params=None, batch=True, id_field='ID'):
+        """Генератор возвращает записи метода *.list по одной, не загружая весь список в память
+        Страницы запрашиваются по ключу (order по ID, filter >ID, start=-1): портал не считает
+        смещение и общее число записей. Если batch, первый запрос узнает total, и остальные страницы
+        запрашиваются пакетами по BATCH_SIZE страниц, каждая ссылается на последний ID предыдущей
+        ($result[...]), то есть до 2500 записей за один запрос к порталу
+
+        Использование:
+            >>> for deal in bx24.get_list('crm.deal.list', {'filter': {'STAGE_ID': 'NEW'}, 'select': ['ID', 'TITLE']}):
+            >>>     print(deal['ID'], deal['TITLE'])
+            >>> items = bx24.get_list('crm.item.list', {'entityTypeId': 2}, id_field='id')
+
+        :param method: str -- метод API, например crm.deal.list
+        :param params: dict -- параметры метода, order заменяется на сортировку по id_field
+        :param batch: bool -- запрашивать страницы пакетами, по умолчанию True
+        :param id_field: str -- поле ID записи, для crm.item.list -- id
+        :return: dict -- запись
+        """
+        params = dict(params or {})
+        conditions = dict(params.get('filter') or {})
+        last_id = conditions.pop(f'>{id_field}', None)
+        params['order'] = {id_field: 'ASC'}
+
+        def page(after, start=-1) -> dict:
+            page_filter = dict(conditions)
+            if after is not None:
+                page_filter[f'>{id_field}'] = after
+            return dict(params, filter=page_filter, start=start)
+
+        def call(page_params) -> dict:
+            response = self.callMethod(method, page_params)
+            if 'error' in response:
+                raise RuntimeError(f"Bitrix24 {method} failed: {response['error']} {response.get('error_description')}")
+            return response
+
+        if batch:
+            response = call(page(last_id, start=0))
+            items, key = list_items(response.get('result'))
+            yield from items
+            if len(items) < PAGE_SIZE:
+                return
+            last_id = items[-1][id_field]
+            path = (key, PAGE_SIZE - 1, id_field) if key is not None else (PAGE_SIZE - 1, id_field)
+            pages = -(-(response.get('total', 0) - PAGE_SIZE) // PAGE_SIZE)
+            while pages > 0:
+                chunk = self.batch()
+                calls = []
+                for _ in range(min(pages, BATCH_SIZE)):
+                    calls.append(chunk.add(method, page(calls[-1].ref(*path) if calls else last_id)))
+                chunk.execute()
+                pages -= len(calls)
+                for page_call in calls:
+                    items = list_items(page_call.result)[0] if page_call.error is None else []
+                    # ошибка или ссылка на неполную страницу (записи удалили во время выгрузки):
+                    # остаток списка дочитывается по ключу с последнего полученного ID
+                    if page_call.error is not None or (items and int(items[0][id_field]) <= int(last_id)):
+                        pages = 0
+                        break
+                    yield from items
+                    if len(items) < PAGE_SIZE:
+                        return
+                    last_id = items[-1][id_field]
+
+        while True:
+            items = list_items(call(page(last_id)).get('result'))[0]
+            yield from items
+            if len(items) < PAGE_SIZE:
+                return
+            last_id = items[-1][id_field]
+
+    def get_id(self, kind: str, name, default=None):
+        """Функция по литералу (имя пользователя, воронка, стадия, тип сделки) возвращает ID в Битрикс24
+        Поиск идет по справочникам в памяти, см. ReferenceResolver
+
+        Использование:
+            >>> bx24.get_id('user', 'Иванов Иван')
+            >>> bx24.get_id('type', 'Продажа товара')
+
+        :param kind: str -- раздел справочника: user, category, stage, stage/<ID воронки>, type, source, UF_CRM_...
+        :param name: -- литерал
+        :param default: -- значение, если литерал не найден
+        :return: -- ID в Битрикс24
+        """
+        if self.reference is None:
+            with self._lock:
+                if self.reference is None:
+                    self.reference = ReferenceResolver(self, self.reference_path)
+        return self.reference.get_id(kind, name, default)
+
+
+def is_connect_error(error: requests.exceptions.RequestException) -> bool:
+    """Функция проверяет, что запрос не был отправлен: соединение не установлено
+
+    :param error: -- исключение requests
+    :return: bool
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def parse_response(response: requests.models.Response) -> dict:
+    """Функция разбирает ответ API Битрикс24, ответ не в JSON (например, страница ошибки 502) -- ошибка
+
+    :param response: -- ответ сервера
+    :return: dict -- ответ API, при ошибке содержит error и error_description
+    """
+    try:
+        result = response.json()
+    except ValueError:
+        return {'error': f'HTTP_{response.status_code}', 'error_description': response.text[:200]}
+    if not isinstance(result, dict):
+        return {'result': result}
+    if response.status_code >= 400 and 'error' not in result:
+        result['error'] = f'HTTP_{response.status_code}'
+    return result
+
+
+def list_items(result) -> tuple:
+    """Функция находит записи в результате метода *.list: список (crm.deal.list)
+    или словарь со списком ({'items': [...]} у crm.item.list, {'tasks': [...]} у tasks.task.list)
+
+    :param result: -- результат метода
+    :return: tuple -- (записи, ключ списка в результате или None)
+    """
+    if isinstance(result, list):
+        return result, None
+    if isinstance(result, dict):
+        for key, value in result.items():
+            if isinstance(value, list):
+                return value, key
+    return [], None
+
+
+class BatchCall(object):
+    """Класс вызова в пакете: после выполнения пакета содержит результат или ошибку
+
+    Атрибуты:
+    :param key: str -- имя команды в пакете
+    :param method: str -- метод API
+    :param params: dict -- параметры метода
+    """
+
+    def __init__(self, key: str, method: str, params=None):
+        self.key = key
+        self.method = method
+        self.params = params or {}
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def ref(self, *path) -> str:
+        """Функция возвращает ссылку на результат вызова для параметров следующих вызовов
+
+        Использование:
+            >>> deal = batch.add('crm.deal.add', {'fields': fields})
+            >>> batch.add('crm.deal.get', {'id': deal.ref()})
+            >>> batch.add('crm.contact.get', {'id': contacts.ref(0, 'ID')})
+
+        :param path: -- ключи внутри результата
+        :return: str -- строка вида $result[key][0][ID]
+        """
+        return f"$result[{self.key}]" + ''.join(f'[{item}]' for item in path)
+
+    def __repr__(self):
+        state = 'error' if self.error is not None else 'done' if self.done else 'pending'
+        return f'BatchCall({self.key!r}, {self.method!r}, {state})'
 
-    def get_id(self):
-        # TODO: реализовать функцию, которая по литералу (имя пользователя или тип сделки) возвращает ID в Битрикс24
-        raise NotImplemented
+
+def resolve_references(value, calls: dict):
+    """Функция подставляет результаты уже выполненных вызовов вместо ссылок $result[...]
+    Ссылки на вызовы из того же запроса batch оставляются, их разрешает Битрикс24
+
+    :param value: -- параметр вызова, строка, список или словарь
+    :param calls: dict -- выполненные вызовы {key: BatchCall}
+    :return: -- параметр с подставленными значениями
+    """
+    if isinstance(value, dict):
+        return {key: resolve_references(item, calls) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, calls) for item in value]
+    if not isinstance(value, str) or '$result[' not in value:
+        return value
+
+    def lookup(match):
+        call = calls.get(match.group(1))
+        if call is None:
+            return None
+        if call.error is not None:
+            raise ValueError(f'Reference {match.group(0)} to failed call: {call.error}')
+        result = call.result
+        for item in re.findall(r'\[([^\]]*)\]', match.group(2)):
+            result = result[int(item)] if isinstance(result, list) else result[item]
+        return result
+
+    match = REFERENCE.fullmatch(value)
+    if match:
+        result = lookup(match)
+        # значение целиком -- ссылка: подставляется с исходным типом
+        return value if result is None and match.group(1) not in calls else result
+
+    def replace(match):
+        result = lookup(match)
+        return match.group(0) if result is None and match.group(1) not in calls else str(result)
+
+    return REFERENCE.sub(replace, value)
+
+
+class Batch(object):
+    """Класс пакета вызовов API Битрикс24: вызовы копятся в очереди и отправляются методом batch
+    по BATCH_SIZE команд за запрос. Параметры могут ссылаться на результаты предыдущих вызовов
+    ($result[key], см. BatchCall.ref): внутри одного запроса ссылки разрешает Битрикс24,
+    ссылки на вызовы из предыдущих запросов подставляются на стороне клиента
+
+    Атрибуты:
+    :param bx24: BX24 -- портал Битрикс24
+    :param halt: bool -- прерывать пакет на первой ошибке
+
+    Использование:
+        >>> with bx24.batch() as batch:
+        >>>     deal = batch.add('crm.deal.add', {'fields': {'TITLE': 'Закупка'}})
+        >>>     batch.add('crm.deal.update', {'id': deal.ref(), 'fields': {'COMMENTS': 'Комментарий'}})
+        >>> deal.result, deal.error
+    """
+
+    def __init__(self, bx24: BX24, halt=False):
+        self.bx24 = bx24
+        self.halt = halt
+        self.calls = []
+        self.requests = 0
+
+    def add(self, method: str, params=None, key=None) -> BatchCall:
+        """Функция добавляет вызов в пакет
+
+        :param method: str -- метод API
+        :param params: dict -- параметры метода
+        :param key: str -- имя команды, по умолчанию номер вызова
+        :return: объект BatchCall
+        """
+        call = BatchCall(key if key is not None else f'c{len(self.calls)}', method, params)
+        self.calls.append(call)
+        return call
+
+    def execute(self) -> list:
+        """Функция отправляет вызовы пакета, еще не выполненные
+
+        :return: list -- все вызовы пакета
+        """
+        done = {call.key: call for call in self.calls if call.done}
+        pending = [call for call in self.calls if not call.done]
+        for start in range(0, len(pending), BATCH_SIZE):
+            chunk = pending[start:start + BATCH_SIZE]
+            commands = {}
+            for call in chunk:
+                try:
+                    params = resolve_references(call.params, done)
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    call.error, call.done = {'error': 'REFERENCE_ERROR', 'error_description': str(e)}, True
+                    done[call.key] = call
+                    continue
+                commands[call.key] = f'{call.method}?{encode_command(params)}'
+            if commands:
+                self.send(chunk, commands)
+            for call in chunk:
+                done[call.key] = call
+            if self.halt and any(call.error is not None for call in chunk):
+                break
+        return self.calls
+
+    def send(self, chunk: list, commands: dict):
+        """Функция отправляет один запрос batch и раскладывает результаты и ошибки по вызовам"""
+        self.requests += 1
+        # пакет из одних чтений (например, страницы get_list) можно повторять, пакет с записью -- нет
+        idempotent = not any(call.method.split('.')[-1] in WRITE_METHODS for call in chunk if call.key in commands)
+        response = self.bx24.callMethod('batch', {'halt': int(self.halt), 'cmd': commands}, idempotent=idempotent)
+        if 'error' in response:
+            for call in chunk:
+                if call.key in commands:
+                    call.error = {'error': response['error'], 'error_description': response.get('error_description')}
+                    call.done = True
+            return
+        result = response.get('result', {})
+        results, errors = result.get('result') or {}, result.get('result_error') or {}
+        # пустые результаты Битрикс24 возвращает списком, а не словарем
+        results = results if isinstance(results, dict) else {}
+        errors = errors if isinstance(errors, dict) else {}
+        for call in chunk:
+            if call.key not in commands:
+                continue
+            if call.key in errors:
+                call.error, call.done = errors[call.key], True
+            elif call.key in results:
+                call.result, call.done = results[call.key], True
+            # команды после ошибки при halt не выполняются и остаются в очереди
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+
+def encode_command(params: dict) -> str:
+    """Функция кодирует параметры команды пакета, ссылки $result[...] оставляются как есть
+
+    :param params: dict -- параметры метода
+    :return: str -- строка запроса
+    """
+    query = http_build_query(params) if params else ''
+    return re.sub(r'%24result((?:%5B[^%&=]*%5D)+)',
+                  lambda match: '$result' + match.group(1).replace('%5B', '[').replace('%5D', ']'), query)
+
+
+SPACE = {'RFC1738': '+', 'RFC3986': '%20'}  # кодирование пробела в зависимости от enc_type
+LEFT_BRACKET, RIGHT_BRACKET = '%5B', '%5D'
+
+
+@lru_cache(maxsize=100_000)
+def quote_word(word: str) -> str:
+    # слова в полях сделок сильно повторяются, поэтому кодирование кэшируется
+    return quote(word, safe='')
+
+
+@lru_cache(maxsize=None)
+def get_encoder(enc_type='RFC1738'):
+    """Функция возвращает кодировщик значений для enc_type, кодировщики создаются один раз
+
+    :param enc_type: str -- 'RFC1738' или 'RFC3986', см. http_build_query
+    :return: -- функция, которая кодирует скалярное значение
+    """
+    space = SPACE[enc_type]
+
+    def encode(value) -> str:
+        # пробельные символы схлопываются в один пробел, '/' тоже кодируется
+        return space.join([quote_word(word) for word in str(value).split()])
+
+    return encode
 
 
 def http_build_query(query_data,
@@ -50,6 +473,7 @@ def http_build_query(query_data,
                      arg_separator='&',
                      enc_type='RFC1738') -> str:
     """Функция генерирует URL-кодированную строку запроса из предоставленного словаря или списка
+    Вложенность словарей и списков не ограничена: {'a': {'b': [{'c': 1}]}} -> a%5Bb%5D%5B0%5D%5Bc%5D=1
 
     Аргументы:
     :param query_data: str -- словарь или список, может быть как простой одномерной структурой,
@@ -64,107 +488,21 @@ def http_build_query(query_data,
                          и пробелы будут кодированы как %20.
     :return: возвращает URL-кодированную строку
     """
-    # TODO: сделать функцию более универсальной, для любого уровня вложенности словарей
-    query = ''
-    ENCODE = {'RFC1738': {'left_bracket': '%5B',
-                          'right_bracket': '%5D',
-                          'space': '+',
-                          },
-              'RFC3986': {'left_bracket': '%5B',
-                          'right_bracket': '%5D',
-                          'space': '%20',
-                          },
-              }
-
-    def build_query_from_dict(qd=query_data, np=numeric_prefix, sep=arg_separator, et=enc_type):
-        q = ''
-        count = 0
-
-        for key, value in qd.items():
-            if not isinstance(value, (dict, list)):
-                q += f"{key}={ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(value).split()))}"
-            elif isinstance(value, dict):
-
-                c = 0
-                for k, v in value.items():
-                    if not isinstance(v, (dict, list)):
-                        q += f"{key}{ENCODE[et]['left_bracket']}{k}{ENCODE[et]['right_bracket']}=" + \
-                             f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(v).split()))}"
-
-                    elif isinstance(v, list):
-                        q += build_query_from_list(qd=v)
-
-                    elif isinstance(v, dict):
-
-                        _c = 0
-                        for _k, _v in v.items():
-                            q += f"{key}{ENCODE[et]['left_bracket']}{k}{ENCODE[et]['right_bracket']}" + \
-                                 f"{ENCODE[et]['left_bracket']}{_k}{ENCODE[et]['right_bracket']}=" + \
-                                 f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(_v).split()))}"
-                            _c += 1
-
-                            if _c < len(v):
-                                q += f"{sep}"
-
-                    c += 1
-
-                    if c < len(value):
-                        q += f"{sep}"
-
-            elif isinstance(value, list):
-
-                c = 0
-                for i, v in enumerate(value):
-                    pr = i
-                    if np is not None:
-                        pr = f"{np}{i}"
-
-                    if not isinstance(v, (dict, list)):
-                        q += f"{key}{ENCODE[et]['left_bracket']}{pr}{ENCODE[et]['right_bracket']}=" + \
-                             f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(v).split()))}"
-
-                    elif isinstance(v, list):
-                        q += build_query_from_list(qd=v)
-
-                    elif isinstance(v, dict):
-                        q += build_query_from_dict(qd=v)
-
-                    c += 1
-
-                    if c < len(value):
-                        q += f"{sep}"
-
-            count += 1
-            if count < len(qd):
-                q += f"{sep}"
-
-        return q
-
-    def build_query_from_list(qd=query_data, np=numeric_prefix, sep=arg_separator, et=enc_type):
-        q = ''
-        count = 0
-
-        for i, value in enumerate(qd):
-            pref = i
-            if np is not None:
-                pref = f"{np}{i}"
-
-            if not isinstance(value, (dict, list)):
-                q += f"{pref}={ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(value).split()))}"
-            elif isinstance(value, dict):
-                q += build_query_from_dict(qd=value)
-            elif isinstance(value, list):
-                q += build_query_from_list(qd=value)
-
-            count += 1
-            if count < len(qd):
-                q += f"{sep}"
-
-        return q
-
-    if isinstance(query_data, dict):
-        query += build_query_from_dict()
-    elif isinstance(query_data, list):
-        query += build_query_from_list()
-
-    return query
+    encode = get_encoder(enc_type)
+    parts = []
+
+    def build(prefix, value):
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value) if numeric_prefix is None else \
+                ((f'{numeric_prefix}{i}', item) for i, item in enumerate(value))
+        else:
+            parts.append(f'{prefix}={encode(value)}')
+            return
+        for key, item in items:
+            build(f'{key}' if prefix is None else f'{prefix}{LEFT_BRACKET}{key}{RIGHT_BRACKET}', item)
+
+    if isinstance(query_data, (dict, list)):
+        build(None, query_data)
+    return arg_separator.join(parts)
@@ -0,0 +1,204 @@
+from datetime import datetime, date, timedelta
+from threading import Lock, Event
+import heapq
+import random
+import sqlite3
+import os
+import yaml
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+DATE_FORMAT = '%d.%m.%Y'  # формат дат в поисковом запросе, см. zakupki.search_query
+
+
+class SavedSearch(object):
+    """Класс сохраненного поиска
+
+    Атрибуты:
+    :param name: str -- уникальное название поиска, ключ водяного знака
+    :param search_string: str -- поисковый запрос
+    :param interval: int -- период опроса портала, сек., по умолчанию 600
+    :param search_filter: str -- тип сортировки, по умолчанию по дате размещения
+    :param start_date: str -- дата, с которой начинается первый запуск, формат даты 01.01.2012,
+                              по умолчанию сегодня
+    """
+
+    def __init__(self, name: str, search_string: str, interval=600, search_filter='Дате размещения', start_date=None):
+        self.name = name
+        self.search_string = search_string
+        self.interval = interval
+        self.search_filter = search_filter
+        self.start_date = datetime.strptime(start_date, DATE_FORMAT).date() if start_date else date.today()
+
+    def __repr__(self):
+        return f'SavedSearch({self.name!r}, {self.search_string!r}, interval={self.interval})'
+
+
+def load_searches(path='../../../configs/searches.yaml') -> list:
+    """Функция загружает сохраненные поиски из конфигурационного файла вида:
+        searches:
+          - name: cable
+            search_string: кабель
+            interval: 600
+            start_date: 01.06.2020
+
+    :param path: str -- путь к конфигурационному файлу
+    :return: list -- список SavedSearch
+    """
+    with open(path) as f:
+        configs = yaml.safe_load(f)
+    return [SavedSearch(**search) for search in configs['searches']]
+
+
+class WatermarkStore(object):
+    """Класс хранит водяные знаки поисков: дату publishDateFrom, с которой начнется следующий запрос
+
+    Атрибуты:
+    :param path: str -- путь к файлу SQLite
+    """
+
+    def __init__(self, path='../../../data/watermarks.sqlite'):
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS watermarks (
+                                       name TEXT PRIMARY KEY,
+                                       publish_date TEXT,
+                                       updated_at TEXT)""")
+        self.connection.commit()
+
+    def get(self, name: str):
+        """Функция возвращает водяной знак поиска
+
+        :param name: str -- название поиска
+        :return: date -- дата publishDateFrom или None, если поиск еще не запускался
+        """
+        with self._lock:
+            row = self.connection.execute('SELECT publish_date FROM watermarks WHERE name = ?', (name,)).fetchone()
+        return datetime.strptime(row[0], '%Y-%m-%d').date() if row else None
+
+    def set(self, name: str, publish_date: date):
+        """Функция сохраняет водяной знак поиска
+
+        :param name: str -- название поиска
+        :param publish_date: date -- дата publishDateFrom следующего запроса
+        """
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)',
+                                    (name, publish_date.isoformat(), datetime.now().isoformat(timespec='seconds')))
+            self.connection.commit()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+class Scheduler(object):
+    """Класс планировщика инкрементального опроса портала
+    Для каждого поиска хранится водяной знак publishDateFrom: запрашивается только окно
+    от водяного знака до сегодняшнего дня. Портал фильтрует по дням, поэтому после успешного
+    запуска водяной знак сдвигается на сегодня, а не на завтра -- закупки, размещенные позже
+    в тот же день, попадут в следующий запуск, повторы отсекает SeenIndex.
+    После простоя пропущенный период обрабатывается окнами по catch_up_days дней,
+    водяной знак сдвигается после каждого окна, поэтому сбой не откатывает уже пройденные окна.
+    Первые запуски поисков разнесены по интервалу, следующие сдвигаются на случайную долю jitter
+
+    Атрибуты:
+    :param searches: list -- список SavedSearch
+    :param job: -- функция job(search, start_date, end_date), даты в формате 01.01.2012,
+                   исключение означает неуспешный запуск
+    :param store: WatermarkStore -- хранилище водяных знаков
+    :param jitter: float -- доля случайного сдвига интервала, по умолчанию 0.1
+    :param catch_up_days: int -- размер окна догона после простоя, дней, по умолчанию 7
+    :param retry_interval: int -- пауза перед повтором неуспешного запуска, сек., по умолчанию 60
+    :param max_failures: int -- число неуспешных запусков одного окна подряд, после которого окно пропускается,
+                               чтобы постоянная ошибка не останавливала поиск навсегда, по умолчанию 5
+
+    Использование:
+        >>> def job(search, start_date, end_date):
+        >>>     zakupki_pipeline(search.search_string, start_date, end_date, db=db, seen=seen).run()
+        >>> Scheduler(load_searches(), job, WatermarkStore()).run()
+    """
+
+    def __init__(self, searches: list, job, store: WatermarkStore, jitter=0.1, catch_up_days=7, retry_interval=60,
+                 max_failures=5):
+        self.searches = searches
+        self.job = job
+        self.store = store
+        self.jitter = jitter
+        self.catch_up_days = catch_up_days
+        self.retry_interval = retry_interval
+        self.max_failures = max_failures
+        self.failures = {}  # {название поиска: (начало окна, число неуспешных запусков подряд)}
+        self._stop = Event()
+        self.queue = []
+        now = datetime.now()
+        for i, search in enumerate(searches):
+            offset = search.interval * i / len(searches)
+            heapq.heappush(self.queue, (now + timedelta(seconds=offset), i, search))
+
+    def windows(self, search: SavedSearch, today=None) -> list:
+        """Функция делит период от водяного знака до сегодняшнего дня на окна не длиннее catch_up_days
+
+        :param search: SavedSearch -- поиск
+        :param today: date -- текущая дата, по умолчанию сегодня
+        :return: list -- список пар (date_from, date_to)
+        """
+        today = today or date.today()
+        start = self.store.get(search.name) or search.start_date
+        windows = []
+        while start <= today:
+            end = min(start + timedelta(days=self.catch_up_days - 1), today)
+            windows.append((start, end))
+            start = end + timedelta(days=1)
+        return windows
+
+    def run_search(self, search: SavedSearch) -> bool:
+        """Функция обрабатывает все окна поиска от водяного знака до сегодняшнего дня
+
+        :param search: SavedSearch -- поиск
+        :return: bool -- True, если все окна обработаны
+        """
+        today = date.today()
+        for date_from, date_to in self.windows(search, today):
+            msg = f'Search {search.name}: window {date_from:{DATE_FORMAT}}-{date_to:{DATE_FORMAT}}'
+            logging.info(logger(msg))
+            try:
+                self.job(search, date_from.strftime(DATE_FORMAT), date_to.strftime(DATE_FORMAT))
+            except Exception as e:
+                window, failures = self.failures.get(search.name, (None, 0))
+                failures = failures + 1 if window == date_from else 1
+                msg = f'Search {search.name} failed on window {date_from:{DATE_FORMAT}}-{date_to:{DATE_FORMAT}} ' \
+                      f'({failures} of {self.max_failures}). {e!r}'
+                logging.error(logger(msg))
+                if failures < self.max_failures:
+                    self.failures[search.name] = (date_from, failures)
+                    return False
+                msg = f'Search {search.name}: skipping window {date_from:{DATE_FORMAT}}-{date_to:{DATE_FORMAT}} ' \
+                      f'after {failures} failures in a row'
+                logging.error(logger(msg))
+            self.failures.pop(search.name, None)
+            # последний день окна может пополниться, поэтому для текущего дня водяной знак не сдвигается дальше
+            self.store.set(search.name, min(date_to + timedelta(days=1), today))
+        return True
+
+    def next_run(self, search: SavedSearch, success: bool) -> datetime:
+        interval = search.interval if success else min(self.retry_interval, search.interval)
+        return datetime.now() + timedelta(seconds=interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def run(self):
+        """Функция запускает поиски по расписанию до вызова stop"""
+        while not self._stop.is_set() and self.queue:
+            run_at, i, search = heapq.heappop(self.queue)
+            wait = (run_at - datetime.now()).total_seconds()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            success = self.run_search(search)
+            heapq.heappush(self.queue, (self.next_run(search, success), i, search))
+
+    def stop(self):
+        """Функция останавливает планировщик после текущего запуска"""
+        self._stop.set()
@@ -1,10 +1,49 @@
-import time
+"""Запуск сохраненных поисков по расписанию
 
+Пути, как и во всех модулях проекта, заданы относительно рабочей папки третьего уровня, например:
+    cd piplines/etl/extract && PYTHONPATH=../../.. python ../../../main.py
+"""
+from core.scheduler import Scheduler, WatermarkStore, load_searches
+from piplines.etl.extract.seen import SeenIndex
+from piplines.etl.load.database import DataBase
+from piplines.etl.pipeline import zakupki_pipeline
+from utils.collecting import logger
+import logging
 
-def run():
-    while True:
-        print("It's worked!!!")
-        time.sleep(5)
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+
+def run(searches_path='../../../configs/searches.yaml', db_path='../../../configs/dbconfig.yaml'):
+    db = DataBase(db_path)
+    db.create_tables()
+    seen = SeenIndex('../../../data/seen.sqlite')
+    store = WatermarkStore('../../../data/watermarks.sqlite')
+
+    def job(search, start_date, end_date):
+        # исключение оставляет водяной знак на месте, и окно обрабатывается повторно при следующем запуске:
+        # так обрабатываются сбои поиска (run поднимает исключение источника) и записи в базу.
+        # Ошибки отдельных закупок окно не задерживают: такие закупки не отмечаются в SeenIndex
+        pipeline = zakupki_pipeline(search.search_string, start_date, end_date, search.search_filter,
+                                    db=db, seen=seen)
+        stats = pipeline.run()
+        msg = f'{search.name} {start_date}-{end_date}: {stats}'
+        logging.info(logger(msg))
+        sink_errors = pipeline.errors(pipeline.sinks())
+        item_errors = pipeline.errors() - sink_errors
+        if item_errors:
+            msg = f'{search.name} {start_date}-{end_date}: {item_errors} items failed and were skipped'
+            logging.warning(logger(msg))
+        if sink_errors:
+            raise RuntimeError(f'{sink_errors} batches failed to store in {search.name} {start_date}-{end_date}')
+
+    scheduler = Scheduler(load_searches(searches_path), job, store)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        seen.close()
+        store.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+"""Микробенчмарк http_build_query: текущая реализация против прежней (конкатенация строк, до трех
+уровней вложенности). Для запросов, которые прежняя реализация кодировала правильно, проверяется
+совпадение результата в режимах RFC1738 и RFC3986
+
+Использование (из папки piplines/etl/benchmark, как и остальные модули):
+    python bench_http_build_query.py
+    python bench_http_build_query.py --repeat 20
+"""
+import argparse
+import sys
+import time
+from urllib.parse import quote
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+from bx24.rest import http_build_query  # noqa: E402
+
+COMMENT = 'Поставка кабельной продукции для нужд ГБУ "Жилищник района" / лот № 1 ' \
+          'Требования: наличие лицензии, опыт исполнения контрактов 3 года\n'
+
+
+def payloads() -> dict:
+    """Функция возвращает типичные запросы к Битрикс24 разного размера
+
+    :return: dict -- {название: параметры метода}
+    """
+    deal = {'fields': {'TITLE': 'Закупка № 0373200041520000123', 'OPPORTUNITY': 1250000.5, 'CURRENCY_ID': 'RUB',
+                       'SOURCE_DESCRIPTION': 'https://zakupki.gov.ru/epz/order/notice/ea44/view/common-info.html',
+                       'COMMENTS': COMMENT * 5},
+            'params': {'REGISTER_SONET_EVENT': 'Y'}}
+    listing = {'order': {'ID': 'ASC'}, 'filter': {'>ID': 1000, 'STAGE_ID': 'NEW', 'CATEGORY_ID': 0},
+               'select': ['ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'ASSIGNED_BY_ID', 'UF_*'], 'start': -1}
+    batch = {'halt': 0, 'cmd': {f'c{i}': 'crm.deal.add?fields%5BTITLE%5D=' + quote(f'Закупка {i}') for i in range(50)}}
+    large = {'fields': {f'UF_CRM_{i}': COMMENT for i in range(2000)}}
+    return {'deal': deal, 'list': listing, 'batch': batch, 'large': large}
+
+
+def timed(func, *args, repeat=10) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    mismatches = []
+    print(f"{'payload':<12}{'legacy, ms':>14}{'current, ms':>14}{'speedup':>10}")
+    for name, params in payloads().items():
+        for enc_type in ('RFC1738', 'RFC3986'):
+            if http_build_query(params, enc_type=enc_type) != legacy_http_build_query(params, enc_type=enc_type):
+                mismatches.append(f'{name} {enc_type}')
+        legacy = timed(legacy_http_build_query, params, repeat=args.repeat)
+        current = timed(http_build_query, params, repeat=args.repeat)
+        print(f'{name:<12}{legacy * 1000:>14.3f}{current * 1000:>14.3f}{legacy / current:>9.1f}x')
+
+    for mismatch in mismatches:
+        print(f'MISMATCH {mismatch}')
+    return 1 if mismatches else 0
+
+
+def legacy_http_build_query(query_data,
+                            numeric_prefix=None,
+                            arg_separator='&',
+                            enc_type='RFC1738') -> str:
+    """Прежняя реализация http_build_query из bx24/rest.py, оставлена для сравнения"""
+    query = ''
+    ENCODE = {'RFC1738': {'left_bracket': '%5B',
+                          'right_bracket': '%5D',
+                          'space': '+',
+                          },
+              'RFC3986': {'left_bracket': '%5B',
+                          'right_bracket': '%5D',
+                          'space': '%20',
+                          },
+              }
+
+    def build_query_from_dict(qd=query_data, np=numeric_prefix, sep=arg_separator, et=enc_type):
+        q = ''
+        count = 0
+
+        for key, value in qd.items():
+            if not isinstance(value, (dict, list)):
+                q += f"{key}={ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(value).split()))}"
+            elif isinstance(value, dict):
+
+                c = 0
+                for k, v in value.items():
+                    if not isinstance(v, (dict, list)):
+                        q += f"{key}{ENCODE[et]['left_bracket']}{k}{ENCODE[et]['right_bracket']}=" + \
+                             f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(v).split()))}"
+
+                    elif isinstance(v, list):
+                        q += build_query_from_list(qd=v)
+
+                    elif isinstance(v, dict):
+
+                        _c = 0
+                        for _k, _v in v.items():
+                            q += f"{key}{ENCODE[et]['left_bracket']}{k}{ENCODE[et]['right_bracket']}" + \
+                                 f"{ENCODE[et]['left_bracket']}{_k}{ENCODE[et]['right_bracket']}=" + \
+                                 f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(_v).split()))}"
+                            _c += 1
+
+                            if _c < len(v):
+                                q += f"{sep}"
+
+                    c += 1
+
+                    if c < len(value):
+                        q += f"{sep}"
+
+            elif isinstance(value, list):
+
+                c = 0
+                for i, v in enumerate(value):
+                    pr = i
+                    if np is not None:
+                        pr = f"{np}{i}"
+
+                    if not isinstance(v, (dict, list)):
+                        q += f"{key}{ENCODE[et]['left_bracket']}{pr}{ENCODE[et]['right_bracket']}=" + \
+                             f"{ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(v).split()))}"
+
+                    elif isinstance(v, list):
+                        q += build_query_from_list(qd=v)
+
+                    elif isinstance(v, dict):
+                        q += build_query_from_dict(qd=v)
+
+                    c += 1
+
+                    if c < len(value):
+                        q += f"{sep}"
+
+            count += 1
+            if count < len(qd):
+                q += f"{sep}"
+
+        return q
+
+    def build_query_from_list(qd=query_data, np=numeric_prefix, sep=arg_separator, et=enc_type):
+        q = ''
+        count = 0
+
+        for i, value in enumerate(qd):
+            pref = i
+            if np is not None:
+                pref = f"{np}{i}"
+
+            if not isinstance(value, (dict, list)):
+                q += f"{pref}={ENCODE[et]['space'].join(map(lambda s: quote(s).replace('/', '%2F'), str(value).split()))}"
+            elif isinstance(value, dict):
+                q += build_query_from_dict(qd=value)
+            elif isinstance(value, list):
+                q += build_query_from_list(qd=value)
+
+            count += 1
+            if count < len(qd):
+                q += f"{sep}"
+
+        return q
+
+    if isinstance(query_data, dict):
+        query += build_query_from_dict()
+    elif isinstance(query_data, list):
+        query += build_query_from_list()
+
+    return query
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Офлайн-бенчмарк извлечения данных закупок по сохраненным страницам
+
+Корпус страниц (fixtures):
+    fixtures/search/*.html                  -- страницы результатов поиска
+    fixtures/<закон>/<номер>/card.html      -- блок закупки со страницы поиска
+    fixtures/<закон>/<номер>/common-info.html
+    fixtures/<закон>/<номер>/documents.html
+
+Использование (из папки piplines/etl/benchmark, как и остальные модули):
+    python bench_zakupki.py record 'кабель' 01.06.2020 30.06.2020 --limit 50
+    python bench_zakupki.py run
+    python bench_zakupki.py run --save-baseline
+    python bench_zakupki.py run --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from bs4 import BeautifulSoup
+from piplines.etl.extract import zakupki, parsers
+from piplines.etl.extract.labels import LabelIndex
+from utils.collecting import Commentator
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# поля страницы общей информации и функции, которые их извлекают
+FIELDS = {
+    'type': zakupki.get_type,
+    'description': zakupki.get_description,
+    'init_date': zakupki.get_init_date,
+    'platform': zakupki.get_platform,
+    'platform_url': zakupki.get_platform_url,
+    'tender_deposit': zakupki.get_tender_deposit,
+    'contract_deposit': zakupki.get_contract_deposit,
+    'warranty_deposit': zakupki.get_warranty_deposit,
+    'author_name': zakupki.get_author_name,
+    'author_inn': zakupki.get_author_inn,
+    'author_ogrn': zakupki.get_author_ogrn,
+    'address': zakupki.get_address,
+    'author_manager': zakupki.get_author_manager,
+    'author_email': zakupki.get_author_email,
+    'author_phone': zakupki.get_author_phone,
+    'start_date': zakupki.get_start_date,
+    'end_date': zakupki.get_end_date,
+    'timezone': zakupki.get_timezone,
+    'result_date': zakupki.get_result_date,
+    'comment': zakupki.get_comment,
+}
+PRICE_FIELDS = ('contract_deposit', 'warranty_deposit')
+SEARCH_FIELDS = {
+    'id': zakupki.get_id,
+    'law': zakupki.get_law,
+    'url': zakupki.get_url,
+    'price': zakupki.get_price,
+}
+
+
+class Response(object):
+    """Класс заменяет requests.models.Response для сохраненной страницы"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.text = content.decode('utf-8')
+
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def load_corpus(root=FIXTURES) -> dict:
+    """Функция загружает корпус страниц в память
+
+    :param root: str -- папка с корпусом
+    :return: dict -- {'search': [bytes], 'cards': [(закон, bytes блока, bytes общей информации, bytes документов)]}
+    """
+    corpus = {'search': [], 'cards': []}
+    search_dir = os.path.join(root, 'search')
+    if os.path.isdir(search_dir):
+        corpus['search'] = [read(os.path.join(search_dir, name)) for name in sorted(os.listdir(search_dir))]
+    for law in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        law_dir = os.path.join(root, law)
+        if law == 'search' or not os.path.isdir(law_dir):
+            continue
+        for number in sorted(os.listdir(law_dir)):
+            card_dir = os.path.join(law_dir, number)
+            corpus['cards'].append((law,
+                                    read(os.path.join(card_dir, 'card.html')),
+                                    read(os.path.join(card_dir, 'common-info.html')),
+                                    read(os.path.join(card_dir, 'documents.html'))))
+    return corpus
+
+
+def record(search_string: str, start_date: str, end_date: str, limit=50, root=FIXTURES):
+    """Функция скачивает страницы с портала и сохраняет их в корпус
+
+    :param search_string: str -- поисковый запрос
+    :param start_date: str -- дата начала фильтрации закупок, формат даты 01.01.2012
+    :param end_date: str -- дата окончания закупок, формат даты 01.01.2012
+    :param limit: int -- число сохраняемых закупок
+    :param root: str -- папка с корпусом
+    """
+    from piplines.etl.extract.utils import get_request
+
+    os.makedirs(os.path.join(root, 'search'), exist_ok=True)
+    saved = 0
+    for page_number, soup in enumerate(zakupki.iter_search_pages(search_string, start_date, end_date), 1):
+        with open(os.path.join(root, 'search', f'{page_number:03d}.html'), 'w', encoding='utf-8') as f:
+            f.write(str(soup))
+        for card in zakupki.get_search_cards(soup):
+            comment = Commentator()
+            law = zakupki.get_law(card, comment).replace('-ФЗ', '') or 'unknown'
+            url = zakupki.get_url(card, comment)
+            card_dir = os.path.join(root, law, str(zakupki.get_id(card, comment)))
+            os.makedirs(card_dir, exist_ok=True)
+            with open(os.path.join(card_dir, 'card.html'), 'w', encoding='utf-8') as f:
+                f.write(str(card))
+            with open(os.path.join(card_dir, 'common-info.html'), 'wb') as f:
+                f.write(get_request(url, use_cache=False).content)
+            with open(os.path.join(card_dir, 'documents.html'), 'wb') as f:
+                f.write(get_request(zakupki.make_part_url(url), use_cache=False).content)
+            saved += 1
+            if saved >= limit:
+                return
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_parser(corpus: dict, parser: str, repeat=3) -> dict:
+    """Функция измеряет извлечение данных одним парсером
+
+    :param corpus: dict -- корпус страниц, см. load_corpus
+    :param parser: str -- 'lxml' или 'bs4'
+    :param repeat: int -- число повторов, берется лучший результат
+    :return: dict -- метрики, время в секундах
+    """
+    best = None
+    for _ in range(repeat):
+        metrics = {'parse': 0.0, 'extract': 0.0, 'docs': 0.0, 'search': 0.0, 'search_fields': 0.0}
+        metrics.update({f'field.{name}': 0.0 for name in FIELDS})
+
+        for html in corpus['search']:
+            _, elapsed = timed(zakupki.get_hrefs, Response(html), parser)
+            metrics['search'] += elapsed
+
+        for _, card_html, common_html, docs_html in corpus['cards']:
+            card, elapsed = timed(BeautifulSoup, card_html, 'lxml')
+            metrics['parse'] += elapsed
+            comment = Commentator()
+            for name, getter in SEARCH_FIELDS.items():
+                _, elapsed = timed(getter, card, comment)
+                metrics['search_fields'] += elapsed
+
+            if parser == 'bs4':
+                soup, elapsed = timed(BeautifulSoup, common_html, 'lxml')
+                index, index_elapsed = timed(LabelIndex, soup)
+                elapsed += index_elapsed
+            else:
+                index, elapsed = timed(parsers.get_label_index, common_html)
+            metrics['parse'] += elapsed
+
+            for name, getter in FIELDS.items():
+                args = (index, 1000.0, comment) if name in PRICE_FIELDS else (index, comment)
+                _, elapsed = timed(getter, *args)
+                metrics[f'field.{name}'] += elapsed
+                metrics['extract'] += elapsed
+
+            try:
+                _, elapsed = timed(zakupki.parse_documents, docs_html, parser)
+            except AttributeError:
+                elapsed = 0.0
+            metrics['docs'] += elapsed
+
+        total = metrics['parse'] + metrics['extract'] + metrics['docs'] + metrics['search_fields']
+        metrics['cards_per_second'] = len(corpus['cards']) / total if total else 0.0
+        if best is None or metrics['cards_per_second'] > best['cards_per_second']:
+            best = metrics
+
+    # пиковая память -- отдельным прогоном полного разбора карточек, tracemalloc замедляет измерения времени
+    previous = parsers.PARSER
+    parsers.set_parser(parser)
+    tracemalloc.start()
+    try:
+        for _, card_html, common_html, docs_html in corpus['cards']:
+            card_data = zakupki.create_card()
+            comment = Commentator()
+            zakupki.fill_search_data(BeautifulSoup(card_html, 'lxml'), card_data, comment)
+            zakupki.fill_pages(card_data, comment, common_html, docs_html)
+        best['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        parsers.set_parser(previous)
+    return best
+
+
+def compare(results: dict, baseline: dict, tolerance: float, cards: int, min_delta=1e-6) -> list:
+    """Функция сравнивает результаты с сохраненным эталоном
+    Время отдельных полей (field.*) мало, поэтому его рост меньше min_delta на карточку считается шумом
+
+    :param results: dict -- текущие метрики по парсерам
+    :param baseline: dict -- эталонные метрики по парсерам
+    :param tolerance: float -- допустимое ухудшение, доля
+    :param cards: int -- число карточек в корпусе
+    :param min_delta: float -- минимальный учитываемый рост времени поля на карточку, сек., по умолчанию 1 мкс
+    :return: list -- список строк с описанием регрессий
+    """
+    regressions = []
+    for parser, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(parser, {}).get(name)
+            if not old:
+                continue
+            if name.startswith('field.') and (value - old) / max(cards, 1) < min_delta:
+                continue
+            # для скорости больше -- лучше, для времени и памяти -- меньше
+            change = old / value - 1 if name == 'cards_per_second' else value / old - 1
+            if value and change > tolerance:
+                regressions.append(f'{parser} {name}: {old:.6g} -> {value:.6g} (+{change:.0%})')
+    return regressions
+
+
+def report(results: dict):
+    names = list(next(iter(results.values())))
+    print(f"{'metric':<28}" + ''.join(f'{parser:>14}' for parser in results))
+    for name in names:
+        print(f'{name:<28}' + ''.join(f'{results[parser][name]:>14.6g}' for parser in results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='сохранить страницы с портала в корпус')
+    record_parser.add_argument('search_string')
+    record_parser.add_argument('start_date')
+    record_parser.add_argument('end_date')
+    record_parser.add_argument('--limit', type=int, default=50)
+
+    run_parser = commands.add_parser('run', help='запустить бенчмарк по корпусу')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--save-baseline', action='store_true')
+    run_parser.add_argument('--tolerance', type=float, default=0.2)
+    run_parser.add_argument('--min-delta', type=float, default=1e-6,
+                            help='минимальный учитываемый рост времени поля на карточку, сек.')
+
+    args = parser.parse_args(argv)
+    if args.command == 'record':
+        record(args.search_string, args.start_date, args.end_date, args.limit)
+        return 0
+
+    corpus = load_corpus()
+    if not corpus['cards']:
+        print(f'Corpus {FIXTURES} is empty, record it first: python bench_zakupki.py record ...')
+        return 1
+    results = {name: bench_parser(corpus, name, args.repeat) for name in parsers.PARSERS}
+    report(results)
+
+    if args.save_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline saved to {BASELINE}')
+        return 0
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            regressions = compare(results, json.load(f), args.tolerance, len(corpus['cards']), args.min_delta)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from threading import Lock
+import sqlite3
+import time
+import os
+import requests
+from requests.structures import CaseInsensitiveDict
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+
+def normalize_url(url: str) -> str:
+    """Функция приводит URL к единому виду для ключа кэша:
+    схема и хост в нижнем регистре, без порта по умолчанию и фрагмента, параметры отсортированы
+
+    :param url: str -- URL-адрес
+    :return: str -- нормализованный URL-адрес
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, parts.port) in (('http', 80), ('https', 443)):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+class ResponseCache(object):
+    """Класс хранит ответы сервера на диске (SQLite) с TTL и вытеснением давно не используемых записей (LRU)
+    Устаревшие записи не удаляются сразу: по ним отправляется условный запрос
+    (If-None-Match / If-Modified-Since), и при ответе 304 запись продлевается.
+    Время обращения при чтении копится в памяти и записывается на диск пачкой (flush_accesses),
+    чтобы попадания в кэш не ждали записи в SQLite
+
+    Атрибуты:
+    :param path: str -- путь к файлу кэша
+    :param ttl: int -- время, в течение которого запись считается свежей, сек., по умолчанию 1 час
+    :param max_size: int -- максимальный суммарный размер ответов в кэше, байт, по умолчанию 512 Мб
+    :param flush_size: int -- число накопленных обращений, при котором они записываются на диск, по умолчанию 1000
+
+    Использование:
+        >>> from piplines.etl.extract.utils import enable_cache
+        >>> enable_cache('../../../data/cache/responses.sqlite', ttl=3600)
+    """
+
+    def __init__(self, path='../../../data/cache/responses.sqlite', ttl=3600, max_size=512 * 1024 ** 2,
+                 flush_size=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self._lock = Lock()
+        self._accesses = {}  # {url: время обращения}, еще не записанные на диск
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                       url TEXT PRIMARY KEY,
+                                       content BLOB,
+                                       encoding TEXT,
+                                       content_type TEXT,
+                                       etag TEXT,
+                                       last_modified TEXT,
+                                       size INTEGER,
+                                       stored_at REAL,
+                                       accessed_at REAL)""")
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self.connection.commit()
+
+    def get(self, url: str):
+        """Функция возвращает запись кэша для URL
+
+        :param url: str -- URL-адрес
+        :return: dict -- запись кэша или None
+        """
+        key = normalize_url(url)
+        with self._lock:
+            row = self.connection.execute('SELECT content, encoding, content_type, etag, last_modified, stored_at '
+                                          'FROM responses WHERE url = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._accesses[key] = time.time()
+            if len(self._accesses) >= self.flush_size:
+                self._flush_accesses()
+        return dict(url=url, content=row[0], encoding=row[1], content_type=row[2],
+                    etag=row[3], last_modified=row[4], stored_at=row[5])
+
+    def _flush_accesses(self):
+        # вызывается под self._lock
+        if self._accesses:
+            self.connection.executemany('UPDATE responses SET accessed_at = ? WHERE url = ?',
+                                        [(accessed_at, url) for url, accessed_at in self._accesses.items()])
+            self.connection.commit()
+            self._accesses = {}
+
+    def flush_accesses(self):
+        """Функция записывает на диск накопленное время обращений к записям"""
+        with self._lock:
+            self._flush_accesses()
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Функция проверяет, не истек ли TTL записи
+
+        :param entry: dict -- запись кэша
+        :return: bool
+        """
+        return time.time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """Функция формирует заголовки условного запроса для устаревшей записи
+
+        :param entry: dict -- запись кэша
+        :return: dict -- заголовки If-None-Match / If-Modified-Since
+        """
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, response: requests.models.Response):
+        """Функция сохраняет ответ сервера и вытесняет старые записи при превышении max_size
+
+        :param url: str -- URL-адрес
+        :param response: requests.models.Response -- ответ сервера
+        """
+        now = time.time()
+        content = response.content
+        with self._lock:
+            self._accesses.pop(normalize_url(url), None)
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (normalize_url(url), content, response.encoding,
+                                     response.headers.get('Content-Type'), response.headers.get('ETag'),
+                                     response.headers.get('Last-Modified'), len(content), now, now))
+            self.connection.commit()
+        self.evict()
+
+    def touch(self, url: str):
+        """Функция продлевает запись после ответа 304 Not Modified
+
+        :param url: str -- URL-адрес
+        """
+        now = time.time()
+        with self._lock:
+            self._accesses.pop(normalize_url(url), None)
+            self.connection.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?',
+                                    (now, now, normalize_url(url)))
+            self.connection.commit()
+
+    def size(self) -> int:
+        """Функция возвращает суммарный размер ответов в кэше, байт"""
+        with self._lock:
+            return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def evict(self):
+        """Функция удаляет давно не использованные записи, пока размер кэша больше max_size"""
+        with self._lock:
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total <= self.max_size:
+                return
+            # порядок вытеснения должен учитывать последние обращения
+            self._flush_accesses()
+            removed = 0
+            rows = self.connection.execute('SELECT url, size FROM responses ORDER BY accessed_at').fetchall()
+            for url, size in rows:
+                if total <= self.max_size:
+                    break
+                self.connection.execute('DELETE FROM responses WHERE url = ?', (url,))
+                total -= size
+                removed += 1
+            self.connection.commit()
+        msg = f'Response cache evicted {removed} entries, {total} bytes left'
+        logging.info(logger(msg))
+
+    @staticmethod
+    def to_response(entry: dict) -> requests.models.Response:
+        """Функция восстанавливает объект requests.models.Response из записи кэша
+
+        :param entry: dict -- запись кэша
+        :return: ответ сервера, объект requests.models.Response, атрибут from_cache равен True
+        """
+        response = requests.models.Response()
+        response._content = entry['content']
+        response.status_code = 200
+        response.url = entry['url']
+        response.encoding = entry['encoding']
+        response.headers = CaseInsensitiveDict({key: value for key, value in (('Content-Type', entry['content_type']),
+                                                                             ('ETag', entry['etag']),
+                                                                             ('Last-Modified', entry['last_modified']))
+                                                if value})
+        response.from_cache = True
+        return response
+
+    def close(self):
+        """Функция закрывает файл кэша"""
+        with self._lock:
+            self._flush_accesses()
+            self.connection.close()
@@ -0,0 +1,263 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import unquote
+from collections import deque
+from datetime import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import requests
+from piplines.etl.extract.utils import SESSIONS, LIMITER
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+CHUNK_SIZE = 64 * 1024  # размер блока при потоковой записи, байт
+
+
+def split_hrefs(docs: str) -> list:
+    """Функция разбивает поле docs карточки (см. get_docs_hrefs44/get_docs_hrefs223) на ссылки
+
+    :param docs: str -- ссылки на документы через перевод строки
+    :return: list -- список ссылок без повторов
+    """
+    return list(dict.fromkeys(href.strip() for href in (docs or '').split('\n') if href.strip()))
+
+
+def get_filename(response: requests.models.Response) -> str:
+    """Функция находит имя файла в заголовке Content-Disposition
+
+    :param response: -- ответ сервера
+    :return: str -- имя файла или None
+    """
+    disposition = response.headers.get('Content-Disposition', '')
+    match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposition, re.IGNORECASE)
+    if match:
+        return unquote(match.group(1).strip('"'))
+    match = re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+    if match:
+        name = match.group(1)
+        try:
+            # сервер часто отдает имя в UTF-8, а requests декодирует заголовок как latin-1
+            return name.encode('latin-1').decode('utf-8')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            return name
+    return None
+
+
+class DocumentStore(object):
+    """Класс загружает документы закупок на диск
+    Файлы хранятся по SHA-256 содержимого (objects/ab/cd/<sha256>), поэтому один и тот же шаблон,
+    приложенный к сотням закупок, хранится один раз. Загрузка идет потоком блоками по CHUNK_SIZE
+    в файл partial/<хэш ссылки>, при обрыве продолжается запросом Range с места остановки.
+    Соответствие ссылок и файлов хранится в SQLite
+
+    Атрибуты:
+    :param root: str -- папка хранилища
+    :param workers: int -- число одновременных загрузок, по умолчанию 8
+    :param retries: int -- число попыток продолжить оборванную загрузку, по умолчанию 3
+    :param timeout: int -- задержка, по умолчанию 60 сек.
+
+    Использование:
+        >>> store = DocumentStore('../../../data/documents')
+        >>> for document in store.download_all(split_hrefs(card_data['docs'])):
+        >>>     if document['new']:
+        >>>         analyze(store.path(document['sha256']))
+    """
+
+    def __init__(self, root='../../../data/documents', workers=8, retries=3, timeout=60):
+        self.root = root
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self._lock = Lock()
+        self._inflight = {}  # {ссылка: [блокировка, число потоков, которые ее держат или ждут]}
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'partial'), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(root, 'documents.sqlite'), check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+                                       url TEXT PRIMARY KEY,
+                                       sha256 TEXT,
+                                       size INTEGER,
+                                       filename TEXT,
+                                       content_type TEXT,
+                                       downloaded_at TEXT)""")
+        self.connection.execute('CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256)')
+        self.connection.commit()
+
+    def path(self, sha256: str) -> str:
+        """Функция возвращает путь к файлу по хэшу содержимого
+
+        :param sha256: str -- хэш содержимого
+        :return: str -- путь к файлу
+        """
+        return os.path.join(self.root, 'objects', sha256[:2], sha256[2:4], sha256)
+
+    def partial_path(self, url: str) -> str:
+        return os.path.join(self.root, 'partial', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def get(self, url: str):
+        """Функция возвращает сведения о загруженном документе
+
+        :param url: str -- ссылка на документ
+        :return: dict -- {'url', 'sha256', 'size', 'filename', 'content_type', 'new'} или None
+        """
+        with self._lock:
+            row = self.connection.execute('SELECT url, sha256, size, filename, content_type FROM documents '
+                                          'WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('url', 'sha256', 'size', 'filename', 'content_type'), row), new=False)
+
+    def request(self, url: str, offset: int, meta: dict) -> requests.models.Response:
+        """Функция запрашивает документ потоком, с offset > 0 -- с места остановки
+
+        :param url: str -- ссылка на документ
+        :param offset: int -- число уже загруженных байт
+        :param meta: dict -- ETag и Last-Modified первого ответа
+        :return: ответ сервера, объект requests.models.Response
+        """
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            # если файл на сервере изменился, If-Range вернет его целиком (200), а не продолжение
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        LIMITER.acquire(url)
+        try:
+            response = SESSIONS.get(url, headers=headers, stream=True, timeout=self.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            LIMITER.feedback(url, 0, self.timeout)
+            raise
+        LIMITER.feedback(url, response.status_code, response.elapsed.total_seconds())
+        return response
+
+    def fetch(self, url: str) -> dict:
+        """Функция загружает документ в partial с продолжением после обрывов
+
+        :param url: str -- ссылка на документ
+        :return: dict -- {'path': путь к загруженному файлу, 'sha256', 'size', 'filename', 'content_type'}
+        """
+        part = self.partial_path(url)
+        meta_path = part + '.json'
+        meta = {}
+        if os.path.exists(meta_path) and os.path.exists(part):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        for attempt in range(self.retries + 1):
+            offset = os.path.getsize(part) if meta and os.path.exists(part) else 0
+            try:
+                response = self.request(url, offset, meta)
+                with response:
+                    if response.status_code == 416 and offset:
+                        # диапазон за концом файла: загрузка уже завершена
+                        break
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        offset = 0
+                        meta = {'etag': response.headers.get('ETag'),
+                                'last_modified': response.headers.get('Last-Modified'),
+                                'filename': get_filename(response),
+                                'content_type': response.headers.get('Content-Type')}
+                        with open(meta_path, 'w') as f:
+                            json.dump(meta, f)
+                    with open(part, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                msg = f'Download of {url} interrupted at {os.path.getsize(part) if os.path.exists(part) else 0} ' \
+                      f'bytes, resuming. {e!r}'
+                logging.warning(logger(msg))
+
+        digest = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        os.remove(meta_path)
+        return dict(path=part, sha256=digest.hexdigest(), size=os.path.getsize(part),
+                    filename=meta.get('filename'), content_type=meta.get('content_type'))
+
+    def download(self, url: str) -> dict:
+        """Функция загружает документ, если он еще не загружен
+
+        :param url: str -- ссылка на документ
+        :return: dict -- {'url', 'sha256', 'size', 'filename', 'content_type', 'new'},
+                         new -- содержимое сохранено впервые и еще не обрабатывалось
+        """
+        with self._lock:
+            entry = self._inflight.setdefault(url, [Lock(), 0])
+            entry[1] += 1
+        # одна и та же ссылка из разных закупок загружается одним потоком, остальные ждут результат.
+        # Запись удаляет последний поток, иначе после ошибки ожидающий и новый поток
+        # получили бы разные блокировки и дописывали бы один файл partial одновременно
+        try:
+            with entry[0]:
+                document = self.get(url)
+                return document if document is not None else self.store(url, self.fetch(url))
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[url]
+
+    def store(self, url: str, fetched: dict) -> dict:
+        """Функция переносит загруженный файл в хранилище по хэшу содержимого
+
+        :param url: str -- ссылка на документ
+        :param fetched: dict -- результат fetch
+        :return: dict -- сведения о документе, см. download
+        """
+        path = self.path(fetched['sha256'])
+        with self._lock:
+            new = not os.path.exists(path)
+            if new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(fetched['path'], path)
+            else:
+                os.remove(fetched['path'])
+            self.connection.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)',
+                                    (url, fetched['sha256'], fetched['size'], fetched['filename'],
+                                     fetched['content_type'], datetime.now().isoformat(timespec='seconds')))
+            self.connection.commit()
+        msg = f"Document {url} {'saved' if new else 'deduplicated'} as {fetched['sha256']}"
+        logging.info(logger(msg))
+        return dict(url=url, sha256=fetched['sha256'], size=fetched['size'], filename=fetched['filename'],
+                    content_type=fetched['content_type'], new=new)
+
+    def download_all(self, urls):
+        """Генератор загружает документы параллельно, не больше workers одновременно
+        Ссылки читаются из urls по мере освобождения потоков, результаты возвращаются по порядку
+
+        :param urls: -- ссылки на документы, может быть генератором
+        :return: dict -- сведения о документе, см. download, или {'url', 'error'}, если загрузка не удалась
+        """
+        def safe_download(url):
+            try:
+                return self.download(url)
+            except (requests.exceptions.RequestException, OSError) as e:
+                msg = f'Failed to download document {url}. {e!r}'
+                logging.error(logger(msg))
+                return {'url': url, 'error': str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for url in urls:
+                pending.append(executor.submit(safe_download, url))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        """Функция закрывает индекс документов"""
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,116 @@
+from bs4 import BeautifulSoup
+
+
+def normalize_label(label: str) -> str:
+    """Функция приводит подпись поля к единому виду: убирает лишние пробелы и переносы строк
+
+    :param label: str -- подпись поля
+    :return: str -- нормализованная подпись
+    """
+    return ' '.join(label.split())
+
+
+class LabelIndex(object):
+    """Класс строит индекс "подпись поля -> значение" за один проход по странице закупки
+    Заменяет поиск soup.find(..., text=...) для каждого поля отдельно
+
+    Поддерживаются пары:
+        * td -> следующий td (страницы 223-ФЗ);
+        * span -> следующий td (например, "(по местному времени заказчика)");
+        * span.section__title -> следующий span.section__info (страницы 44-ФЗ);
+        * span.cardMainInfo__title -> следующий span.cardMainInfo__content.
+
+    Методы поиска возвращают текст значения или None, если подпись не найдена,
+    поэтому вызов .strip() и других методов строки на результате бросает AttributeError,
+    как и прежний вызов .find_next() на None.
+
+    Атрибуты:
+    :param soup: -- объект BeautifulSoup, страница закупки
+
+    Использование:
+        >>> index = LabelIndex(soup)
+        >>> index.td('ИНН')
+        >>> index.section('Почтовый адрес')
+    """
+
+    def __init__(self, soup: BeautifulSoup = None):
+        self.tds = {}
+        self.span_tds = {}
+        self.sections = {}
+        self.main_info = {}
+        if soup is not None:
+            self.build(soup)
+
+    def build(self, soup: BeautifulSoup):
+        """Функция заполняет индекс за один обход тегов td и span
+
+        :param soup: -- объект BeautifulSoup
+        """
+        pending_td, pending_span_td, pending_section, pending_main = [], [], [], []
+
+        for tag in soup.find_all(['td', 'span']):
+            if tag.name == 'td':
+                value = tag.text
+                self.resolve(self.tds, pending_td, value)
+                self.resolve(self.span_tds, pending_span_td, value)
+                label = tag.string
+                if label is not None:
+                    pending_td.append(normalize_label(label))
+                continue
+
+            classes = tag.get('class') or []
+            if 'section__info' in classes:
+                self.resolve(self.sections, pending_section, tag.text)
+            if 'cardMainInfo__content' in classes:
+                self.resolve(self.main_info, pending_main, tag.text)
+
+            label = tag.string
+            if label is None:
+                continue
+            label = normalize_label(label)
+            pending_span_td.append(label)
+            if 'section__title' in classes:
+                pending_section.append(label)
+            if 'cardMainInfo__title' in classes:
+                pending_main.append(label)
+
+    @staticmethod
+    def resolve(index: dict, pending: list, value: str):
+        """Функция записывает значение для ожидающих подписей, первая найденная подпись имеет приоритет
+
+        :param index: dict -- индекс, в который записывается значение
+        :param pending: list -- подписи, ожидающие значения, очищается
+        :param value: str -- текст значения
+        """
+        for label in pending:
+            index.setdefault(label, value)
+        pending.clear()
+
+    def td(self, label: str):
+        """Функция возвращает текст ячейки td, следующей за ячейкой с подписью label"""
+        return self.tds.get(normalize_label(label))
+
+    def span_td(self, label: str):
+        """Функция возвращает текст ячейки td, следующей за span с подписью label"""
+        return self.span_tds.get(normalize_label(label))
+
+    def section(self, label: str):
+        """Функция возвращает текст span.section__info, следующего за span.section__title с подписью label"""
+        return self.sections.get(normalize_label(label))
+
+    def card_main_info(self, label: str):
+        """Функция возвращает текст span.cardMainInfo__content,
+        следующего за span.cardMainInfo__title с подписью label
+        """
+        return self.main_info.get(normalize_label(label))
+
+
+def label_index(soup) -> LabelIndex:
+    """Функция возвращает индекс подписей страницы, повторно индекс не строится
+
+    :param soup: -- объект BeautifulSoup или готовый LabelIndex
+    :return: объект LabelIndex
+    """
+    if isinstance(soup, LabelIndex):
+        return soup
+    return LabelIndex(soup)
@@ -0,0 +1,128 @@
+from urllib.parse import urlsplit
+from threading import Lock
+import time
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+
+class TokenBucket(object):
+    """Класс реализует адаптивный алгоритм token bucket для одного хоста
+    Скорость снижается мультипликативно при ответах 429/503 и медленных ответах
+    и увеличивается аддитивно, пока сервер отвечает нормально (AIMD)
+
+    Атрибуты:
+    :param rate: float -- начальная скорость, запросов в секунду
+    :param capacity: float -- емкость корзины, максимальный всплеск запросов
+    :param min_rate: float -- нижняя граница скорости, запросов в секунду
+    :param max_rate: float -- верхняя граница скорости, запросов в секунду
+    :param increase: float -- прибавка к скорости после успешного ответа, запросов в секунду
+    :param decrease: float -- множитель скорости при перегрузке сервера
+    :param slow_response: float -- время ответа в сек., начиная с которого сервер считается перегруженным
+    """
+
+    def __init__(self, rate=2.0, capacity=5.0, min_rate=0.2, max_rate=20.0,
+                 increase=0.1, decrease=0.5, slow_response=5.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_response = slow_response
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Функция ждет, пока в корзине появится токен, и забирает его"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def feedback(self, status_code: int, elapsed: float):
+        """Функция подстраивает скорость по ответу сервера
+
+        :param status_code: int -- код ответа сервера, 0 -- ответа нет (таймаут, обрыв соединения)
+        :param elapsed: float -- время ответа, сек.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if status_code in (0, 429, 503) or elapsed >= self.slow_response:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.tokens = min(self.tokens, 0)
+            elif status_code < 500:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class RateLimiter(object):
+    """Класс хранит адаптивные корзины токенов по хостам
+
+    Атрибуты:
+    :param bucket_params: -- параметры TokenBucket для новых хостов
+
+    Использование:
+        >>> from piplines.etl.extract.limiter import RateLimiter
+        >>> limiter = RateLimiter(rate=2.0, max_rate=10.0)
+        >>> limiter.acquire(url)
+        >>> response = requests.get(url)
+        >>> limiter.feedback(url, response.status_code, response.elapsed.total_seconds())
+    """
+
+    def __init__(self, **bucket_params):
+        self.bucket_params = bucket_params
+        self._buckets = {}
+        self._lock = Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        """Функция возвращает корзину токенов для хоста из URL
+
+        :param url: str -- URL-адрес
+        :return: объект TokenBucket
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(**self.bucket_params)
+            return self._buckets[host]
+
+    def acquire(self, url: str):
+        """Функция ждет разрешения на запрос к хосту
+
+        :param url: str -- URL-адрес
+        """
+        self.bucket(url).acquire()
+
+    def feedback(self, url: str, status_code: int, elapsed: float):
+        """Функция передает корзине хоста результат запроса
+
+        :param url: str -- URL-адрес
+        :param status_code: int -- код ответа сервера
+        :param elapsed: float -- время ответа, сек.
+        """
+        bucket = self.bucket(url)
+        rate = bucket.rate
+        bucket.feedback(status_code, elapsed)
+        if bucket.rate < rate:
+            msg = f'Host {urlsplit(url).netloc} is throttling (status {status_code}, {elapsed:.1f} s), ' \
+                  f'rate lowered to {bucket.rate:.2f} req/s'
+            logging.warning(logger(msg))
+
+    def rates(self) -> dict:
+        """Функция возвращает текущие скорости по хостам
+
+        :return: dict -- словарь {хост: запросов в секунду}
+        """
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
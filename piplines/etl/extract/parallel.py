@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from collections import deque
+import os
+import time
+import requests
+from bs4 import BeautifulSoup
+from piplines.etl.extract.utils import get_request
+from piplines.etl.extract.zakupki import create_card, fill_search_data, fill_pages, get_url, make_part_url
+from utils.collecting import logger, Commentator
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+
+def fetch_page(url: str):
+    """Функция загружает страницу и возвращает ее содержимое
+
+    :param url: str -- URL-адрес
+    :return: bytes -- содержимое страницы или None, если запрос не удался
+    """
+    try:
+        return get_request(url).content
+    except (requests.exceptions.RequestException, ValueError) as e:
+        msg = f'Request to {url} failed. {e}'
+        logging.error(logger(msg))
+        return None
+
+
+def fetch_card_pages(card_html: str, url: str, fetcher: ThreadPoolExecutor) -> tuple:
+    """Функция загружает страницы общей информации и документов закупки параллельно
+
+    :param card_html: str -- HTML блока закупки на странице поиска
+    :param url: str -- URL-закупки на ЕИС в сфере закупок
+    :param fetcher: ThreadPoolExecutor -- пул потоков для загрузки документов закупки
+    :return: tuple -- (card_html, HTML общей информации, HTML документов)
+    """
+    try:
+        docs_future = fetcher.submit(fetch_page, make_part_url(url))
+    except ValueError:
+        docs_future = None
+    common_html = fetch_page(url) if url else None
+    docs_html = docs_future.result() if docs_future is not None else None
+    return card_html, common_html, docs_html
+
+
+def parse_card(card_html: str, common_html, docs_html) -> dict:
+    """Функция собирает карточку закупки из загруженных страниц, выполняется в отдельном процессе
+
+    :param card_html: str -- HTML блока закупки на странице поиска
+    :param common_html: bytes -- HTML-страница общей информации о закупке или None
+    :param docs_html: bytes -- HTML-страница документов закупки или None
+    :return: dict -- карточка закупки, как у get_card_data
+    """
+    comment = Commentator()
+    card_data = create_card()
+    card_data['time'] = time.time()
+    fill_search_data(BeautifulSoup(card_html, 'lxml'), card_data, comment)
+    return fill_pages(card_data, comment, common_html, docs_html)
+
+
+def chain(fetch_future: Future, parser: ProcessPoolExecutor) -> Future:
+    """Функция передает результат загрузки в пул процессов, как только загрузка завершится
+
+    :param fetch_future: Future -- загрузка страниц закупки
+    :param parser: ProcessPoolExecutor -- пул процессов для разбора страниц
+    :return: Future -- готовая карточка закупки
+    """
+    result = Future()
+
+    def on_parsed(parse_future: Future):
+        try:
+            result.set_result(parse_future.result())
+        except Exception as e:
+            result.set_exception(e)
+
+    def on_fetched(future: Future):
+        try:
+            parser.submit(parse_card, *future.result()).add_done_callback(on_parsed)
+        except Exception as e:
+            result.set_exception(e)
+
+    fetch_future.add_done_callback(on_fetched)
+    return result
+
+
+def iter_cards_data(cards, fetch_workers=20, parse_workers=None, window=None):
+    """Генератор карточек закупок: загрузка страниц идет в пуле потоков,
+    разбор HTML -- в пуле процессов, поэтому он не ограничен одним ядром из-за GIL.
+    Карточки возвращаются в порядке следования cards
+
+    Использование:
+        >>> for card_data in iter_cards_data(iter_cards('кабель', '01.06.2020', '30.06.2020'), parse_workers=8):
+        >>>     print(card_data['id'])
+
+    :param cards: -- блоки закупок на странице поиска, объекты BeautifulSoup
+    :param fetch_workers: int -- число потоков загрузки, по умолчанию 20
+    :param parse_workers: int -- число процессов разбора, по умолчанию число ядер
+    :param window: int -- максимальное число закупок в обработке, по умолчанию 2 * (fetch_workers + parse_workers)
+    :return: dict -- карточка закупки
+    """
+    parse_workers = parse_workers or os.cpu_count() or 1
+    window = window or 2 * (fetch_workers + parse_workers)
+    # каждой закупке нужен поток для страницы общей информации и поток для документов
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher, \
+            ThreadPoolExecutor(max_workers=fetch_workers) as docs_fetcher, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parser:
+        pending = deque()
+        for card in cards:
+            url = get_url(card, Commentator())
+            fetch_future = fetcher.submit(fetch_card_pages, str(card), url, docs_fetcher)
+            pending.append(chain(fetch_future, parser))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_cards_data(cards, fetch_workers=20, parse_workers=None) -> list:
+    """Функция парсит список закупок, см. iter_cards_data
+
+    :param cards: -- блоки закупок на странице поиска, объекты BeautifulSoup
+    :param fetch_workers: int -- число потоков загрузки, по умолчанию 20
+    :param parse_workers: int -- число процессов разбора, по умолчанию число ядер
+    :return: list -- список карточек закупок в порядке следования cards
+    """
+    return list(iter_cards_data(cards, fetch_workers, parse_workers))
@@ -0,0 +1,132 @@
+from lxml import etree
+from lxml import html as lxml_html
+from piplines.etl.extract.labels import LabelIndex, normalize_label
+
+PARSERS = ('lxml', 'bs4')
+PARSER = 'lxml'  # 'lxml' -- быстрый разбор через lxml/XPath с откатом на BeautifulSoup, 'bs4' -- только BeautifulSoup
+
+
+def set_parser(parser: str):
+    """Функция переключает парсер страниц по умолчанию
+
+    :param parser: str -- 'lxml' или 'bs4'
+    """
+    global PARSER
+    if parser not in PARSERS:
+        raise ValueError(f'Unknown parser "{parser}", expected one of {PARSERS}')
+    PARSER = parser
+
+
+def has_class(name: str) -> str:
+    """Функция возвращает XPath-условие наличия класса у элемента"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')  # страницы zakupki.gov.ru отдаются в UTF-8
+
+# XPath-выражения компилируются один раз при импорте модуля
+SEARCH_CARDS = etree.XPath("//div[normalize-space(@class)='row no-gutters registry-entry__form mr-0']")
+SEARCH_CARD_HREF = etree.XPath(f"(.//div[{has_class('registry-entry__header-mid__number')}]//a)[1]/@href")
+LABEL_NODES = etree.XPath('//td | //span')
+DOCS_223 = etree.XPath(f"(//div[normalize-space(@class)='addingTbl padTop10 padBtm10 autoTh'])[1]"
+                       f"//a[{has_class('epz_aware')}]/@href")
+DOCS_223_TABLE = etree.XPath("//div[normalize-space(@class)='addingTbl padTop10 padBtm10 autoTh']")
+DOCS_44 = etree.XPath("//div[normalize-space(@class)='attachment row']")
+DOCS_44_HREF = etree.XPath(f"(.//span[{has_class('section__value')}])[1]//a[1]/@href")
+
+
+def get_tree(content: bytes):
+    """Функция строит дерево lxml из HTML-страницы
+
+    :param content: bytes -- HTML-страница в UTF-8, например response.content
+    :return: объект lxml.html.HtmlElement
+    """
+    return lxml_html.document_fromstring(content, parser=HTML_PARSER)
+
+
+def get_hrefs(content: bytes) -> list:
+    """Функция ищет ссылки на закупки на странице поиска, аналог zakupki.get_hrefs
+
+    :param content: bytes -- HTML-страница поиска
+    :return: list -- список со ссылками
+    """
+    hrefs = []
+    for card in SEARCH_CARDS(get_tree(content)):
+        href = SEARCH_CARD_HREF(card)
+        if not href:
+            raise ValueError('Search card without href')
+        hrefs.append(str(href[0]))
+    return hrefs
+
+
+def get_docs_hrefs(content: bytes):
+    """Функция возвращает ссылки на документы закупки для страниц 223-ФЗ и 44-ФЗ,
+    аналог zakupki.get_docs_hrefs223 и zakupki.get_docs_hrefs44
+
+    :param content: bytes -- HTML-страница документов закупки
+    :return: str -- ссылки на документы, None, если разметка не распознана
+    """
+    tree = get_tree(content)
+    if DOCS_223_TABLE(tree):
+        return '\n'.join('https://zakupki.gov.ru' + str(href) for href in DOCS_223(tree))
+
+    hrefs = []
+    for attachment in DOCS_44(tree):
+        href = DOCS_44_HREF(attachment)
+        if not href:
+            return None
+        hrefs.append(str(href[0]))
+    return '\n'.join(hrefs)
+
+
+def element_string(element):
+    """Функция возвращает текст элемента, если он состоит из одной строки (аналог Tag.string в BeautifulSoup)
+
+    :param element: -- элемент lxml
+    :return: str -- текст или None
+    """
+    while True:
+        text = element.text or ''
+        if len(element) == 0:
+            return text or None
+        if len(element) > 1 or text or element[0].tail:
+            return None
+        element = element[0]
+
+
+def get_label_index(content: bytes) -> LabelIndex:
+    """Функция строит индекс подписей страницы закупки через lxml, аналог LabelIndex(soup)
+
+    :param content: bytes -- HTML-страница общей информации о закупке
+    :return: объект LabelIndex
+    """
+    index = LabelIndex()
+    pending_td, pending_span_td, pending_section, pending_main = [], [], [], []
+
+    for element in LABEL_NODES(get_tree(content)):
+        if element.tag == 'td':
+            value = element.text_content()
+            index.resolve(index.tds, pending_td, value)
+            index.resolve(index.span_tds, pending_span_td, value)
+            label = element_string(element)
+            if label is not None:
+                pending_td.append(normalize_label(label))
+            continue
+
+        classes = (element.get('class') or '').split()
+        if 'section__info' in classes:
+            index.resolve(index.sections, pending_section, element.text_content())
+        if 'cardMainInfo__content' in classes:
+            index.resolve(index.main_info, pending_main, element.text_content())
+
+        label = element_string(element)
+        if label is None:
+            continue
+        label = normalize_label(label)
+        pending_span_td.append(label)
+        if 'section__title' in classes:
+            pending_section.append(label)
+        if 'cardMainInfo__title' in classes:
+            pending_main.append(label)
+
+    return index
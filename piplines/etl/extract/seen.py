@@ -0,0 +1,114 @@
+from threading import Lock
+import hashlib
+import math
+import sqlite3
+import os
+
+
+class BloomFilter(object):
+    """Класс реализует фильтр Блума -- компактную структуру для проверки принадлежности множеству
+    Отрицательный ответ точный, положительный -- с вероятностью ложного срабатывания error_rate
+
+    Атрибуты:
+    :param capacity: int -- ожидаемое число элементов
+    :param error_rate: float -- допустимая доля ложных срабатываний
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+def fingerprint(text: str) -> str:
+    """Функция вычисляет отпечаток содержимого закупки
+
+    :param text: str -- текст блока закупки
+    :return: str -- отпечаток, 16 hex-символов
+    """
+    return hashlib.blake2b(' '.join(text.split()).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class SeenIndex(object):
+    """Класс хранит реестровые номера уже обработанных закупок с датой размещения и отпечатком содержимого
+    Номера лежат в SQLite, а в памяти держится фильтр Блума,
+    поэтому проверка новых номеров не обращается к диску
+
+    Атрибуты:
+    :param path: str -- путь к файлу индекса
+    :param capacity: int -- ожидаемое число закупок для фильтра Блума
+    :param error_rate: float -- доля ложных срабатываний фильтра Блума
+
+    Использование:
+        >>> seen = SeenIndex('../../../data/seen.sqlite')
+        >>> if seen.is_new(reg_number, fingerprint(card.text)):
+        >>>     card_data = get_card_data(card)
+        >>>     seen.add(reg_number, card_data['init_date'], fingerprint(card.text))
+    """
+
+    def __init__(self, path='../../../data/seen.sqlite', capacity=1_000_000, error_rate=0.001):
+        self._lock = Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS seen (
+                                       id INTEGER PRIMARY KEY,
+                                       publish_date TEXT,
+                                       fingerprint TEXT)""")
+        self.connection.commit()
+        count = self.connection.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+        self.bloom = BloomFilter(max(capacity, 2 * count), error_rate)
+        for (reg_number,) in self.connection.execute('SELECT id FROM seen'):
+            self.bloom.add(str(reg_number))
+
+    def __contains__(self, reg_number: int) -> bool:
+        if str(reg_number) not in self.bloom:
+            return False
+        with self._lock:
+            return self.connection.execute('SELECT 1 FROM seen WHERE id = ?', (reg_number,)).fetchone() is not None
+
+    def is_new(self, reg_number: int, card_fingerprint: str = None) -> bool:
+        """Функция проверяет, нужно ли обрабатывать закупку
+
+        :param reg_number: int -- реестровый номер извещения
+        :param card_fingerprint: str -- отпечаток содержимого, если не задан, сравнивается только номер
+        :return: bool -- True, если номер не встречался или содержимое изменилось
+        """
+        if str(reg_number) not in self.bloom:
+            return True
+        with self._lock:
+            row = self.connection.execute('SELECT fingerprint FROM seen WHERE id = ?', (reg_number,)).fetchone()
+        if row is None:
+            return True
+        return card_fingerprint is not None and row[0] != card_fingerprint
+
+    def add(self, reg_number: int, publish_date: str = None, card_fingerprint: str = None):
+        """Функция записывает закупку в индекс
+
+        :param reg_number: int -- реестровый номер извещения
+        :param publish_date: str -- дата размещения извещения
+        :param card_fingerprint: str -- отпечаток содержимого
+        """
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO seen VALUES (?, ?, ?)',
+                                    (reg_number, publish_date, card_fingerprint))
+            self.connection.commit()
+        self.bloom.add(str(reg_number))
+
+    def close(self):
+        """Функция закрывает файл индекса"""
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,125 @@
+from urllib.parse import urlsplit
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SessionPool(object):
+    """Класс хранит по одной сессии requests.Session на каждый хост
+    Сессии держат соединения открытыми (keep-alive), поэтому TCP и TLS рукопожатие
+    выполняется один раз на соединение, а не на каждый запрос
+
+    Атрибуты:
+    :param pool_maxsize: int -- максимальное число открытых соединений с одним хостом, по умолчанию 10
+    :param retries: int -- число повторных попыток при ошибках 5xx и таймаутах, по умолчанию 3,
+                           0 -- без повторов (повторы выполняет вызывающий код)
+    :param backoff_factor: float -- множитель экспоненциальной задержки между попытками, по умолчанию 0.5 сек.
+    :param headers_factory: -- функция, возвращающая HEADERS сессии, вызывается один раз при создании сессии
+    :param allowed_methods: -- методы, запросы которых повторяются, по умолчанию только идемпотентные (без POST):
+                               повтор POST после таймаута может выполнить запрос дважды, например создать две сделки
+
+    Использование:
+        >>> from piplines.etl.extract.session import SessionPool
+        >>> sessions = SessionPool(pool_maxsize=20)
+        >>> response = sessions.get('https://zakupki.gov.ru/epz/main/public/home.html', timeout=30)
+        >>> sessions.stats()
+    """
+
+    STATUS_FORCELIST = (500, 502, 503, 504)
+
+    def __init__(self, pool_maxsize=10, retries=3, backoff_factor=0.5, headers_factory=None,
+                 allowed_methods=Retry.DEFAULT_ALLOWED_METHODS):
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.headers_factory = headers_factory
+        self.allowed_methods = allowed_methods
+        self._sessions = {}
+        self._lock = Lock()
+
+    def create_session(self) -> requests.Session:
+        """Функция создает сессию с пулом соединений и повторными попытками
+
+        :return: объект requests.Session
+        """
+        if self.retries:
+            retry = Retry(total=self.retries,
+                          connect=self.retries,
+                          read=self.retries,
+                          status=self.retries,
+                          backoff_factor=self.backoff_factor,
+                          status_forcelist=self.STATUS_FORCELIST,
+                          allowed_methods=self.allowed_methods,
+                          raise_on_status=False)
+        else:
+            # без повторов таймаут чтения поднимается как requests.exceptions.ReadTimeout, а не ConnectionError
+            retry = Retry(0, read=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if self.headers_factory is not None:
+            session.headers.update(self.headers_factory())
+        return session
+
+    def session(self, url: str) -> requests.Session:
+        """Функция возвращает сессию для хоста из URL, создает ее при первом обращении
+
+        :param url: str -- URL-адрес
+        :return: объект requests.Session
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self.create_session()
+            return self._sessions[host]
+
+    def get(self, url: str, **kwargs) -> requests.models.Response:
+        """Функция делает GET-запрос через сессию хоста
+
+        :param url: str -- URL-адрес
+        :param kwargs: -- параметры requests.Session.get
+        :return: ответ сервера, объект requests.models.Response
+        """
+        return self.session(url).get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.models.Response:
+        """Функция делает POST-запрос через сессию хоста
+
+        :param url: str -- URL-адрес
+        :param kwargs: -- параметры requests.Session.post
+        :return: ответ сервера, объект requests.models.Response
+        """
+        return self.session(url).post(url, **kwargs)
+
+    def stats(self) -> dict:
+        """Функция собирает статистику повторного использования соединений по хостам
+
+        :return: dict -- словарь {хост: {'requests': ..., 'connections': ..., 'reused': ...}},
+                         reused -- число запросов, для которых не потребовалось новое рукопожатие
+        """
+        result = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for host, session in sessions:
+            num_requests, num_connections = 0, 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+            result[host] = {'requests': num_requests,
+                            'connections': num_connections,
+                            'reused': max(num_requests - num_connections, 0)}
+        return result
+
+    def close(self):
+        """Функция закрывает все сессии и их соединения"""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
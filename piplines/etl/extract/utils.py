@@ -1,6 +1,10 @@
 import requests
 import json
 import random
+import time
+from piplines.etl.extract.session import SessionPool
+from piplines.etl.extract.limiter import RateLimiter
+from piplines.etl.extract.cache import ResponseCache
 
 
 with open('../../../configs/user-agents.txt') as f:
@@ -16,28 +20,117 @@ def create_headers():
     return {"User-Agent": user_agent, "content-type": "text"}
 
 
+# общий пул сессий: User-Agent выбирается один раз на сессию (хост), а не на каждый запрос.
+# Повторы выполняет get_request, чтобы каждая попытка проходила через LIMITER, поэтому в пуле они отключены
+SESSIONS = SessionPool(pool_maxsize=20, retries=0, headers_factory=create_headers)
+
+# общий ограничитель скорости запросов по хостам, подстраивается под нагрузку портала
+LIMITER = RateLimiter()
+
+# кэш ответов на диске, по умолчанию выключен, см. enable_cache
+CACHE = None
+
+
+def enable_cache(path='../../../data/cache/responses.sqlite', ttl=3600, max_size=512 * 1024 ** 2) -> ResponseCache:
+    """Функция включает кэш ответов для get_request
+
+    :param path: str -- путь к файлу кэша
+    :param ttl: int -- время, в течение которого запись считается свежей, сек., по умолчанию 1 час
+    :param max_size: int -- максимальный размер кэша, байт, по умолчанию 512 Мб
+    :return: объект ResponseCache
+    """
+    global CACHE
+    CACHE = ResponseCache(path, ttl=ttl, max_size=max_size)
+    return CACHE
+
+
+def disable_cache():
+    """Функция выключает кэш ответов для get_request"""
+    global CACHE
+    if CACHE is not None:
+        CACHE.close()
+    CACHE = None
+
+
+def connection_stats() -> dict:
+    """Функция возвращает статистику повторного использования соединений общего пула сессий
+
+    :return: dict -- словарь {хост: {'requests': ..., 'connections': ..., 'reused': ...}}
+    """
+    return SESSIONS.stats()
+
+
+def limited_get(url: str, timeout=30, retries=3, backoff_factor=0.5, **kwargs) -> requests.models.Response:
+    """Функция делает GET-запрос через общий пул сессий с повторами при ошибках соединения,
+    таймаутах и ответах 5xx. Каждая попытка ждет LIMITER и сообщает ему результат,
+    поэтому при перегрузке сервера скорость снижается
+
+    :param url: str -- URL-адрес
+    :param timeout: int -- задержка, по умолчанию 30 сек
+    :param retries: int -- число повторных попыток, по умолчанию 3
+    :param backoff_factor: float -- множитель экспоненциальной задержки между попытками, по умолчанию 0.5 сек.
+    :param kwargs: -- параметры requests.Session.get, например params и headers
+    :return: ответ сервера, объект requests.models.Response
+    """
+    for attempt in range(retries + 1):
+        LIMITER.acquire(url)
+        try:
+            response = SESSIONS.get(url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            LIMITER.feedback(url, 0, timeout)
+            if attempt == retries:
+                raise
+        else:
+            LIMITER.feedback(url, response.status_code, response.elapsed.total_seconds())
+            if response.status_code not in SessionPool.STATUS_FORCELIST or attempt == retries:
+                return response
+        time.sleep(backoff_factor * 2 ** attempt)
+
+
 def get_request(url: str,
-                timeout=30) -> requests.models.Response:
+                timeout=30,
+                use_cache=True,
+                retries=3,
+                backoff_factor=0.5) -> requests.models.Response:
     """Функция делает GET-запрос по URL
+    Если включен кэш (enable_cache), свежий ответ берется с диска,
+    а для устаревшего отправляется условный запрос. Повторы и ограничение скорости -- см. limited_get
 
     :param url: str -- URL-адрес
     :param timeout: int -- задержка, по умолчанию 30 сек
+    :param use_cache: bool -- использовать кэш ответов, если он включен, по умолчанию True
+    :param retries: int -- число повторных попыток, по умолчанию 3
+    :param backoff_factor: float -- множитель экспоненциальной задержки между попытками, по умолчанию 0.5 сек.
     :return: ответ сервера, объект requests.models.Response
     """
-    headers = create_headers()
-    response = requests.get(url, timeout=timeout, headers=headers)
+    cache = CACHE if use_cache else None
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        return cache.to_response(entry)
+
+    headers = cache.conditional_headers(entry) if entry is not None else None
+    response = limited_get(url, timeout=timeout, retries=retries, backoff_factor=backoff_factor, headers=headers)
+
+    if cache is not None:
+        if response.status_code == 304 and entry is not None:
+            cache.touch(url)
+            return cache.to_response(entry)
+        if response.status_code == 200:
+            cache.put(url, response)
     return response
 
 
-def get_api_request(url: str, params: dict, api_method='', timeout=30) -> requests.models.Response:
-    """Функция делает GET-запрос по API
+def get_api_request(url: str, params: dict, api_method='', timeout=30, retries=3,
+                    backoff_factor=0.5) -> requests.models.Response:
+    """Функция делает GET-запрос по API, повторы и ограничение скорости -- см. limited_get
 
     :param url: str -- URL-адрес API сервиса
     :param api_method: str -- метод API
     :param params: dict -- параметры запроса
     :param timeout: int -- задержка, по умолчанию 30 сек
+    :param retries: int -- число повторных попыток, по умолчанию 3
+    :param backoff_factor: float -- множитель экспоненциальной задержки между попытками, по умолчанию 0.5 сек.
     :return: ответ сервера, объект requests.models.Response
     """
-    headers = create_headers()
-    response = requests.get(url + api_method, params=params, timeout=timeout, headers=headers)
-    return response
+    return limited_get(url + api_method, timeout=timeout, retries=retries, backoff_factor=backoff_factor,
+                       params=params)
@@ -1,15 +1,27 @@
 from urllib.parse import quote
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
 import numpy as np
 import time
+import re
+import asyncio
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from piplines.etl.extract.utils import get_request
+from piplines.etl.extract.labels import LabelIndex, label_index
+from piplines.etl.extract import parsers
+from piplines.etl.extract.seen import SeenIndex, fingerprint
 from piplines.etl.transform.converter import to_numeric, date_formatter, datetime_formatter
+from piplines.etl.transform.card import CARD_FIELDS
 from utils.collecting import logger, Commentator
 import logging
 
 logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
 
+RECORDS_PER_PAGE = 100  # число закупок на странице поиска, см. recordsPerPage в search_query
+RESULTS_LIMIT = 1000  # портал не отдает больше RESULTS_LIMIT закупок по одному поисковому запросу
+
 
 def search_query(search_string: str,
                  start_date: str,
@@ -53,20 +65,204 @@ def search_query(search_string: str,
     return query
 
 
-def get_hrefs(response: requests.models.Response) -> list:
+def get_hrefs(response: requests.models.Response, parser=None) -> list:
     """Функция ищет ссылки на закупки на странице поиска
 
     :param response: requests.models.Response -- ответ сервера
+    :param parser: str -- 'lxml' или 'bs4', по умолчанию parsers.PARSER
     :return: list -- список со сслыками
     """
-    soup = get_soup(response)
-    hrefs = []
-    cards = soup.find_all('div', {'class': 'row no-gutters registry-entry__form mr-0'})
+    if (parser or parsers.PARSER) == 'lxml':
+        try:
+            return parsers.get_hrefs(response.content)
+        except (etree.LxmlError, ValueError) as e:
+            msg = f'Fast path failed for search page, falling back to BeautifulSoup. {e}'
+            logging.warning(logger(msg))
+    return [get_search_href(card) for card in get_search_cards(get_soup(response))]
+
+
+def get_search_cards(soup: BeautifulSoup) -> list:
+    """Функция ищет блоки закупок на странице поиска
+
+    :param soup: BeautifulSoup -- страница поиска
+    :return: list -- список блоков закупок, объектов BeautifulSoup
+    """
+    return soup.find_all('div', {'class': 'row no-gutters registry-entry__form mr-0'})
+
+
+def get_search_href(card) -> str:
+    """Функция возвращает ссылку на закупку из блока закупки на странице поиска
+
+    :param card: -- объект BeautifulSoup, блок закупки на странице поиска
+    :return: str -- ссылка на закупку
+    """
+    return card.find('div', {'class': 'registry-entry__header-mid__number'}) \
+        .find('a') \
+        .get('href')
+
+
+def get_total(soup: BeautifulSoup):
+    """Функция находит общее число найденных закупок на странице поиска
+
+    :param soup: BeautifulSoup -- страница поиска
+    :return: int -- число закупок, RESULTS_LIMIT + 1, если портал пишет "более ...",
+                    None, если число не найдено
+    """
+    total = soup.find('div', {'class': 'search-results__total'})
+    if total is None:
+        return None
+    text = total.text.replace('\xa0', ' ')
+    if 'более' in text:
+        return RESULTS_LIMIT + 1
+    digits = re.sub(r'\D', '', text)
+    return int(digits) if digits else None
+
+
+def iter_search_pages(search_string: str,
+                      start_date: str,
+                      end_date: str,
+                      search_filter='Дате размещения',
+                      ):
+    """Генератор страниц поиска по всем номерам страниц
+    Если закупок за период больше RESULTS_LIMIT, период publishDateFrom/publishDateTo
+    делится пополам, пока каждое окно не уложится в лимит.
+    Следующая страница запрашивается в фоне, пока обрабатывается текущая
+
+    :param search_string: str -- поисковый запрос
+    :param start_date: str -- дата начала фильтрации закупок, формат даты 01.01.2012
+    :param end_date: str -- дата окончания закупок, формат даты 01.01.2012
+    :param search_filter: str -- тип сортировки, по умолчанию по дате размещения
+    :return: BeautifulSoup -- страница поиска
+    """
+    start = datetime.strptime(start_date, '%d.%m.%Y')
+    end = datetime.strptime(end_date, '%d.%m.%Y')
+
+    def fetch(date_from, date_to, page_number):
+        return get_soup(get_request(search_query(search_string,
+                                                 date_from.strftime('%d.%m.%Y'),
+                                                 date_to.strftime('%d.%m.%Y'),
+                                                 search_filter=search_filter,
+                                                 page_number=page_number)))
+
+    def iter_window(date_from, date_to):
+        soup = fetch(date_from, date_to, 1)
+        total = get_total(soup)
+        if total is not None and total > RESULTS_LIMIT:
+            if date_from < date_to:
+                middle = date_from + (date_to - date_from) / 2
+                middle = datetime(middle.year, middle.month, middle.day)
+                msg = f'Search window {date_from:%d.%m.%Y}-{date_to:%d.%m.%Y} exceeds {RESULTS_LIMIT} results, ' \
+                      f'splitting at {middle:%d.%m.%Y}'
+                logging.info(logger(msg))
+                yield from iter_window(date_from, middle)
+                yield from iter_window(middle + timedelta(days=1), date_to)
+                return
+            msg = f'Search window {date_from:%d.%m.%Y} exceeds {RESULTS_LIMIT} results and cannot be split'
+            logging.warning(logger(msg))
+
+        page_number = 1
+        while True:
+            size = len(get_search_cards(soup))
+            last = size < RECORDS_PER_PAGE or \
+                (total is not None and page_number * RECORDS_PER_PAGE >= min(total, RESULTS_LIMIT))
+            next_page = None if last else executor.submit(fetch, date_from, date_to, page_number + 1)
+            if size:
+                yield soup
+            if next_page is None:
+                return
+            soup = next_page.result()
+            page_number += 1
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield from iter_window(start, end)
+
+
+def iter_cards(search_string: str,
+               start_date: str,
+               end_date: str,
+               search_filter='Дате размещения',
+               ):
+    """Генератор блоков закупок по всем страницам поиска, см. iter_search_pages
+
+    :param search_string: str -- поисковый запрос
+    :param start_date: str -- дата начала фильтрации закупок, формат даты 01.01.2012
+    :param end_date: str -- дата окончания закупок, формат даты 01.01.2012
+    :param search_filter: str -- тип сортировки, по умолчанию по дате размещения
+    :return: -- объект BeautifulSoup, блок закупки на странице поиска
+    """
+    for soup in iter_search_pages(search_string, start_date, end_date, search_filter):
+        yield from get_search_cards(soup)
+
+
+def iter_hrefs(search_string: str,
+               start_date: str,
+               end_date: str,
+               search_filter='Дате размещения',
+               ):
+    """Генератор ссылок на закупки по всем страницам поиска, см. iter_search_pages
+
+    Использование:
+        >>> for href in iter_hrefs('кабель', '01.01.2020', '30.06.2020'):
+        >>>     print(href)
+
+    :param search_string: str -- поисковый запрос
+    :param start_date: str -- дата начала фильтрации закупок, формат даты 01.01.2012
+    :param end_date: str -- дата окончания закупок, формат даты 01.01.2012
+    :param search_filter: str -- тип сортировки, по умолчанию по дате размещения
+    :return: str -- ссылка на закупку
+    """
+    for card in iter_cards(search_string, start_date, end_date, search_filter):
+        yield get_search_href(card)
+
+
+def get_publish_date(card) -> str:
+    """Функция находит дату размещения в блоке закупки на странице поиска
+
+    :param card: -- объект BeautifulSoup, блок закупки на странице поиска
+    :return: str -- дата размещения в формате Год-Месяц-День или '', если дата не найдена
+    """
+    for title in card.find_all('div', {'class': 'data-block__title'}):
+        if title.text.strip() == 'Размещено':
+            value = title.find_next('div', {'class': 'data-block__value'})
+            if value is not None:
+                return date_formatter(value.text.strip())
+    return ''
+
+
+def filter_seen(cards, seen: SeenIndex):
+    """Генератор пропускает закупки, которые уже обработаны и не изменились с прошлого запуска
+    Проверка выполняется по блоку закупки на странице поиска, до запроса страниц закупки
+
+    Использование:
+        >>> seen = SeenIndex('../../../data/seen.sqlite')
+        >>> for card in filter_seen(iter_cards('кабель', '01.06.2020', '30.06.2020'), seen):
+        >>>     card_data = get_card_data(card)
+        >>>     mark_seen(seen, card, card_data)
+
+    :param cards: -- блоки закупок на странице поиска, объекты BeautifulSoup
+    :param seen: SeenIndex -- индекс обработанных закупок
+    :return: -- объект BeautifulSoup, новый или изменившийся блок закупки
+    """
+    skipped = 0
     for card in cards:
-        hrefs.append(card.find('div', {'class': 'registry-entry__header-mid__number'})
-                     .find('a')
-                     .get('href'))
-    return hrefs
+        reg_number = get_id(card, Commentator())
+        if reg_number and not seen.is_new(reg_number, fingerprint(card.text)):
+            skipped += 1
+            continue
+        yield card
+    msg = f'{skipped} unchanged purchases skipped'
+    logging.info(logger(msg))
+
+
+def mark_seen(seen: SeenIndex, card, card_data: dict):
+    """Функция записывает обработанную закупку в индекс
+
+    :param seen: SeenIndex -- индекс обработанных закупок
+    :param card: -- объект BeautifulSoup, блок закупки на странице поиска
+    :param card_data: dict -- карточка закупки
+    """
+    if card_data['id']:
+        seen.add(card_data['id'], card_data['init_date'] or get_publish_date(card), fingerprint(card.text))
 
 
 def get_soup(response: requests.models.Response) -> BeautifulSoup:
@@ -79,40 +275,85 @@ def get_soup(response: requests.models.Response) -> BeautifulSoup:
     return BeautifulSoup(html, 'lxml')
 
 
+def to_bytes(html) -> bytes:
+    """Функция приводит HTML-страницу к bytes для lxml
+
+    :param html: -- HTML-страница, str или bytes
+    :return: bytes -- HTML-страница
+    """
+    return html.encode('utf-8') if isinstance(html, str) else html
+
+
+def parse_common_info(html, parser=None) -> LabelIndex:
+    """Функция строит индекс подписей страницы общей информации о закупке
+    Быстрый путь -- lxml с предкомпилированными XPath, при его ошибке используется BeautifulSoup
+
+    :param html: -- HTML-страница, str или bytes
+    :param parser: str -- 'lxml' или 'bs4', по умолчанию parsers.PARSER
+    :return: объект LabelIndex
+    """
+    if (parser or parsers.PARSER) == 'lxml':
+        try:
+            index = parsers.get_label_index(to_bytes(html))
+            if index.tds or index.sections or index.main_info:
+                return index
+        except (etree.LxmlError, ValueError) as e:
+            msg = f'Fast path failed for common-info page, falling back to BeautifulSoup. {e}'
+            logging.warning(logger(msg))
+    return LabelIndex(BeautifulSoup(html, 'lxml'))
+
+
+def parse_documents(html, parser=None) -> str:
+    """Функция возвращает ссылки на документы со страницы документов закупки
+    Быстрый путь -- lxml с предкомпилированными XPath, при его ошибке используется BeautifulSoup
+
+    :param html: -- HTML-страница, str или bytes
+    :param parser: str -- 'lxml' или 'bs4', по умолчанию parsers.PARSER
+    :return: str -- ссылки на документы
+    """
+    if (parser or parsers.PARSER) == 'lxml':
+        try:
+            docs = parsers.get_docs_hrefs(to_bytes(html))
+            if docs is not None:
+                return docs
+        except (etree.LxmlError, ValueError) as e:
+            msg = f'Fast path failed for documents page, falling back to BeautifulSoup. {e}'
+            logging.warning(logger(msg))
+    soup = BeautifulSoup(html, 'lxml')
+    try:
+        return get_docs_hrefs223(soup)
+    except AttributeError:
+        return get_docs_hrefs44(soup)
+
+
+def compare_parsers(common_html=None, docs_html=None) -> dict:
+    """Функция разбирает одни и те же страницы обоими парсерами и возвращает расхождения
+
+    :param common_html: -- HTML-страница общей информации о закупке
+    :param docs_html: -- HTML-страница документов закупки
+    :return: dict -- словарь {поле: (значение lxml, значение bs4)} только для различающихся полей
+    """
+    results = {}
+    for parser in parsers.PARSERS:
+        card_data = create_card()
+        if common_html is not None:
+            fill_common_info(parse_common_info(common_html, parser), card_data, Commentator())
+        if docs_html is not None:
+            try:
+                card_data['docs'] = parse_documents(docs_html, parser)
+            except AttributeError:
+                pass
+        results[parser] = card_data
+    fast, slow = (results[parser] for parser in parsers.PARSERS)
+    return {key: (fast[key], slow[key]) for key in fast if repr(fast[key]) != repr(slow[key])}
+
+
 def create_card() -> dict:
     """Функция создает карточку закупки
 
     :return: dict -- словарь с данными карточки
     """
-    return dict.fromkeys([
-        'id',  # Реестровый номер извещения
-        'law',  # Федеральный закон
-        'type',  # Способ размещения закупки
-        'description',  # Наименование закупки
-        'init_date',  # Дата размещения извещения
-        'platform',  # Наименование электронной площадки
-        'platform_url',  # Адрес электронной площадки
-        'author_name',  # Наименование организации
-        'author_inn',  # ИНН
-        'author_ogrn',  # ОГРН
-        'address',  # Место нахождения
-        'author_manager',  # Контактное лицо
-        'author_email',  # Электронная почта
-        'author_phone',  # Телефон
-        'start_date',  # Дата начала срока подачи заявок
-        'end_date',  # Дата и время окончания подачи заявок(по местному времени заказчика)
-        'timezone',  # Часовой пояс заказчика
-        'result_date',  # Дата подведения итогов
-        'price',  # Начальная (максимальная) цена договора
-        'tender_deposit',  # Обеспечение заявки
-        'contract_deposit',  # Обеспечение контракта
-        'warranty_deposit',  # Обеспечение гарантийных обязательств
-        'costs',  # Себестоимость контракта
-        'url',  # URL-закупки на ЕИС в сфере закупок
-        'docs',  # URL-ссылка на документацию
-        'comment',  # Комментарий к сделке
-        'time',  # Дата записи карточки в формате unicode
-    ])
+    return dict.fromkeys(CARD_FIELDS)
 
 
 def get_id(soup: BeautifulSoup, comment: Commentator) -> int:
@@ -203,22 +444,19 @@ def get_type(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит способ размещения закупки
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Способ размещения закупки
     """
+    index = label_index(soup)
     result = ''
     # TODO: если новая структура HTML-страницы станет преимущественной, то блоки try – поменять местами
     try:
-        result = soup.find('td', text='Способ размещения закупки') \
-            .find_next('td') \
-            .text \
+        result = index.td('Способ размещения закупки') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Способ определения поставщика (подрядчика, исполнителя)') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text
+            result = index.section('Способ определения поставщика (подрядчика, исполнителя)') \
+                .strip()
         except AttributeError:
             msg = 'Data for the field "type" could not be found'
             logging.error(logger(msg))
@@ -230,20 +468,17 @@ def get_description(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит наименование закупки
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Наименование закупки
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Наименование закупки') \
-            .find_next('td') \
-            .text \
+        result = index.td('Наименование закупки') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'cardMainInfo__title'}, text='Объект закупки') \
-                .find_next('span', {'class': 'cardMainInfo__content'}) \
-                .text \
+            result = index.card_main_info('Объект закупки') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "description" could not be found'
@@ -256,23 +491,19 @@ def get_init_date(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит дату размещения извещения
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Дата размещения извещения
 
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = date_formatter(soup.find('td', text='Дата размещения извещения')
-                                .find_next('td')
-                                .text
+        result = date_formatter(index.td('Дата размещения извещения')
                                 .split()[0]
                                 .strip())
     except AttributeError:
         try:
-            result = datetime_formatter(soup.find('span', {'class': 'cardMainInfo__title'},
-                                                  text='Размещено в ЕИС')
-                                        .find_next('span', {'class': 'cardMainInfo__content'})
-                                        .text
+            result = datetime_formatter(index.card_main_info('Размещено в ЕИС')
                                         .strip())
         except AttributeError:
             msg = 'Data for the field "init_date" could not be found'
@@ -285,23 +516,19 @@ def get_platform(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит наименование электронной площадки
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Наименование электронной площадки
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Наименование электронной площадки в ' +
-                                      'информационно-телекоммуникационной сети «Интернет»') \
-            .find_next('td') \
-            .text \
+        result = index.td('Наименование электронной площадки в ' +
+                          'информационно-телекоммуникационной сети «Интернет»') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Наименование электронной площадки в ' +
-                                    'информационно-телекоммуникационной сети "Интернет"') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Наименование электронной площадки в ' +
+                                   'информационно-телекоммуникационной сети "Интернет"') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "platform" could not be found'
@@ -314,25 +541,21 @@ def get_platform_url(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит адрес электронной площадки
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Адрес электронной площадки
 
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Адрес электронной площадки в ' +
-                                      'информационно-телекоммуникационной сети ' +
-                                      '«Интернет»') \
-            .find_next('td') \
-            .text \
+        result = index.td('Адрес электронной площадки в ' +
+                          'информационно-телекоммуникационной сети ' +
+                          '«Интернет»') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Адрес электронной площадки в ' +
-                                    'информационно-телекоммуникационной сети "Интернет"') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Адрес электронной площадки в ' +
+                                   'информационно-телекоммуникационной сети "Интернет"') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "platform_url" could not be found'
@@ -345,14 +568,13 @@ def get_tender_deposit(soup: BeautifulSoup, comment: Commentator):
     """Функция находит обеспечение заявки
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Обеспечение заявки
     """
+    index = label_index(soup)
     result = None
     try:
-        response = soup.find('td', text='Обеспечение заявки') \
-            .find_next('td') \
-            .text \
+        response = index.td('Обеспечение заявки') \
             .strip()
         if response == 'Не требуется':
             result = 0.0
@@ -365,10 +587,7 @@ def get_tender_deposit(soup: BeautifulSoup, comment: Commentator):
                 logging.error(logger(msg))
     except AttributeError:
         try:
-            result = to_numeric(''.join(soup.find('span', {'class': 'section__title'},
-                                                  text='Размер обеспечения заявки')
-                                        .find_next('span', {'class': 'section__info'})
-                                        .text
+            result = to_numeric(''.join(index.section('Размер обеспечения заявки')
                                         .split('\xa0')[:-1])
                                 .strip())
         except AttributeError:
@@ -383,15 +602,13 @@ def get_contract_deposit(soup: BeautifulSoup, price: float, comment: Commentator
 
     :param comment: -- объект Commentator
     :param price: -- цена котракта
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Обеспечение контракта
     """
+    index = label_index(soup)
     result = 0.0
     try:
-        raw_data = ''.join(soup.find('span', {'class': 'section__title'},
-                                     text='Размер обеспечения исполнения контракта')
-                           .find_next('span', {'class': 'section__info'})
-                           .text
+        raw_data = ''.join(index.section('Размер обеспечения исполнения контракта')
                            .split()[0]) \
             .strip()
         contract_deposit = to_numeric(raw_data)
@@ -410,15 +627,13 @@ def get_warranty_deposit(soup: BeautifulSoup, price: float, comment: Commentator
 
     :param comment: -- объект Commentator
     :param price: -- цена котракта
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Обеспечение гарантийных обязательств
     """
+    index = label_index(soup)
     result = 0.0
     try:
-        warranty_deposit = to_numeric(''.join(soup.find('span', {'class': 'section__title'},
-                                                        text='Размер обеспечения гарантийных обязательств')
-                                              .find_next('span', {'class': 'section__info'})
-                                              .text
+        warranty_deposit = to_numeric(''.join(index.section('Размер обеспечения гарантийных обязательств')
                                               .split('\xa0')[:-1])
                                       .strip())
         if warranty_deposit < 1:
@@ -435,21 +650,17 @@ def get_author_name(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит наименование организации
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Наименование организации
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Наименование организации') \
-            .find_next('td') \
-            .text \
+        result = index.td('Наименование организации') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Организация, осуществляющая размещение') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Организация, осуществляющая размещение') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "author_name" could not be found'
@@ -462,14 +673,13 @@ def get_author_inn(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит ИНН
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: ИНН
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='ИНН') \
-            .find_next('td') \
-            .text \
+        result = index.td('ИНН') \
             .strip()
     except AttributeError:
         msg = 'Data for the field "inn" could not be found'
@@ -482,14 +692,13 @@ def get_author_ogrn(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит ОГРН
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: ОГРН
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='ОГРН') \
-            .find_next('td') \
-            .text \
+        result = index.td('ОГРН') \
             .strip()
     except AttributeError:
         msg = 'Data for the field "author_ogrn" could not be found'
@@ -502,21 +711,17 @@ def get_address(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит адрес место нахождения
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Место нахождения
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Место нахождения') \
-            .find_next('td') \
-            .text \
+        result = index.td('Место нахождения') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Почтовый адрес') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Почтовый адрес') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "address" could not be found'
@@ -529,21 +734,17 @@ def get_author_manager(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит контактное лицо
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Контактное лицо
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Контактное лицо') \
-            .find_next('td') \
-            .text \
+        result = index.td('Контактное лицо') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Ответственное должностное лицо') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Ответственное должностное лицо') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "author_manager" could not be found'
@@ -556,21 +757,17 @@ def get_author_email(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит электронную почту
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Электронная почта
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Электронная почта') \
-            .find_next('td') \
-            .text \
+        result = index.td('Электронная почта') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Адрес электронной почты') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Адрес электронной почты') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "author_email" could not be found'
@@ -583,21 +780,17 @@ def get_author_phone(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит телефон
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Телефон
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Телефон') \
-            .find_next('td') \
-            .text \
+        result = index.td('Телефон') \
             .strip()
     except AttributeError:
         try:
-            result = soup.find('span', {'class': 'section__title'},
-                               text='Номер контактного телефона') \
-                .find_next('span', {'class': 'section__info'}) \
-                .text \
+            result = index.section('Номер контактного телефона') \
                 .strip()
         except AttributeError:
             msg = 'Data for the field "author_phone" could not be found'
@@ -610,23 +803,18 @@ def get_start_date(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит дату начала срока подачи заявок
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Дата начала срока подачи заявок
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = date_formatter(soup
-                                .find('td', text='Дата начала срока подачи заявок')
-                                .find_next('td')
-                                .text
+        result = date_formatter(index.td('Дата начала срока подачи заявок')
                                 .split()[0]
                                 .strip())
     except AttributeError:
         try:
-            result = datetime_formatter(soup.find('span', {'class': 'section__title'},
-                                                  text='Дата и время начала срока подачи заявок')
-                                        .find_next('span', {'class': 'section__info'})
-                                        .text
+            result = datetime_formatter(index.section('Дата и время начала срока подачи заявок')
                                         .strip())
         except AttributeError:
             msg = 'Data for the field "start_date" could not be found'
@@ -639,23 +827,18 @@ def get_end_date(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит дату и время окончания подачи заявок(по местному времени заказчика)
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Дата и время окончания подачи заявок(по местному времени заказчика)
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = date_formatter(soup
-                                .find('span', text='(по местному времени заказчика)')
-                                .find_next('td')
-                                .text
+        result = date_formatter(index.span_td('(по местному времени заказчика)')
                                 .split()[0]
                                 .strip())
     except AttributeError:
         try:
-            result = datetime_formatter(soup.find('span', {'class': 'section__title'},
-                                                  text='Дата и время окончания срока подачи заявок')
-                                        .find_next('span', {'class': 'section__info'})
-                                        .text
+            result = datetime_formatter(index.section('Дата и время окончания срока подачи заявок')
                                         .strip())
         except AttributeError:
             msg = 'Data for the field "end_date" could not be found'
@@ -668,14 +851,13 @@ def get_timezone(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит часовой пояс заказчика
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Часовой пояс заказчика
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = soup.find('td', text='Дата начала срока подачи заявок') \
-            .find_next('td') \
-            .text \
+        result = index.td('Дата начала срока подачи заявок') \
             .split()[1] \
             .replace('(', '') \
             .replace(')', '') \
@@ -691,25 +873,18 @@ def get_result_date(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит дату подведения итогов
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Дата подведения итогов
     """
+    index = label_index(soup)
     result = ''
     try:
-        result = date_formatter(soup
-                                .find('td', text='Дата подведения итогов')
-                                .find_next('td')
-                                .text
+        result = date_formatter(index.td('Дата подведения итогов')
                                 .split()[0]
                                 .strip())
     except AttributeError:
         try:
-            result = datetime_formatter(soup.find('span', {'class': 'section__title'},
-                                                  text="""
-                            Дата и время рассмотрения и оценки первых частей заявок
-                        """)
-                                        .find_next('span', {'class': 'section__info'})
-                                        .text
+            result = datetime_formatter(index.section('Дата и время рассмотрения и оценки первых частей заявок')
                                         .strip())
         except AttributeError:
             msg = 'Data for the field "result_date" could not be found'
@@ -723,29 +898,24 @@ def get_comment(soup: BeautifulSoup, comment: Commentator) -> str:
     """Функция находит преимущества, требования к участникам
 
     :param comment: -- объект Commentator
-    :param soup: -- объект BeautifulSoup
+    :param soup: -- объект BeautifulSoup или LabelIndex
     :return: Преимущества, требования к участникам
     """
+    index = label_index(soup)
     result = ''
     _result = ''
     try:
         result += '\nПреимущества:\n\n'
-        result += soup.find('span', {'class': 'section__title'}, text='Преимущества') \
-                      .find_next('span', {'class': 'section__info'}) \
-                      .text \
-                      .strip() + '\n'
+        result += index.section('Преимущества') \
+            .strip() + '\n'
         result += '\nТребования к участникам:\n\n'
-        result += soup.find('span', {'class': 'section__title'}, text='Требования к участникам') \
-            .find_next('span', {'class': 'section__info'}) \
-            .text \
+        result += index.section('Требования к участникам') \
             .strip() \
             .replace('\n', '') \
             .replace('\t', '') \
             .replace('\xa0', ' ') + '\n'
         result += '\nОграничения и запреты:\n\n'
-        result += soup.find('span', {'class': 'section__title'}, text='Ограничения и запреты') \
-            .find_next('span', {'class': 'section__info'}) \
-            .text \
+        result += index.section('Ограничения и запреты') \
             .strip() \
             .replace('\n', '') \
             .replace('\t', '') \
@@ -758,6 +928,90 @@ def get_comment(soup: BeautifulSoup, comment: Commentator) -> str:
     return _result
 
 
+def fill_search_data(card, card_data: dict, comment: Commentator) -> dict:
+    """Функция записывает в карточку данные из блока закупки на странице поиска
+
+    :param card: -- объект BeautifulSoup, блок закупки на странице поиска
+    :param card_data: dict -- карточка закупки
+    :param comment: -- объект Commentator
+    :return: dict -- карточка закупки
+    """
+    card_data['id'] = get_id(card, comment)  # 'id', Реестровый номер извещения
+    card_data['law'] = get_law(card, comment)  # 'law', Федеральный закон
+    card_data['url'] = get_url(card, comment)  # 'url', URL-закупки на ЕИС в сфере закупок
+    card_data['price'] = get_price(card, comment)  # 'price', Начальная (максимальная) цена договора
+    return card_data
+
+
+def fill_common_info(soup: BeautifulSoup, card_data: dict, comment: Commentator) -> dict:
+    """Функция записывает в карточку данные со страницы общей информации о закупке
+
+    :param soup: -- объект BeautifulSoup или LabelIndex, страница общей информации о закупке
+    :param card_data: dict -- карточка закупки
+    :param comment: -- объект Commentator
+    :return: dict -- карточка закупки
+    """
+    index = label_index(soup)  # страница индексируется один раз для всех полей
+    card_data['type'] = get_type(index, comment)  # 'type', Способ размещения закупки
+    card_data['description'] = get_description(index, comment)  # 'description', Наименование закупки
+    card_data['init_date'] = get_init_date(index, comment)  # 'init_date', Дата размещения извещения
+    card_data['platform'] = get_platform(index, comment)  # 'platform', Наименование электронной площадки
+    card_data['platform_url'] = get_platform_url(index, comment)  # 'platform_url', Адрес электронной площадки
+    card_data['tender_deposit'] = get_tender_deposit(index, comment)  # 'tender_deposit', Обеспечение заявки
+    card_data['contract_deposit'] = get_contract_deposit(index, card_data[
+        'price'], comment)  # 'contract_deposit', Обеспечение контракта
+    card_data['warranty_deposit'] = get_warranty_deposit(index, card_data[
+        'price'], comment)  # 'warranty_deposit', Обеспечение гарантийных обязательств
+    card_data['author_name'] = get_author_name(index, comment)  # 'author_name', Наименование организации
+    card_data['author_inn'] = get_author_inn(index, comment)  # 'author_inn', ИНН
+    card_data['author_ogrn'] = get_author_ogrn(index, comment)  # 'author_ogrn', ОГРН
+    card_data['address'] = get_address(index, comment)  # 'address', Место нахождения
+    card_data['author_manager'] = get_author_manager(index, comment)  # 'author_manager', Контактное лицо
+    card_data['author_email'] = get_author_email(index, comment)  # 'author_email', Электронная почта
+    card_data['author_phone'] = get_author_phone(index, comment)  # 'author_phone', Телефон
+    card_data['start_date'] = get_start_date(index, comment)  # 'start_date', Дата начала срока подачи заявок
+    card_data['end_date'] = get_end_date(
+        index, comment)  # 'end_date', Дата и время окончания подачи заявок(по местному времени заказчика)
+    card_data['timezone'] = get_timezone(index, comment)  # 'timezone', Часовой пояс заказчика
+    card_data['result_date'] = get_result_date(index, comment)  # 'result_date', Дата подведения итогов
+    comment.write(get_comment(index, comment))  # 'comment',  # Комментарий к сделке
+    return card_data
+
+
+def fill_pages(card_data: dict, comment: Commentator, common_html, docs_html) -> dict:
+    """Функция дописывает карточку по уже загруженным страницам общей информации и документов закупки
+
+    :param card_data: dict -- карточка закупки с данными из блока на странице поиска
+    :param comment: -- объект Commentator
+    :param common_html: -- HTML-страница общей информации о закупке, None, если страница не получена
+    :param docs_html: -- HTML-страница документов закупки, None, если страница не получена
+    :return: dict -- карточка закупки
+    """
+    if common_html is not None:
+        msg = f'Card {card_data["url"]} starts recording by url'
+        logging.info(logger(msg))
+        fill_common_info(parse_common_info(common_html), card_data, comment)
+    else:
+        msg = f'Failed to make an entry from the purchasing {card_data["url"]}'
+        logging.error(logger(msg))
+
+    docs = None
+    if docs_html is not None:
+        try:
+            docs = parse_documents(docs_html)
+        except AttributeError:
+            pass
+    if docs is not None:
+        card_data['docs'] = docs
+    else:
+        msg = f'Data for the field "docs" could not be found by url'
+        logging.error(logger(msg))
+        comment.write('\t• ссылки на документы;')
+
+    card_data['comment'] = comment.comment  # 'comment',  # Комментарий к сделке
+    return card_data
+
+
 # TODO: 30 мая 2020 года изменилась структура сайта!!!
 def get_card_data(card=None) -> dict:
     """Функция парсит информацию о закупке и записывает с структурированный словарь
@@ -772,41 +1026,15 @@ def get_card_data(card=None) -> dict:
     card_data['time'] = time.time()
 
     # пишем данные из карточки закупки
-    card_data['id'] = get_id(card, comment)  # 'id', Реестровый номер извещения
-    card_data['law'] = get_law(card, comment)  # 'law', Федеральный закон
-    card_data['url'] = get_url(card, comment)  # 'url', URL-закупки на ЕИС в сфере закупок
-    card_data['price'] = get_price(card, comment)  # 'price', Начальная (максимальная) цена договора
+    fill_search_data(card, card_data, comment)
 
     # пишем данные из по ссылке закупки, для 44-ФЗ и 223-ФЗ представление страницы с данными различается
     try:
         lot_url = card_data['url']
-        soup: BeautifulSoup = get_soup(get_request(lot_url))
+        index = parse_common_info(get_request(lot_url).content)
         msg = f'Card #{hash(card)} starts recording by url'
         logging.info(logger(msg))
-
-        card_data['type'] = get_type(soup, comment)  # 'type', Способ размещения закупки
-        card_data['description'] = get_description(soup, comment)  # 'description', Наименование закупки
-        card_data['init_date'] = get_init_date(soup, comment)  # 'init_date', Дата размещения извещения
-        card_data['platform'] = get_platform(soup, comment)  # 'platform', Наименование электронной площадки
-        card_data['platform_url'] = get_platform_url(soup, comment)  # 'platform_url', Адрес электронной площадки
-        card_data['tender_deposit'] = get_tender_deposit(soup, comment)  # 'tender_deposit', Обеспечение заявки
-        card_data['contract_deposit'] = get_contract_deposit(soup, card_data[
-            'price'], comment)  # 'contract_deposit', Обеспечение контракта
-        card_data['warranty_deposit'] = get_warranty_deposit(soup, card_data[
-            'price'], comment)  # 'warranty_deposit', Обеспечение гарантийных обязательств
-        card_data['author_name'] = get_author_name(soup, comment)  # 'author_name', Наименование организации
-        card_data['author_inn'] = get_author_inn(soup, comment)  # 'author_inn', ИНН
-        card_data['author_ogrn'] = get_author_ogrn(soup, comment)  # 'author_ogrn', ОГРН
-        card_data['address'] = get_address(soup, comment)  # 'address', Место нахождения
-        card_data['author_manager'] = get_author_manager(soup, comment)  # 'author_manager', Контактное лицо
-        card_data['author_email'] = get_author_email(soup, comment)  # 'author_email', Электронная почта
-        card_data['author_phone'] = get_author_phone(soup, comment)  # 'author_phone', Телефон
-        card_data['start_date'] = get_start_date(soup, comment)  # 'start_date', Дата начала срока подачи заявок
-        card_data['end_date'] = get_end_date(
-            soup, comment)  # 'end_date', Дата и время окончания подачи заявок(по местному времени заказчика)
-        card_data['timezone'] = get_timezone(soup, comment)  # 'timezone', Часовой пояс заказчика
-        card_data['result_date'] = get_result_date(soup, comment)  # 'result_date', Дата подведения итогов
-        comment.write(get_comment(soup, comment))  # 'comment',  # Комментарий к сделке
+        fill_common_info(index, card_data, comment)
     except AttributeError:
         msg = f'Failed to make an entry from the purchasing #{hash(card)}'
         logging.error(logger(msg))
@@ -814,13 +1042,10 @@ def get_card_data(card=None) -> dict:
     # Пишем данные из раздела документы карточки закупки
     try:
         docs_url = make_part_url(card_data['url'])
-        soup = get_soup(get_request(docs_url))
+        html = get_request(docs_url).content
         msg = f'Card #{hash(card)} starts recording by documets url {docs_url}'
         logging.info(logger(msg))
-        try:
-            card_data['docs'] = get_docs_hrefs223(soup)
-        except AttributeError:
-            card_data['docs'] = get_docs_hrefs44(soup)
+        card_data['docs'] = parse_documents(html)
     except AttributeError:
         msg = f'Data for the field "docs" could not be found by url'
         logging.error(logger(msg))
@@ -831,6 +1056,83 @@ def get_card_data(card=None) -> dict:
     return card_data
 
 
+async def fetch_page(url: str, executor: ThreadPoolExecutor):
+    """Функция асинхронно делает GET-запрос по URL в пуле потоков
+
+    :param url: str -- URL-адрес
+    :param executor: ThreadPoolExecutor -- пул потоков для блокирующих запросов
+    :return: ответ сервера, объект requests.models.Response, или None, если запрос не удался
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, get_request, url)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        msg = f'Request to {url} failed. {e}'
+        logging.error(logger(msg))
+        return None
+
+
+async def get_card_data_async(card, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor) -> dict:
+    """Функция асинхронно парсит информацию о закупке,
+       страницы общей информации и документов запрашиваются параллельно
+
+    :param card: -- объект BeautifulSoup
+    :param semaphore: asyncio.Semaphore -- ограничитель числа одновременно обрабатываемых закупок
+    :param executor: ThreadPoolExecutor -- пул потоков для блокирующих запросов
+    :return: -- словарь со структуированной информацией о закупке, как у get_card_data
+    """
+    comment = Commentator()
+    card_data = create_card()
+    msg = f'Card #{hash(card)} starts recording'
+    logging.info(logger(msg))
+    card_data['time'] = time.time()
+
+    fill_search_data(card, card_data, comment)
+
+    try:
+        docs_url = make_part_url(card_data['url'])
+    except ValueError:
+        docs_url = None
+
+    async with semaphore:
+        if docs_url is None:
+            common_response, docs_response = await fetch_page(card_data['url'], executor), None
+        else:
+            common_response, docs_response = await asyncio.gather(fetch_page(card_data['url'], executor),
+                                                                  fetch_page(docs_url, executor))
+
+    common_html = common_response.content if common_response is not None else None
+    docs_html = docs_response.content if docs_response is not None else None
+    return fill_pages(card_data, comment, common_html, docs_html)
+
+
+async def gather_cards_data(cards, concurrency=10) -> list:
+    """Функция асинхронно парсит список закупок
+
+    :param cards: -- список объектов BeautifulSoup, блоков закупок на странице поиска
+    :param concurrency: int -- максимальное число одновременно обрабатываемых закупок, по умолчанию 10
+    :return: list -- список карточек закупок в порядке следования cards
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=2 * concurrency) as executor:
+        return await asyncio.gather(*(get_card_data_async(card, semaphore, executor) for card in cards))
+
+
+def get_cards_data(cards, concurrency=10) -> list:
+    """Функция парсит список закупок в асинхронном режиме
+
+    Использование:
+        >>> cards = get_soup(get_request(search_query('кабель', '01.06.2020', '30.06.2020'))) \\
+        >>>     .find_all('div', {'class': 'row no-gutters registry-entry__form mr-0'})
+        >>> cards_data = get_cards_data(cards, concurrency=20)
+
+    :param cards: -- список объектов BeautifulSoup, блоков закупок на странице поиска
+    :param concurrency: int -- максимальное число одновременно обрабатываемых закупок, по умолчанию 10
+    :return: list -- список карточек закупок в порядке следования cards
+    """
+    return asyncio.run(gather_cards_data(cards, concurrency))
+
+
 def make_part_url(common_url, part='documents') -> str:
     """Функция создает ссылку на другие разделы карточки закупки из общей ссылки,
        по умолчанию на раздел документы
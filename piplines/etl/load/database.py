@@ -1,20 +1,98 @@
+import io
+import math
+import time
+import queue
+import threading
 import yaml
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, MetaData, Table, Column, BigInteger, Float, Text, DateTime
 from sqlalchemy.exc import OperationalError
 from datetime import datetime
+import numpy as np
+from piplines.etl.transform.card import CARD_FIELDS, NUMERIC_FIELDS, DATE_FIELDS
+from piplines.etl.transform.converter import parse_datetime
 import logging
 
 logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
 
+METADATA = MetaData()
+
+# таблица карточек закупок, столбцы совпадают с zakupki.create_card
+TENDERS = Table('tenders', METADATA,
+                *[Column(field, BigInteger, primary_key=True) if field == 'id' else
+                  Column(field, Float) if field in NUMERIC_FIELDS else
+                  Column(field, DateTime) if field in DATE_FIELDS else
+                  Column(field, Text)
+                  for field in CARD_FIELDS])
+
+
+def to_datetime(value):
+    """Функция преобразует дату карточки в datetime для столбца DateTime
+
+    :param value: -- дата: datetime или строка вида 'dd.mm.yyyy', 'dd.mm.yyyy в HH:MM'
+    :return: datetime или None, если дата не указана или не разбирается (например 'Не указано')
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    date = parse_datetime(value)
+    return None if np.isnat(date) else date.item()
+
+
+def card_row(card: dict) -> tuple:
+    """Функция преобразует карточку закупки в строку таблицы tenders
+
+    :param card: dict -- карточка закупки
+    :return: tuple -- значения в порядке CARD_FIELDS, nan, пустые и непреобразуемые даты заменяются на None
+    """
+    row = []
+    for field in CARD_FIELDS:
+        value = card.get(field)
+        if field in NUMERIC_FIELDS:
+            if not isinstance(value, (int, float)) or math.isnan(value):
+                value = None
+        elif field in DATE_FIELDS:
+            # одна строка вроде 'Не указано' в столбце DateTime отклоняет весь COPY пачки
+            value = to_datetime(value)
+        row.append(value)
+    return tuple(row)
+
+
+def copy_value(value) -> str:
+    """Функция кодирует значение для COPY ... FROM STDIN в текстовом формате PostgreSQL
+
+    :param value: -- значение поля
+    :return: str -- закодированное значение, NULL -- \\N
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
 
 class DataBase(object):
     """Класс создает подключение к базе данных
 
     Атрибуты:
     :param engine: объект sqlalchemy.engine.base.Engine -- движок подключения к БД
+    :param batch_size: int -- число карточек в одной пачке загрузки, по умолчанию 5000
+    :param pool_size: int -- число постоянных соединений в пуле PostgreSQL, по умолчанию 5
+    :param max_overflow: int -- число дополнительных соединений сверх pool_size, по умолчанию 10
+    :param pool_pre_ping: bool -- проверять соединение перед выдачей из пула, по умолчанию True
+
+    В конфигурационном файле может быть указан dialect: sqlite, тогда database -- путь к файлу БД,
+    это удобно для локальной отладки; по умолчанию используется PostgreSQL.
+
+    Использование:
+        >>> db = DataBase('../configs/dbconfig.yaml')
+        >>> db.create_tables()
+        >>> db.load_cards(cards_data)
+        >>> with db.sink(batch_size=1000, flush_interval=5) as sink:
+        >>>     for card_data in iter_cards_data(cards):
+        >>>         sink.put(card_data)
     """
 
-    def __init__(self, path):
+    def __init__(self, path, batch_size=5000, pool_size=5, max_overflow=10, pool_pre_ping=True):
+        self.batch_size = batch_size
 
         def get_db_configs(config_file_path='../configs/dbconfig.yaml'):
             """
@@ -27,11 +105,12 @@ class DataBase(object):
                 configs = yaml.safe_load(f)
 
             return dict(
+                dialect=configs.get('dialect', 'postgresql'),  # postgresql или sqlite
                 database=configs['database'],  # название базы данных
-                user=configs['user'],          # имя пользователя
-                password=configs['password'],  # пароль
-                host=configs['host'],          # адрес сервера
-                port=configs['port']           # порт подключения
+                user=configs.get('user'),          # имя пользователя
+                password=configs.get('password'),  # пароль
+                host=configs.get('host'),          # адрес сервера
+                port=configs.get('port')           # порт подключения
             )
 
         def get_engine(config):
@@ -40,19 +119,220 @@ class DataBase(object):
             :param config: dict -- словарь с конфигурацией
             :return: объект sqlalchemy.engine.base.Engine
             """
+            if config['dialect'] == 'sqlite':
+                return create_engine(f"sqlite:///{config['database']}", pool_pre_ping=pool_pre_ping)
             connection_string = "postgresql://{}:{}@{}:{}/{}".format(config['user'],
                                                                      config['password'],
                                                                      config['host'],
                                                                      config['port'],
                                                                      config['database'])
-            return create_engine(connection_string)
+            return create_engine(connection_string,
+                                 pool_size=pool_size,
+                                 max_overflow=max_overflow,
+                                 pool_pre_ping=pool_pre_ping)
 
         try:
             self.engine = get_engine(get_db_configs(path))
-            msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Connection to PostgreSQL DB {get_db_configs(path)['database']} successful"
+            msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Connection to {self.engine.dialect.name} DB {get_db_configs(path)['database']} successful"
             print(msg)
             logging.info(msg)
         except OperationalError as e:
             msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: The error '{e}' occurred"
             print(msg)
             logging.error(msg)
+
+    def sink(self, batch_size=1000, flush_interval=5.0, maxsize=10000):
+        """Функция запускает фоновую запись карточек в БД, см. BatchWriter
+
+        :param batch_size: int -- размер пачки, по умолчанию 1000
+        :param flush_interval: float -- максимальное время ожидания пачки, сек., по умолчанию 5
+        :param maxsize: int -- емкость очереди, по умолчанию 10000
+        :return: объект BatchWriter
+        """
+        return BatchWriter(self, batch_size=batch_size, flush_interval=flush_interval, maxsize=maxsize)
+
+    def create_tables(self):
+        """Функция создает таблицу tenders, если ее еще нет"""
+        METADATA.create_all(self.engine)
+
+    def load_cards(self, cards, batch_size=None) -> int:
+        """Функция загружает карточки закупок в таблицу tenders пачками:
+        существующие по id записи обновляются (upsert)
+
+        :param cards: -- последовательность карточек закупок, может быть генератором
+        :param batch_size: int -- число карточек в одной пачке, по умолчанию self.batch_size
+        :return: int -- число загруженных карточек
+        """
+        batch_size = batch_size or self.batch_size
+        total = 0
+        batch = []
+        for card in cards:
+            batch.append(card)
+            if len(batch) >= batch_size:
+                total += self.load_batch(batch)
+                batch = []
+        if batch:
+            total += self.load_batch(batch)
+        return total
+
+    def load_batch(self, cards: list) -> int:
+        """Функция загружает одну пачку карточек в одной транзакции
+
+        :param cards: list -- карточки закупок
+        :return: int -- число загруженных карточек
+        """
+        # в одной пачке id должны быть уникальны, иначе ON CONFLICT обновит строку дважды
+        rows = list({row[0]: row for row in map(card_row, cards) if row[0]}.values())
+        if not rows:
+            return 0
+        start = datetime.now()
+        if self.engine.dialect.name == 'postgresql':
+            self.copy_rows(rows)
+        else:
+            self.insert_rows(rows)
+        elapsed = (datetime.now() - start).total_seconds()
+        msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Loaded {len(rows)} cards in {elapsed:.2f} s"
+        logging.info(msg)
+        return len(rows)
+
+    @staticmethod
+    def upsert_sql(source: str) -> str:
+        """Функция формирует INSERT ... ON CONFLICT (id) DO UPDATE для таблицы tenders
+
+        :param source: str -- VALUES (...) или SELECT ... из промежуточной таблицы
+        :return: str -- SQL-запрос
+        """
+        columns = ', '.join(CARD_FIELDS)
+        updates = ', '.join(f'{field} = EXCLUDED.{field}' for field in CARD_FIELDS if field != 'id')
+        return f'INSERT INTO {TENDERS.name} ({columns}) {source} ON CONFLICT (id) DO UPDATE SET {updates}'
+
+    def copy_rows(self, rows: list):
+        """Функция загружает строки в PostgreSQL через COPY FROM STDIN во временную таблицу
+        и переносит их в tenders одним upsert-запросом
+
+        :param rows: list -- строки таблицы tenders
+        """
+        columns = ', '.join(CARD_FIELDS)
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(map(copy_value, row)))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f'CREATE TEMP TABLE tenders_staging (LIKE {TENDERS.name} INCLUDING DEFAULTS) '
+                           'ON COMMIT DROP')
+            cursor.copy_expert(f'COPY tenders_staging ({columns}) FROM STDIN', buffer)
+            cursor.execute(self.upsert_sql(f'SELECT {columns} FROM tenders_staging'))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def insert_rows(self, rows: list):
+        """Функция загружает строки через executemany, используется для SQLite
+
+        :param rows: list -- строки таблицы tenders
+        """
+        placeholders = ', '.join('?' for _ in CARD_FIELDS)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(self.upsert_sql(f'VALUES ({placeholders})'), rows)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+class BatchWriter(object):
+    """Класс пишет карточки в БД в фоновом потоке пачками, чтобы извлечение не ждало коммитов
+    Пачка записывается, когда набрано batch_size карточек, прошло flush_interval секунд
+    или очередь заполнена. Если очередь заполнена, put блокируется (обратное давление),
+    пока фоновый поток не освободит место. close дописывает все накопленные карточки
+
+    Атрибуты:
+    :param database: DataBase -- база данных
+    :param batch_size: int -- размер пачки
+    :param flush_interval: float -- максимальное время ожидания пачки, сек.
+    :param maxsize: int -- емкость очереди
+
+    Использование:
+        >>> with db.sink(batch_size=1000) as sink:
+        >>>     sink.put(card_data)
+    """
+
+    STOP = object()
+
+    def __init__(self, database: DataBase, batch_size=1000, flush_interval=5.0, maxsize=10000):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.written = 0
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='db-sink', daemon=True)
+        self.thread.start()
+
+    def put(self, card: dict, timeout=None):
+        """Функция ставит карточку в очередь записи, блокируется, если очередь заполнена
+
+        :param card: dict -- карточка закупки
+        :param timeout: float -- максимальное время ожидания места в очереди, сек., по умолчанию без ограничения
+        """
+        if self.closed:
+            raise RuntimeError('BatchWriter is closed')
+        if self.error is not None:
+            raise RuntimeError(f'BatchWriter failed: {self.error}') from self.error
+        self.queue.put(card, timeout=timeout)
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                card = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                card = None
+            if card is self.STOP:
+                self.flush(batch)
+                return
+            if card is not None:
+                batch.append(card)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline or self.queue.full():
+                self.flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def flush(self, batch: list):
+        if not batch:
+            return
+        try:
+            self.written += self.database.load_batch(batch)
+        except Exception as e:
+            self.error = e
+            msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Failed to write {len(batch)} cards. {e}"
+            logging.error(msg)
+
+    def close(self):
+        """Функция дописывает накопленные карточки и останавливает фоновый поток"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self.STOP)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f'BatchWriter failed: {self.error}') from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
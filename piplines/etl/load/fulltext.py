@@ -0,0 +1,546 @@
+from threading import Thread, Lock, Event
+import json
+import math
+import mmap
+import os
+import re
+import numpy as np
+from piplines.etl.transform.text import terms, tokenize, stem
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+FIELDS = ('description', 'comment')  # индексируемые поля карточки
+FIELD_GAP = 100  # разрыв позиций между полями, чтобы фраза не склеивалась из конца одного поля и начала другого
+
+EMPTY = (np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+
+def document_terms(card: dict, fields=FIELDS) -> dict:
+    """Функция разбивает текстовые поля карточки на основы слов с позициями
+
+    :param card: dict -- карточка закупки
+    :param fields: tuple -- индексируемые поля
+    :return: dict -- {основа: [позиции]}
+    """
+    positions = {}
+    offset = 0
+    for field in fields:
+        words = terms(card.get(field) or '')
+        for position, term in enumerate(words, offset):
+            positions.setdefault(term, []).append(position)
+        offset += len(words) + FIELD_GAP
+    return positions
+
+
+class MemorySegment(object):
+    """Класс сегмента в памяти: сюда попадают новые карточки до сброса на диск"""
+
+    def __init__(self):
+        self.postings = {}  # {основа: {id: [позиции]}}
+        self.doc_set = set()
+
+    def add(self, doc_id: int, positions: dict):
+        if doc_id in self.doc_set:
+            # повторная карточка заменяет предыдущую версию
+            for term_docs in self.postings.values():
+                term_docs.pop(doc_id, None)
+        self.doc_set.add(doc_id)
+        for term, term_positions in positions.items():
+            self.postings.setdefault(term, {})[doc_id] = term_positions
+
+    def __len__(self):
+        return len(self.doc_set)
+
+    @property
+    def docs(self) -> np.ndarray:
+        return np.array(sorted(self.doc_set), dtype=np.int64)
+
+    def get(self, term: str) -> tuple:
+        """Функция возвращает список вхождений основы, см. Segment.get"""
+        term_docs = self.postings.get(term)
+        if not term_docs:
+            return EMPTY
+        docs = sorted(term_docs)
+        lengths = [len(term_docs[doc]) for doc in docs]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.fromiter((p for doc in docs for p in term_docs[doc]), dtype=np.int32, count=int(offsets[-1]))
+        return np.array(docs, dtype=np.int64), offsets, positions
+
+    def terms(self) -> list:
+        return sorted(term for term, term_docs in self.postings.items() if term_docs)
+
+
+class Segment(object):
+    """Класс неизменяемого сегмента на диске
+    Формат файла: для каждой основы подряд лежат id карточек (int64, по возрастанию),
+    смещения позиций (int64, число карточек + 1) и позиции (int32); в конце -- словарь основ в JSON
+    и 8 байт длины словаря. Файл отображается в память, списки читаются без копирования
+
+    Атрибуты:
+    :param path: str -- путь к файлу сегмента
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = int.from_bytes(self.data[-8:], 'little')
+        footer = json.loads(self.data[-8 - size:-8].decode('utf-8'))
+        self.dictionary = footer['terms']  # {основа: [смещение, число карточек, число позиций]}
+        offset, count = footer['docs']
+        self.docs = np.frombuffer(self.data, dtype=np.int64, count=count, offset=offset)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def get(self, term: str) -> tuple:
+        """Функция возвращает список вхождений основы
+
+        :param term: str -- основа слова
+        :return: tuple -- (id карточек, смещения позиций, позиции)
+        """
+        entry = self.dictionary.get(term)
+        if entry is None:
+            return EMPTY
+        offset, count, total = entry
+        docs = np.frombuffer(self.data, dtype=np.int64, count=count, offset=offset)
+        offset += 8 * count
+        offsets = np.frombuffer(self.data, dtype=np.int64, count=count + 1, offset=offset)
+        offset += 8 * (count + 1)
+        positions = np.frombuffer(self.data, dtype=np.int32, count=total, offset=offset)
+        return docs, offsets, positions
+
+    def terms(self) -> list:
+        return sorted(self.dictionary)
+
+    def close(self):
+        try:
+            self.data.close()
+        except BufferError:
+            # на данные еще ссылаются массивы numpy, файл закроется сборщиком мусора
+            pass
+        self.file.close()
+
+    @staticmethod
+    def write(path: str, postings, docs: np.ndarray):
+        """Функция записывает сегмент, сначала во временный файл
+
+        :param path: str -- путь к файлу сегмента
+        :param postings: -- пары (основа, (id карточек, смещения позиций, позиции)) по возрастанию основ
+        :param docs: np.ndarray -- все id карточек сегмента по возрастанию
+        """
+        dictionary = {}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for term, (term_docs, offsets, positions) in postings:
+                if not len(term_docs):
+                    continue
+                dictionary[term] = [f.tell(), len(term_docs), len(positions)]
+                f.write(np.ascontiguousarray(term_docs, dtype=np.int64).tobytes())
+                f.write(np.ascontiguousarray(offsets - offsets[0], dtype=np.int64).tobytes())
+                f.write(np.ascontiguousarray(positions, dtype=np.int32).tobytes())
+            docs_offset = f.tell()
+            f.write(np.ascontiguousarray(docs, dtype=np.int64).tobytes())
+            footer = json.dumps({'terms': dictionary, 'docs': [docs_offset, len(docs)]},
+                                ensure_ascii=False).encode('utf-8')
+            f.write(footer)
+            f.write(len(footer).to_bytes(8, 'little'))
+        os.replace(tmp_path, path)
+
+
+def select(postings: tuple, mask: np.ndarray) -> tuple:
+    """Функция оставляет в списке вхождений только карточки по маске
+
+    :param postings: tuple -- (id карточек, смещения позиций, позиции)
+    :param mask: np.ndarray -- маска карточек
+    :return: tuple -- отфильтрованный список вхождений
+    """
+    docs, offsets, positions = postings
+    if mask.all():
+        return postings
+    starts, ends = offsets[:-1][mask], offsets[1:][mask]
+    lengths = ends - starts
+    new_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    index = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return docs[mask], new_offsets, positions[index]
+
+
+def concat(parts: list) -> tuple:
+    """Функция объединяет списки вхождений сегментов с непересекающимися id карточек"""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return EMPTY
+    docs = np.concatenate([part[0] for part in parts])
+    positions = np.concatenate([part[2] for part in parts])
+    lengths = np.concatenate([np.diff(part[1]) for part in parts])
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    order = np.argsort(docs, kind='stable')
+    if (order == np.arange(len(order))).all():
+        return docs, offsets, positions
+    # упорядочиваем карточки по id вместе с их позициями
+    starts, lengths = offsets[:-1][order], lengths[order]
+    new_offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    index = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return docs[order], new_offsets, positions[index]
+
+
+QUERY_TOKEN = re.compile(r'"[^"]*"|\(|\)|-|[^\s()"-]+')
+OPERATORS = {'AND': 'AND', 'И': 'AND', 'OR': 'OR', 'ИЛИ': 'OR', 'NOT': 'NOT', 'НЕ': 'NOT'}
+
+
+def parse_query(query: str):
+    """Функция разбирает запрос в дерево
+    Синтаксис: слова через пробел -- И, OR/ИЛИ -- ИЛИ, NOT/НЕ или минус перед словом -- исключение,
+    "фраза в кавычках" -- слова подряд, скобки -- группировка. Операторы пишутся заглавными буквами
+
+    :param query: str -- запрос, например: кабель "электронный аукцион" -ремонт
+    :return: tuple -- дерево запроса: ('term', основа), ('phrase', [основы]), ('and'|'or', [узлы]), ('not', узел)
+    """
+    tokens = QUERY_TOKEN.findall(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while OPERATORS.get(peek()) == 'OR':
+            take()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and():
+        nodes = []
+        while peek() is not None and peek() != ')' and OPERATORS.get(peek()) != 'OR':
+            if OPERATORS.get(peek()) == 'AND':
+                take()
+                continue
+            node = parse_not()
+            if node is not None:
+                nodes.append(node)
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_not():
+        if peek() == '-' or OPERATORS.get(peek()) == 'NOT':
+            take()
+            node = parse_not()
+            return None if node is None else ('not', node)
+        return parse_atom()
+
+    def parse_atom():
+        token = take()
+        if token == '(':
+            node = parse_or()
+            if peek() == ')':
+                take()
+            return node
+        if token.startswith('"'):
+            words = [stem(word) for word in tokenize(token.strip('"'))]
+            if not words:
+                return None
+            return ('term', words[0]) if len(words) == 1 else ('phrase', words)
+        words = [stem(word) for word in tokenize(token)]
+        if not words:
+            return None
+        return ('term', words[0]) if len(words) == 1 else ('phrase', words)
+
+    return parse_or()
+
+
+def phrase_docs(postings: list) -> np.ndarray:
+    """Функция находит карточки, в которых основы идут подряд:
+    вхождение i-й основы фразы сдвигается на i позиций назад, и ищутся общие пары (карточка, позиция)
+
+    :param postings: list -- списки вхождений основ фразы по порядку
+    :return: np.ndarray -- id карточек
+    """
+    docs = postings[0][0]
+    for term_docs, _, _ in postings[1:]:
+        docs = np.intersect1d(docs, term_docs, assume_unique=True)
+    if not len(docs):
+        return docs
+    keys = None
+    for shift, term_postings in enumerate(postings):
+        term_docs, offsets, positions = select(term_postings, np.isin(term_postings[0], docs))
+        # ключ -- номер карточки среди кандидатов в старших 32 битах и позиция начала фразы в младших
+        numbers = np.repeat(np.searchsorted(docs, term_docs), np.diff(offsets)).astype(np.int64)
+        term_keys = (numbers << 32) + positions.astype(np.int64) + (len(postings) - shift)
+        keys = np.unique(term_keys) if keys is None else np.intersect1d(keys, term_keys)
+        if not len(keys):
+            break
+    return docs[np.unique(keys >> 32)]
+
+
+class FullTextIndex(object):
+    """Класс встроенного инвертированного индекса по текстовым полям карточек закупок
+    Новые карточки попадают в сегмент в памяти, при накоплении flush_size карточек он сбрасывается
+    на диск неизменяемым сегментом. Фоновый поток сливает по merge_factor сегментов одного уровня
+    (уровень -- порядок числа карточек), поэтому число сегментов растет логарифмически.
+    Повторно добавленная карточка заменяет предыдущую: при поиске из старых сегментов
+    исключаются id, которые есть в более новых
+
+    Атрибуты:
+    :param path: str -- папка индекса
+    :param flush_size: int -- число карточек в сегменте в памяти, по умолчанию 10000
+    :param merge_factor: int -- число сливаемых сегментов одного уровня, по умолчанию 10
+    :param fields: tuple -- индексируемые поля карточки, по умолчанию description и comment
+
+    Использование:
+        >>> index = FullTextIndex('../../../data/fulltext')
+        >>> index.add(get_card_data(card))
+        >>> index.search('кабель "электронный аукцион" -ремонт')
+        >>> index.close()
+    """
+
+    def __init__(self, path='../../../data/fulltext', flush_size=10_000, merge_factor=10, fields=FIELDS):
+        self.path = path
+        self.flush_size = flush_size
+        self.merge_factor = merge_factor
+        self.fields = fields
+        self._lock = Lock()
+        self._merge_lock = Lock()
+        os.makedirs(path, exist_ok=True)
+        self.manifest = os.path.join(path, 'manifest.json')
+        names, self.next_number = [], 1
+        if os.path.exists(self.manifest):
+            with open(self.manifest) as f:
+                manifest = json.load(f)
+            names, self.next_number = manifest['segments'], manifest['next']
+        self.segments = [Segment(os.path.join(path, name)) for name in names]
+        self.memory = MemorySegment()
+        self.deleted = self.find_deleted(self.segments, self.memory)
+
+        self._wake = Event()
+        self._stop = Event()
+        self.merger = Thread(target=self.merge_loop, name='fulltext-merge', daemon=True)
+        self.merger.start()
+
+    @staticmethod
+    def find_deleted(segments: list, memory: MemorySegment) -> list:
+        """Функция находит в каждом сегменте id, замененные более новыми сегментами
+
+        :return: list -- массивы замененных id по сегментам
+        """
+        deleted = []
+        newer = memory.docs
+        for segment in reversed(segments):
+            deleted.append(segment.docs[np.isin(segment.docs, newer)])
+            newer = np.union1d(newer, segment.docs)
+        return deleted[::-1]
+
+    def add(self, card: dict):
+        """Функция добавляет карточку в индекс
+
+        :param card: dict -- карточка закупки
+        """
+        if not card.get('id'):
+            return
+        doc_id = int(card['id'])
+        positions = document_terms(card, self.fields)
+        with self._lock:
+            if doc_id not in self.memory.doc_set:
+                # версия карточки в памяти заменяет версии в сегментах на диске
+                for i, segment in enumerate(self.segments):
+                    j = np.searchsorted(segment.docs, doc_id)
+                    if j < len(segment.docs) and segment.docs[j] == doc_id:
+                        self.deleted[i] = np.append(self.deleted[i], doc_id)
+            self.memory.add(doc_id, positions)
+            full = len(self.memory) >= self.flush_size
+        if full:
+            self.flush()
+
+    def write(self, cards) -> int:
+        """Функция добавляет пачку карточек, используется как приемник конвейера
+
+        :param cards: -- карточки закупок
+        :return: int -- число добавленных карточек
+        """
+        count = 0
+        for card in cards:
+            self.add(card)
+            count += 1
+        return count
+
+    def segment_name(self) -> str:
+        name = f'seg-{self.next_number:06d}.idx'
+        self.next_number += 1
+        return name
+
+    def save_manifest(self):
+        tmp_path = self.manifest + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segments': [os.path.basename(segment.path) for segment in self.segments],
+                       'next': self.next_number}, f)
+        os.replace(tmp_path, self.manifest)
+
+    def flush(self):
+        """Функция сбрасывает сегмент в памяти на диск"""
+        with self._lock:
+            memory = self.memory
+            if not len(memory):
+                return
+            name = self.segment_name()
+            self.memory = MemorySegment()
+            path = os.path.join(self.path, name)
+            Segment.write(path, ((term, memory.get(term)) for term in memory.terms()), memory.docs)
+            self.segments.append(Segment(path))
+            self.deleted = self.find_deleted(self.segments, self.memory)
+            self.save_manifest()
+        msg = f'Fulltext segment {name} with {len(memory)} cards flushed'
+        logging.info(logger(msg))
+        self._wake.set()
+
+    def level(self, segment: Segment) -> int:
+        return int(math.log(max(len(segment), 1), self.merge_factor))
+
+    def find_merge(self):
+        """Функция находит merge_factor соседних сегментов одного уровня
+
+        :return: tuple -- (начало, конец) среза сегментов или None
+        """
+        segments = self.segments
+        start = 0
+        for i in range(1, len(segments) + 1):
+            if i == len(segments) or self.level(segments[i]) != self.level(segments[start]):
+                if i - start >= self.merge_factor:
+                    return start, start + self.merge_factor
+                start = i
+        return None
+
+    def merge(self, start: int, end: int):
+        """Функция сливает сегменты [start, end) в один, старые версии карточек отбрасываются
+
+        :param start: int -- номер первого сегмента
+        :param end: int -- номер сегмента после последнего
+        """
+        with self._lock:
+            group = self.segments[start:end]
+            name = self.segment_name()
+        # в сливаемой группе карточку представляет ее самая новая версия
+        live, newer = [], np.empty(0, dtype=np.int64)
+        for segment in reversed(group):
+            live.append(~np.isin(segment.docs, newer))
+            newer = np.union1d(newer, segment.docs)
+        live = live[::-1]
+        docs = newer
+
+        def postings():
+            for term in sorted(set().union(*(segment.dictionary for segment in group))):
+                parts = []
+                for segment, segment_live in zip(group, live):
+                    part = segment.get(term)
+                    if len(part[0]):
+                        parts.append(select(part, segment_live[np.searchsorted(segment.docs, part[0])]))
+                yield term, concat(parts)
+
+        path = os.path.join(self.path, name)
+        Segment.write(path, postings(), docs)
+        merged = Segment(path)
+        with self._lock:
+            # пока шло слияние, в конец списка могли добавиться новые сегменты, но не в середину
+            self.segments[start:end] = [merged]
+            self.deleted = self.find_deleted(self.segments, self.memory)
+            self.save_manifest()
+        for segment in group:
+            segment.close()
+            os.remove(segment.path)
+        msg = f'Fulltext segments {[os.path.basename(segment.path) for segment in group]} merged into {name}'
+        logging.info(logger(msg))
+
+    def merge_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self.merge_all()
+
+    def merge_all(self):
+        """Функция сливает сегменты, пока есть merge_factor соседних сегментов одного уровня"""
+        with self._merge_lock:
+            while not self._stop.is_set():
+                with self._lock:
+                    bounds = self.find_merge()
+                if bounds is None:
+                    return
+                try:
+                    self.merge(*bounds)
+                except Exception as e:
+                    msg = f'Fulltext merge failed. {e!r}'
+                    logging.error(logger(msg))
+                    return
+
+    def search(self, query: str, limit=None) -> list:
+        """Функция находит карточки по запросу, см. parse_query
+
+        :param query: str -- запрос
+        :param limit: int -- максимальное число результатов, по умолчанию все
+        :return: list -- id карточек по возрастанию
+        """
+        tree = parse_query(query)
+        if tree is None or tree == ('and', []):
+            return []
+        with self._lock:
+            segments = list(zip(self.segments, self.deleted))
+            # сегмент в памяти изменяется в add на месте, поэтому вычисляется под блокировкой,
+            # сегменты на диске неизменяемы и вычисляются без нее
+            result = [self.evaluate(tree, self.memory)]
+        for segment, deleted in segments:
+            docs = self.evaluate(tree, segment)
+            if deleted is not None and len(deleted):
+                docs = docs[~np.isin(docs, deleted)]
+            result.append(docs)
+        docs = np.unique(np.concatenate(result)) if result else np.empty(0, dtype=np.int64)
+        return [int(doc) for doc in docs[:limit]]
+
+    def evaluate(self, node: tuple, segment) -> np.ndarray:
+        """Функция вычисляет узел запроса на одном сегменте
+
+        :return: np.ndarray -- id карточек сегмента по возрастанию
+        """
+        kind, value = node
+        if kind == 'term':
+            return np.asarray(segment.get(value)[0])
+        if kind == 'phrase':
+            return phrase_docs([segment.get(term) for term in value])
+        if kind == 'not':
+            return np.setdiff1d(segment.docs, self.evaluate(value, segment), assume_unique=True)
+        if kind == 'or':
+            return np.unique(np.concatenate([self.evaluate(child, segment) for child in value]))
+        # в пересечении исключения вычитаются из остальных условий, а не из всех карточек
+        positive = [child for child in value if child[0] != 'not']
+        negative = [child[1] for child in value if child[0] == 'not']
+        docs = segment.docs if not positive else None
+        for child in positive:
+            child_docs = self.evaluate(child, segment)
+            docs = child_docs if docs is None else np.intersect1d(docs, child_docs, assume_unique=True)
+            if not len(docs):
+                return docs
+        for child in negative:
+            docs = np.setdiff1d(docs, self.evaluate(child, segment), assume_unique=True)
+        return np.asarray(docs)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.memory) + sum(len(segment) - len(deleted)
+                                          for segment, deleted in zip(self.segments, self.deleted))
+
+    def close(self):
+        """Функция сбрасывает сегмент в памяти, дожидается слияния и закрывает сегменты"""
+        self.flush()
+        self.merge_all()
+        self._stop.set()
+        self._wake.set()
+        self.merger.join()
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
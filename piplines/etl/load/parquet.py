@@ -0,0 +1,204 @@
+import os
+import uuid
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from threading import Lock
+from datetime import datetime
+from piplines.etl.transform.card import (TenderBatch, CARD_FIELDS, ID_FIELDS, NUMERIC_FIELDS, DATE_FIELDS,
+                                         CATEGORY_FIELDS)
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+UNKNOWN = 'unknown'  # значение ключа партиции для карточек без закона или даты размещения
+
+# схема файлов: law хранится в пути партиции, поэтому в файлах его нет
+SCHEMA = pa.schema([pa.field(field, pa.int64()) if field in ID_FIELDS else
+                    pa.field(field, pa.float64()) if field in NUMERIC_FIELDS else
+                    pa.field(field, pa.timestamp('s')) if field in DATE_FIELDS else
+                    pa.field(field, pa.dictionary(pa.int32(), pa.string())) if field in CATEGORY_FIELDS else
+                    pa.field(field, pa.string())
+                    for field in CARD_FIELDS if field != 'law'])
+
+PARTITIONING = ds.HivePartitioning(pa.schema([('law', pa.string()), ('month', pa.string())]),
+                                   segment_encoding='none')
+
+
+def partition_key(law: str, init_date) -> tuple:
+    """Функция возвращает ключ партиции закупки
+
+    :param law: str -- федеральный закон, например '44-ФЗ'
+    :param init_date: np.datetime64 -- дата размещения извещения
+    :return: tuple -- (закон, месяц 'Год-Месяц')
+    """
+    law = law.replace('/', '_') if law else UNKNOWN
+    month = UNKNOWN if np.isnat(init_date) else str(init_date.astype('datetime64[M]'))
+    return law, month
+
+
+def to_table(batch: TenderBatch, rows=slice(None)) -> pa.Table:
+    """Функция преобразует часть пачки карточек в таблицу Arrow со схемой SCHEMA
+
+    :param batch: TenderBatch -- пачка карточек
+    :param rows: -- номера строк, по умолчанию все
+    :return: pyarrow.Table
+    """
+    arrays = []
+    for field in SCHEMA.names:
+        if field in CATEGORY_FIELDS:
+            codes, values = batch.categories[field]
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes[rows], type=pa.int32()),
+                                                         pa.array(values, type=pa.string())))
+        elif field in DATE_FIELDS:
+            # в Arrow нет единицы измерения в минутах, nat становится null
+            values = batch.columns[field][rows].astype('datetime64[s]')
+            arrays.append(pa.array(values, type=pa.timestamp('s'), from_pandas=True))
+        elif field in ID_FIELDS or field in NUMERIC_FIELDS:
+            # nan в ценах -- отсутствующее значение, в Parquet хранится как null
+            arrays.append(pa.array(batch.columns[field][rows], type=SCHEMA.field(field).type, from_pandas=True))
+        else:
+            arrays.append(pa.array([None if value is None else str(value) for value in batch.columns[field][rows]],
+                                   type=pa.string()))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+class ParquetSink(object):
+    """Класс выгружает карточки закупок в Parquet для аналитики
+    Файлы раскладываются по партициям law=<закон>/month=<Год-Месяц> по дате размещения извещения,
+    поэтому фильтры по закону и месяцу отсекают лишние файлы без чтения.
+    Каждая запись добавляет новые файлы, compact объединяет мелкие файлы партиции в один
+    и оставляет последнюю версию каждой закупки
+
+    Атрибуты:
+    :param root: str -- папка набора данных
+    :param small_file_size: int -- файлы меньше этого размера объединяются при compact, байт,
+                                   по умолчанию 8 Мб
+    :param compression: str -- алгоритм сжатия, по умолчанию zstd
+
+    Использование:
+        >>> sink = ParquetSink('../../../data/parquet')
+        >>> sink.write(cards_data)
+        >>> sink.compact()
+        >>> table = sink.read(filter=(ds.field('law') == '44-ФЗ') & (ds.field('price') > 1e6))
+    """
+
+    def __init__(self, root='../../../data/parquet', small_file_size=8 * 1024 * 1024, compression='zstd'):
+        self.root = root
+        self.small_file_size = small_file_size
+        self.compression = compression
+        self._lock = Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def partition_path(self, law: str, month: str) -> str:
+        return os.path.join(self.root, f'law={law}', f'month={month}')
+
+    def write_file(self, table: pa.Table, directory: str) -> str:
+        """Функция атомарно записывает файл: сначала во временный, скрытый от чтения, затем переименовывает
+
+        :param table: pyarrow.Table -- данные
+        :param directory: str -- папка партиции
+        :return: str -- путь к файлу
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = f'part-{datetime.now().strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}.parquet'
+        path = os.path.join(directory, name)
+        tmp_path = os.path.join(directory, f'.{name}')
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+        return path
+
+    def write(self, cards) -> int:
+        """Функция дописывает пачку карточек в набор данных
+
+        :param cards: -- карточки закупок (словари или TenderCard) либо TenderBatch
+        :return: int -- число записанных карточек
+        """
+        batch = cards if isinstance(cards, TenderBatch) else TenderBatch.from_cards(cards)
+        if not len(batch):
+            return 0
+        codes, laws = batch.categories['law']
+        dates = batch.columns['init_date']
+        groups = {}
+        for i, (code, init_date) in enumerate(zip(codes, dates)):
+            groups.setdefault(partition_key(laws[code], init_date), []).append(i)
+
+        with self._lock:
+            for (law, month), rows in groups.items():
+                self.write_file(to_table(batch, np.array(rows)), self.partition_path(law, month))
+        msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Exported {len(batch)} cards to {len(groups)} partitions"
+        logging.info(msg)
+        return len(batch)
+
+    def partitions(self) -> list:
+        """Функция возвращает папки партиций
+
+        :return: list -- пути к папкам law=.../month=...
+        """
+        paths = []
+        for law_dir in sorted(os.listdir(self.root)):
+            if not law_dir.startswith('law='):
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.root, law_dir))):
+                if month_dir.startswith('month='):
+                    paths.append(os.path.join(self.root, law_dir, month_dir))
+        return paths
+
+    def compact(self) -> int:
+        """Функция объединяет мелкие файлы каждой партиции в один,
+        повторы закупки (по id) заменяются последней записанной версией (по time)
+
+        :return: int -- число удаленных файлов
+        """
+        removed = 0
+        with self._lock:
+            for directory in self.partitions():
+                small = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                         if name.endswith('.parquet') and not name.startswith('.')
+                         and os.path.getsize(os.path.join(directory, name)) < self.small_file_size]
+                if len(small) < 2:
+                    continue
+                table = pa.concat_tables([pq.read_table(path, schema=SCHEMA) for path in small])
+                table = table.unify_dictionaries().take(self.latest_rows(table))
+                self.write_file(table.combine_chunks(), directory)
+                for path in small:
+                    os.remove(path)
+                removed += len(small) - 1
+        msg = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Compacted parquet dataset, {removed} files removed"
+        logging.info(msg)
+        return removed
+
+    @staticmethod
+    def latest_rows(table: pa.Table) -> np.ndarray:
+        """Функция возвращает номера строк с последней версией каждой закупки
+        Карточки без номера (id 0 или пусто) не сравниваются между собой и сохраняются все
+
+        :param table: pyarrow.Table -- данные партиции
+        :return: np.ndarray -- номера строк в порядке id, затем строки без номера
+        """
+        ids = table.column('id').fill_null(0).to_numpy()
+        times = table.column('time').to_numpy(zero_copy_only=False)
+        known = np.flatnonzero(ids != 0)
+        order = known[np.lexsort((np.nan_to_num(times[known], nan=-np.inf), ids[known]))]
+        last = np.ones(order.size, dtype=bool)
+        last[:-1] = ids[order][1:] != ids[order][:-1]
+        return np.concatenate([order[last], np.flatnonzero(ids == 0)])
+
+    def dataset(self) -> ds.Dataset:
+        """Функция открывает набор данных, law и month восстанавливаются из путей партиций
+
+        :return: pyarrow.dataset.Dataset
+        """
+        return ds.dataset(self.root, format='parquet', partitioning=PARTITIONING, schema=pa.unify_schemas(
+            [SCHEMA, PARTITIONING.schema]))
+
+    def read(self, columns=None, filter=None) -> pa.Table:
+        """Функция читает карточки с отбором столбцов и строк, фильтры по law и month отсекают партиции,
+        фильтры по остальным столбцам проверяются по статистике row group
+
+        :param columns: list -- названия столбцов, по умолчанию все
+        :param filter: pyarrow.dataset.Expression -- условие отбора
+        :return: pyarrow.Table
+        """
+        return self.dataset().to_table(columns=columns, filter=filter)
@@ -0,0 +1,344 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Thread, Event, Lock
+import queue
+import os
+import time
+from piplines.etl.extract import zakupki
+from piplines.etl.extract.parallel import fetch_card_pages, parse_card
+from piplines.etl.extract.seen import SeenIndex, fingerprint
+from piplines.etl.transform.card import TenderBatch
+from utils.collecting import logger, Commentator
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+STOP = object()  # признак конца потока данных
+
+
+class Stage(object):
+    """Класс этапа конвейера: потоки workers берут элементы из своей ограниченной очереди,
+    вызывают func и передают результат в очереди следующих этапов.
+    Если очередь следующего этапа заполнена, этап ждет, поэтому в памяти находится
+    не больше maxsize элементов на этап независимо от числа закупок
+
+    Атрибуты:
+    :param name: str -- название этапа
+    :param func: -- функция обработки элемента, None в результате -- элемент отбрасывается
+    :param workers: int -- число потоков этапа, по умолчанию 1
+    :param maxsize: int -- емкость входной очереди, по умолчанию 100
+    :param batch_size: int -- если задан, func получает список из batch_size элементов
+    :param batch_timeout: float -- максимальное время набора неполной пачки, сек., по умолчанию 5
+    """
+
+    def __init__(self, name: str, func, workers=1, maxsize=100, batch_size=None, batch_timeout=5.0):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.outputs = []
+        self.processed = 0
+        self.errors = 0
+        self._running = workers
+        self._lock = Lock()
+        self._threads = []
+
+    def then(self, *stages):
+        """Функция подключает следующие этапы, каждый получает все результаты этого этапа
+
+        :return: -- первый из подключенных этапов, чтобы строить цепочку
+        """
+        self.outputs.extend(stages)
+        return stages[0] if stages else self
+
+    def emit(self, item):
+        if item is None:
+            return
+        for output in self.outputs:
+            output.queue.put(item)
+
+    def process(self, item):
+        try:
+            result = self.func(item)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            msg = f'Stage {self.name} failed to process item. {e!r}'
+            logging.error(logger(msg))
+            return
+        with self._lock:
+            self.processed += len(item) if self.batch_size else 1
+        self.emit(result)
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.batch_timeout
+        while True:
+            if self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    item = None
+                if item is not STOP and item is not None:
+                    batch.append(item)
+                if batch and (item is STOP or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self.process(batch)
+                    batch = []
+                if item is None or len(batch) == 0:
+                    deadline = time.monotonic() + self.batch_timeout
+            else:
+                item = self.queue.get()
+                if item is not STOP:
+                    self.process(item)
+            if item is STOP:
+                break
+        self.finish()
+
+    def finish(self):
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            # каждый поток следующего этапа должен получить свой признак конца
+            for output in self.outputs:
+                for _ in range(output.workers):
+                    output.queue.put(STOP)
+
+    def start(self):
+        self._threads = [Thread(target=self.run, name=f'{self.name}-{i}', daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> dict:
+        return {'processed': self.processed, 'errors': self.errors, 'queued': self.queue.qsize()}
+
+
+class Pipeline(object):
+    """Класс потокового конвейера: источник -> этапы -> приемники
+    Источник перебирается в отдельном потоке и блокируется, если первый этап не успевает
+
+    Атрибуты:
+    :param source: -- итерируемый источник элементов, например генератор iter_cards
+    :param first: Stage -- первый этап, следующие подключены через Stage.then
+    :param cleanup: list -- функции, которые вызываются после завершения конвейера, например закрытие пулов
+
+    Использование:
+        >>> fetch = Stage('fetch', lambda card: fetch_card(card, docs_fetcher), workers=20)
+        >>> fetch.then(Stage('parse', parse, workers=4)).then(Stage('db', db.load_batch, batch_size=500))
+        >>> Pipeline(iter_cards('кабель', '01.06.2020', '30.06.2020'), fetch).run()
+    """
+
+    def __init__(self, source, first: Stage, cleanup=()):
+        self.source = source
+        self.first = first
+        self.cleanup = list(cleanup)
+        self.stages = []
+        pending = [first]
+        while pending:
+            stage = pending.pop(0)
+            if stage not in self.stages:
+                self.stages.append(stage)
+                pending.extend(stage.outputs)
+        self._stop = Event()
+        self.produced = 0
+        self.error = None  # исключение источника
+
+    def produce(self):
+        try:
+            for item in self.source:
+                if self._stop.is_set():
+                    break
+                self.first.queue.put(item)
+                self.produced += 1
+        except Exception as e:
+            self.error = e
+            msg = f'Pipeline source failed. {e!r}'
+            logging.error(logger(msg))
+        finally:
+            for _ in range(self.first.workers):
+                self.first.queue.put(STOP)
+
+    def stop(self):
+        """Функция останавливает чтение источника, уже прочитанные элементы дообрабатываются"""
+        self._stop.set()
+
+    def run(self) -> dict:
+        """Функция запускает конвейер и ждет, пока все элементы пройдут все этапы
+        Если источник завершился с ошибкой, уже прочитанные элементы дообрабатываются,
+        после чего исключение поднимается повторно: часть элементов источника не прочитана
+
+        :return: dict -- статистика по этапам, см. stats
+        """
+        start = time.monotonic()
+        try:
+            for stage in self.stages:
+                stage.start()
+            producer = Thread(target=self.produce, name='source', daemon=True)
+            producer.start()
+            producer.join()
+            for stage in self.stages:
+                stage.join()
+        finally:
+            for func in self.cleanup:
+                func()
+        stats = self.stats()
+        msg = f'Pipeline finished in {time.monotonic() - start:.1f} s: {stats}'
+        logging.info(logger(msg))
+        if self.error is not None:
+            raise RuntimeError(f'Pipeline source failed after {self.produced} items') from self.error
+        return stats
+
+    def stats(self) -> dict:
+        """Функция возвращает статистику по этапам
+
+        :return: dict -- {'source': число элементов, этап: {'processed', 'errors', 'queued'}}
+        """
+        stats = {'source': self.produced}
+        stats.update({stage.name: stage.stats() for stage in self.stages})
+        return stats
+
+    def sinks(self) -> list:
+        """Функция возвращает приемники -- этапы, у которых нет следующих этапов"""
+        return [stage for stage in self.stages if not stage.outputs]
+
+    def errors(self, stages=None) -> int:
+        """Функция возвращает число элементов, которые не удалось обработать
+
+        :param stages: list -- этапы, по умолчанию все
+        :return: int
+        """
+        return sum(stage.errors for stage in (self.stages if stages is None else stages))
+
+
+def fetch_card(card, fetcher: ThreadPoolExecutor) -> tuple:
+    """Функция загружает страницы общей информации и документов закупки параллельно, см. fetch_card_pages
+
+    :param card: -- объект BeautifulSoup, блок закупки на странице поиска
+    :param fetcher: ThreadPoolExecutor -- пул потоков для загрузки документов закупки
+    :return: tuple -- (HTML блока закупки, отпечаток блока, HTML общей информации, HTML документов)
+    """
+    card_html, common_html, docs_html = fetch_card_pages(str(card), zakupki.get_url(card, Commentator()), fetcher)
+    return card_html, fingerprint(card.text), common_html, docs_html
+
+
+def normalize(cards: list) -> list:
+    """Функция приводит пачку карточек к типам хранилища: цены, не преобразованные при разборе,
+    преобразуются повторно, даты приводятся к форматам date_formatter/datetime_formatter
+
+    :param cards: list -- карточки закупок
+    :return: list -- нормализованные карточки
+    """
+    return TenderBatch.from_cards(cards).to_cards()
+
+
+def bx24_deal(card: dict, restrictions=None) -> dict:
+    """Функция формирует поля сделки Битрикс24 по карточке закупки
+
+    :param card: dict -- карточка закупки
+    :param restrictions: RestrictionMatcher -- если задан, найденные ограничения дописываются в комментарий
+    :return: dict -- поля для метода crm.deal.add
+    """
+    comments = card['comment'] or ''
+    if restrictions is not None:
+        matches = restrictions.find(comments)
+        if matches:
+            found = '\n'.join(f'\t• {rule_id}: {comments[start:end]}' for rule_id, start, end in matches)
+            comments = f'Найдены ограничения:\n{found}\n\n{comments}'
+    return {'TITLE': f"{card['law']} № {card['id']}: {card['description']}",
+            'OPPORTUNITY': card['price'],
+            'CURRENCY_ID': 'RUB',
+            'SOURCE_DESCRIPTION': card['url'],
+            'COMMENTS': comments}
+
+
+def zakupki_pipeline(search_string: str,
+                     start_date: str,
+                     end_date: str,
+                     search_filter='Дате размещения',
+                     db=None,
+                     bx24=None,
+                     parquet=None,
+                     fulltext=None,
+                     restrictions=None,
+                     seen: SeenIndex = None,
+                     fetch_workers=20,
+                     parse_workers=None,
+                     bx24_workers=2,
+                     batch_size=500,
+                     maxsize=100) -> Pipeline:
+    """Функция собирает конвейер поиск -> загрузка страниц -> разбор -> нормализация -> приемники
+
+    Использование:
+        >>> db = DataBase('../configs/dbconfig.yaml')
+        >>> zakupki_pipeline('кабель', '01.06.2020', '30.06.2020', db=db, seen=SeenIndex()).run()
+
+    :param search_string: str -- поисковый запрос
+    :param start_date: str -- дата начала фильтрации закупок, формат даты 01.01.2012
+    :param end_date: str -- дата окончания закупок, формат даты 01.01.2012
+    :param search_filter: str -- тип сортировки, по умолчанию по дате размещения
+    :param db: DataBase -- база данных, пачки пишутся через load_batch
+    :param bx24: BX24 -- портал Битрикс24, по каждой закупке создается сделка
+    :param parquet: ParquetSink -- выгрузка в Parquet
+    :param fulltext: FullTextIndex -- полнотекстовый индекс по описанию и комментарию
+    :param restrictions: RestrictionMatcher -- поиск скрытых ограничений для комментария сделки Битрикс24
+    :param seen: SeenIndex -- индекс обработанных закупок, уже обработанные закупки пропускаются.
+                              Закупка отмечается после записи в db (без db -- в первый из приемников),
+                              поэтому закупка, не дошедшая до хранилища, будет загружена повторно
+    :param fetch_workers: int -- число потоков загрузки страниц, по умолчанию 20
+    :param parse_workers: int -- число процессов разбора, по умолчанию число ядер
+    :param bx24_workers: int -- число потоков отправки в Битрикс24, по умолчанию 2
+    :param batch_size: int -- размер пачки нормализации и записи, по умолчанию 500
+    :param maxsize: int -- емкость очереди каждого этапа, по умолчанию 100
+    :return: Pipeline
+    """
+    parse_workers = parse_workers or os.cpu_count() or 1
+    source = zakupki.iter_cards(search_string, start_date, end_date, search_filter)
+    if seen is not None:
+        source = zakupki.filter_seen(source, seen)
+    parser = ProcessPoolExecutor(max_workers=parse_workers)
+    docs_fetcher = ThreadPoolExecutor(max_workers=fetch_workers)
+    fingerprints = {}  # отпечатки закупок, еще не записанных в хранилище
+
+    def parse(pages: tuple) -> dict:
+        card_html, card_fingerprint, common_html, docs_html = pages
+        card_data = parser.submit(parse_card, card_html, common_html, docs_html).result()
+        if seen is not None and card_data['id']:
+            fingerprints[card_data['id']] = card_fingerprint
+        return card_data
+
+    def mark_seen(sink):
+        # закупки отмечаются только после успешной записи, при ошибке sink исключение обрабатывает Stage
+        def store(cards: list):
+            result = sink(cards)
+            for card in cards:
+                if card['id']:
+                    seen.add(card['id'], card['init_date'], fingerprints.pop(card['id'], None))
+            return result
+        return store
+
+    def send_deals(cards: list) -> list:
+        return [bx24.callMethod('crm.deal.add', {'fields': bx24_deal(card, restrictions)}) for card in cards]
+
+    sinks = []
+    if db is not None:
+        sinks.append(Stage('db', db.load_batch, maxsize=maxsize))
+    if parquet is not None:
+        sinks.append(Stage('parquet', parquet.write, maxsize=maxsize))
+    if fulltext is not None:
+        sinks.append(Stage('fulltext', fulltext.write, maxsize=maxsize))
+    if bx24 is not None:
+        sinks.append(Stage('bx24', send_deals, workers=bx24_workers, maxsize=maxsize))
+    if seen is not None and sinks:
+        sinks[0].func = mark_seen(sinks[0].func)
+
+    fetch = Stage('fetch', lambda card: fetch_card(card, docs_fetcher), workers=fetch_workers, maxsize=maxsize)
+    fetch.then(Stage('parse', parse, workers=parse_workers, maxsize=maxsize)) \
+        .then(Stage('normalize', normalize, batch_size=batch_size, maxsize=batch_size)) \
+        .then(*sinks)
+    pipeline = Pipeline(source, fetch, cleanup=[parser.shutdown, docs_fetcher.shutdown])
+    return pipeline
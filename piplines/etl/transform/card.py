@@ -0,0 +1,227 @@
+import numpy as np
+from piplines.etl.transform.converter import to_numeric_batch, to_datetime_batch
+
+CARD_FIELDS = (
+    'id',  # Реестровый номер извещения
+    'law',  # Федеральный закон
+    'type',  # Способ размещения закупки
+    'description',  # Наименование закупки
+    'init_date',  # Дата размещения извещения
+    'platform',  # Наименование электронной площадки
+    'platform_url',  # Адрес электронной площадки
+    'author_name',  # Наименование организации
+    'author_inn',  # ИНН
+    'author_ogrn',  # ОГРН
+    'address',  # Место нахождения
+    'author_manager',  # Контактное лицо
+    'author_email',  # Электронная почта
+    'author_phone',  # Телефон
+    'start_date',  # Дата начала срока подачи заявок
+    'end_date',  # Дата и время окончания подачи заявок(по местному времени заказчика)
+    'timezone',  # Часовой пояс заказчика
+    'result_date',  # Дата подведения итогов
+    'price',  # Начальная (максимальная) цена договора
+    'tender_deposit',  # Обеспечение заявки
+    'contract_deposit',  # Обеспечение контракта
+    'warranty_deposit',  # Обеспечение гарантийных обязательств
+    'costs',  # Себестоимость контракта
+    'url',  # URL-закупки на ЕИС в сфере закупок
+    'docs',  # URL-ссылка на документацию
+    'comment',  # Комментарий к сделке
+    'time',  # Дата записи карточки в формате unicode
+)
+
+ID_FIELDS = ('id',)
+NUMERIC_FIELDS = ('price', 'tender_deposit', 'contract_deposit', 'warranty_deposit', 'costs', 'time')
+DATE_FIELDS = ('init_date', 'start_date', 'end_date', 'result_date')
+CATEGORY_FIELDS = ('law', 'type', 'platform', 'platform_url', 'timezone')  # мало различных значений
+TEXT_FIELDS = tuple(field for field in CARD_FIELDS
+                    if field not in ID_FIELDS + NUMERIC_FIELDS + DATE_FIELDS + CATEGORY_FIELDS)
+
+
+class TenderCard(object):
+    """Класс карточки закупки с __slots__ вместо словаря, поддерживает обращение card['field']
+
+    Использование:
+        >>> card = TenderCard.from_dict(get_card_data(card_soup))
+        >>> card.price, card['law']
+    """
+    __slots__ = CARD_FIELDS
+
+    def __init__(self, **fields):
+        for field in CARD_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_dict(cls, card_data: dict):
+        """Функция создает карточку из словаря, который возвращает zakupki.get_card_data"""
+        return cls(**card_data)
+
+    def to_dict(self) -> dict:
+        """Функция возвращает карточку в виде словаря, как у zakupki.create_card"""
+        return {field: getattr(self, field) for field in CARD_FIELDS}
+
+    def __getitem__(self, field: str):
+        return getattr(self, field)
+
+    def __setitem__(self, field: str, value):
+        setattr(self, field, value)
+
+    def __repr__(self):
+        return f'TenderCard(id={self.id!r}, law={self.law!r}, price={self.price!r})'
+
+
+def format_dates(values: np.ndarray) -> list:
+    """Функция преобразует datetime64[m] обратно в строки формата date_formatter/datetime_formatter
+
+    :param values: np.ndarray -- массив datetime64[m]
+    :return: list -- строки 'Год-Месяц-День' или 'Год-Месяц-День Час:Минута', '' для NaT
+    """
+    text = np.datetime_as_string(values, unit='m')
+    midnight = values == values.astype('datetime64[D]')
+    return ['' if np.isnat(value) else (string[:10] if date_only else string.replace('T', ' '))
+            for value, string, date_only in zip(values, text, midnight)]
+
+
+class TenderBatch(object):
+    """Класс хранит пачку карточек закупок по столбцам (struct of arrays):
+        * id -- int64;
+        * цены и обеспечения, time -- float64;
+        * даты -- datetime64[m];
+        * law, type, platform, platform_url, timezone -- коды int32 и общий список значений
+          (повторяющиеся строки хранятся один раз);
+        * остальные текстовые поля -- массивы object.
+
+    Преобразование в словари обратимо с точностью до типов: непреобразуемые числа становятся nan,
+    даты -- строками в формате date_formatter/datetime_formatter.
+
+    Атрибуты:
+    :param columns: dict -- {поле: массив} для ID_FIELDS, NUMERIC_FIELDS, DATE_FIELDS, TEXT_FIELDS
+    :param categories: dict -- {поле: (коды, значения)} для CATEGORY_FIELDS
+
+    Использование:
+        >>> batch = TenderBatch.from_cards(cards_data)
+        >>> batch.columns['price'].sum()
+        >>> df = batch.to_pandas()
+    """
+
+    def __init__(self, columns: dict, categories: dict):
+        self.columns = columns
+        self.categories = categories
+
+    @classmethod
+    def from_cards(cls, cards):
+        """Функция собирает пачку из карточек
+
+        :param cards: -- последовательность словарей (zakupki.get_card_data) или TenderCard
+        :return: объект TenderBatch
+        """
+        cards = [card.to_dict() if isinstance(card, TenderCard) else card for card in cards]
+        columns = {}
+        for field in ID_FIELDS:
+            columns[field] = np.array([card.get(field) or 0 for card in cards], dtype=np.int64)
+        for field in NUMERIC_FIELDS:
+            values = [card.get(field) for card in cards]
+            numeric = np.array([value if isinstance(value, (int, float)) else np.nan for value in values],
+                               dtype=np.float64)
+            # строки, которые не удалось преобразовать при разборе, пробуем преобразовать еще раз
+            raw = [i for i, value in enumerate(values) if isinstance(value, str)]
+            if raw:
+                numeric[raw] = to_numeric_batch([values[i] for i in raw])
+            columns[field] = numeric
+        for field in DATE_FIELDS:
+            columns[field] = to_datetime_batch([card.get(field) for card in cards])
+        for field in TEXT_FIELDS:
+            text = np.empty(len(cards), dtype=object)
+            text[:] = [card.get(field) for card in cards]
+            columns[field] = text
+
+        categories = {}
+        for field in CATEGORY_FIELDS:
+            values = np.array([card.get(field) or '' for card in cards], dtype=str)
+            uniques, codes = np.unique(values, return_inverse=True)
+            categories[field] = (codes.astype(np.int32), [str(value) for value in uniques])
+        return cls(columns, categories)
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def column(self, field: str) -> np.ndarray:
+        """Функция возвращает столбец, для категориальных полей -- восстановленные строки
+
+        :param field: str -- название поля
+        :return: np.ndarray -- столбец
+        """
+        if field in self.categories:
+            codes, values = self.categories[field]
+            return np.array(values, dtype=object)[codes]
+        return self.columns[field]
+
+    def card(self, i: int) -> TenderCard:
+        """Функция возвращает одну карточку из пачки
+
+        :param i: int -- номер карточки
+        :return: объект TenderCard
+        """
+        return TenderCard.from_dict(self.to_cards(slice(i, i + 1))[0])
+
+    def to_cards(self, rows=slice(None)) -> list:
+        """Функция возвращает карточки в виде словарей, как у zakupki.create_card
+
+        :param rows: slice -- диапазон карточек, по умолчанию все
+        :return: list -- список словарей
+        """
+        data = {}
+        for field in ID_FIELDS:
+            data[field] = [int(value) for value in self.columns[field][rows]]
+        for field in NUMERIC_FIELDS:
+            data[field] = [float(value) for value in self.columns[field][rows]]
+        for field in DATE_FIELDS:
+            data[field] = format_dates(self.columns[field][rows])
+        for field in TEXT_FIELDS:
+            data[field] = list(self.columns[field][rows])
+        for field in CATEGORY_FIELDS:
+            codes, values = self.categories[field]
+            data[field] = [values[code] for code in codes[rows]]
+        size = len(data['id'])
+        return [{field: data[field][i] for field in CARD_FIELDS} for i in range(size)]
+
+    def to_pandas(self):
+        """Функция возвращает пачку как pandas.DataFrame, числовые столбцы передаются без копирования,
+        категориальные поля -- как pandas.Categorical
+
+        :return: pandas.DataFrame
+        """
+        import pandas as pd
+
+        data = {}
+        for field in CARD_FIELDS:
+            if field in self.categories:
+                codes, values = self.categories[field]
+                data[field] = pd.Categorical.from_codes(codes, categories=values)
+            else:
+                data[field] = self.columns[field]
+        return pd.DataFrame(data, columns=list(CARD_FIELDS), copy=False)
+
+    @classmethod
+    def from_pandas(cls, df):
+        """Функция собирает пачку из pandas.DataFrame с колонками CARD_FIELDS
+
+        :param df: pandas.DataFrame
+        :return: объект TenderBatch
+        """
+        columns = {}
+        for field in ID_FIELDS:
+            columns[field] = df[field].to_numpy(dtype=np.int64)
+        for field in NUMERIC_FIELDS:
+            columns[field] = df[field].to_numpy(dtype=np.float64)
+        for field in DATE_FIELDS:
+            columns[field] = df[field].to_numpy(dtype='datetime64[m]')
+        for field in TEXT_FIELDS:
+            columns[field] = df[field].to_numpy(dtype=object)
+        categories = {}
+        for field in CATEGORY_FIELDS:
+            values = df[field].astype(str).to_numpy()
+            uniques, codes = np.unique(values, return_inverse=True)
+            categories[field] = (codes.astype(np.int32), [str(value) for value in uniques])
+        return cls(columns, categories)
@@ -1,5 +1,7 @@
 from datetime import datetime
+from functools import lru_cache
 import numpy as np
+from utils.collecting import logger
 import logging
 
 logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
@@ -54,3 +56,152 @@ def datetime_formatter(date: str, formatter='%Y-%m-%d %H:%M') -> str:
         result_date = date_formatter(date)
     return result_date
 
+
+NUMERIC_DIGITS = 18  # длиннее не помещается в int64
+
+
+@lru_cache(maxsize=65536)
+def parse_numeric(string: str) -> float:
+    """Функция преобразует нестандартную строку в float так же, как to_numeric, но без записи в лог,
+    результаты кэшируются
+
+    :param string: str -- строковое представления числа
+    :return: число в формате float или nan
+    """
+    try:
+        return int(''.join(string.split(',')).strip()) / 100
+    except ValueError:
+        return np.nan
+
+
+@lru_cache(maxsize=65536)
+def parse_datetime(date: str) -> np.datetime64:
+    """Функция преобразует нестандартную строку даты в datetime64[m], результаты кэшируются
+
+    :param date: str -- дата в форме строки
+    :return: np.datetime64 -- дата или NaT
+    """
+    for pattern in ('%d.%m.%Y в %H:%M', '%d.%m.%Y', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return np.datetime64(datetime.strptime(date.strip(), pattern), 'm')
+        except ValueError:
+            continue
+    return np.datetime64('NaT', 'm')
+
+
+def to_str_array(values) -> np.ndarray:
+    """Функция приводит последовательность строк к массиву NumPy, None и nan заменяются пустой строкой
+
+    :param values: -- последовательность строк
+    :return: np.ndarray -- массив строк
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        return values
+    return np.array([value if isinstance(value, str) else '' for value in values], dtype=str)
+
+
+def to_numeric_batch(strings) -> np.ndarray:
+    """Функция преобразует массив строк в float64, аналог to_numeric для целого столбца
+
+    :param strings: -- последовательность строковых представлений чисел
+    :return: np.ndarray -- массив float64, nan для непреобразуемых значений
+    """
+    values = to_str_array(strings)
+    if not values.size:
+        return np.empty(values.shape, dtype=np.float64)
+    uniques, inverse = np.unique(values, return_inverse=True)
+    cleaned = np.char.strip(np.char.replace(uniques, ',', ''))
+    fast = np.char.isdigit(cleaned) & (np.char.str_len(cleaned) <= NUMERIC_DIGITS)
+
+    result = np.full(uniques.shape, np.nan)
+    result[fast] = cleaned[fast].astype(np.int64) / 100
+    slow = ~fast & (cleaned != '')
+    result[slow] = [parse_numeric(string) for string in uniques[slow]]
+
+    failed = int(np.isnan(result[slow]).sum())
+    if failed:
+        logging.error(logger(f'Cannot convert {failed} values to numeric'))
+    return result[inverse.reshape(values.shape)]
+
+
+def rearrange(values: np.ndarray, width: int, order: list, fill: dict) -> np.ndarray:
+    """Функция переставляет символы строк фиксированной длины, например 'dd.mm.yyyy' -> 'yyyy-mm-dd'
+
+    :param values: np.ndarray -- массив строк длины width
+    :param width: int -- длина строк
+    :param order: list -- номера символов исходной строки для каждой позиции результата
+    :param fill: dict -- {позиция результата: символ}, символы-разделители
+    :return: np.ndarray -- массив строк длины len(order)
+    """
+    chars = values.astype(f'U{width}').view('U1').reshape(-1, width)[:, order]
+    for position, char in fill.items():
+        chars[:, position] = char
+    return np.ascontiguousarray(chars).view(f'U{len(order)}').ravel()
+
+
+def has_pattern(values: np.ndarray, pattern: str) -> np.ndarray:
+    """Функция проверяет, что строки имеют вид pattern, где 'd' -- любая цифра
+
+    :param values: np.ndarray -- массив строк
+    :param pattern: str -- шаблон, например 'dd.mm.yyyy' записывается как 'dd.dd.dddd'
+    :return: np.ndarray -- булев массив
+    """
+    mask = np.char.str_len(values) == len(pattern)
+    if not mask.any():
+        return mask
+    chars = values[mask].astype(f'U{len(pattern)}').view('U1').reshape(-1, len(pattern))
+    ok = np.ones(len(chars), dtype=bool)
+    for position, char in enumerate(pattern):
+        column = chars[:, position]
+        ok &= np.char.isdigit(column) if char == 'd' else column == char
+    mask[mask] = ok
+    return mask
+
+
+def to_datetime_batch(dates, unit='m') -> np.ndarray:
+    """Функция преобразует массив дат вида 'dd.mm.yyyy' и 'dd.mm.yyyy в HH:MM' в datetime64,
+    аналог date_formatter/datetime_formatter для целого столбца.
+    Стандартные форматы (а также уже преобразованные 'yyyy-mm-dd') разбираются векторно,
+    остальные строки -- через parse_datetime с кэшем; повторяющиеся даты разбираются один раз
+
+    :param dates: -- последовательность строк дат
+    :param unit: str -- единица datetime64, по умолчанию минуты ('m'), для дат без времени -- 'D'
+    :return: np.ndarray -- массив datetime64, NaT для непреобразуемых значений
+    """
+    values = to_str_array(dates)
+    uniques, inverse = np.unique(values, return_inverse=True)
+    uniques = np.char.strip(uniques)
+    result = np.full(uniques.shape, np.datetime64('NaT', 'm'))
+    done = np.zeros(uniques.shape, dtype=bool)
+
+    formats = (
+        ('dd.dd.dddd', 10, [6, 7, 8, 9, 5, 3, 4, 2, 0, 1], {4: '-', 7: '-'}),
+        ('dd.dd.dddd в dd:dd', 18, [6, 7, 8, 9, 5, 3, 4, 2, 0, 1, 10, 13, 14, 15, 16, 17], {4: '-', 7: '-', 10: 'T'}),
+        ('dddd-dd-dd', 10, list(range(10)), {}),
+    )
+    for pattern, width, order, fill in formats:
+        mask = has_pattern(uniques, pattern) & ~done
+        if not mask.any():
+            continue
+        try:
+            result[mask] = rearrange(uniques[mask], width, order, fill).astype('datetime64[m]')
+            done |= mask
+        except ValueError:
+            pass  # несуществующая дата, например 31.02.2020, -- такие строки разбираются по одной ниже
+
+    slow = ~done & (uniques != '')
+    result[slow] = [parse_datetime(date) for date in uniques[slow]]
+
+    failed = int(np.isnat(result[slow]).sum())
+    if failed:
+        logging.error(logger(f'Cannot convert {failed} values to datetime'))
+    return result[inverse.reshape(values.shape)].astype(f'datetime64[{unit}]')
+
+
+def to_date_batch(dates) -> np.ndarray:
+    """Функция преобразует массив дат вида 'dd.mm.yyyy' в datetime64[D], см. to_datetime_batch
+
+    :param dates: -- последовательность строк дат
+    :return: np.ndarray -- массив datetime64[D]
+    """
+    return to_datetime_batch(dates, unit='D')
@@ -0,0 +1,216 @@
+from threading import Thread, Lock, Event
+from collections import deque
+import os
+import yaml
+from utils.collecting import logger
+import logging
+
+logging.basicConfig(filename='../../../data/logs/tenderbot.log', level=logging.INFO)  # add filemode="w" to overwrite
+
+SPACES = '\t\n\r\xa0\u2009\u202f'  # символы, которые при поиске считаются пробелом
+NORMALIZE = str.maketrans({char: ' ' for char in SPACES} | {'ё': 'е'})
+
+
+def normalize_text(text: str) -> str:
+    """Функция приводит текст к виду, в котором хранятся шаблоны: нижний регистр, е вместо ё, пробелы,
+    длина текста сохраняется, чтобы позиции совпадений относились к исходному тексту
+
+    :param text: str -- текст
+    :return: str -- нормализованный текст
+    """
+    lower = text.lower()
+    if len(lower) != len(text):
+        # редкие символы, у которых нижний регистр длиннее одного символа, оставляем как есть
+        lower = ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+    return lower.translate(NORMALIZE)
+
+
+def normalize_phrase(phrase: str) -> str:
+    """Функция приводит фразу правила к виду шаблона, подряд идущие пробелы схлопываются
+
+    :param phrase: str -- фраза
+    :return: str -- шаблон
+    """
+    return ' '.join(normalize_text(phrase).split())
+
+
+class Automaton(object):
+    """Класс автомата Ахо -- Корасик: все фразы правил ищутся за один проход по тексту,
+    время поиска не зависит от числа правил
+
+    Атрибуты:
+    :param rules: dict -- {id правила: [фразы]}
+
+    Использование:
+        >>> automaton = Automaton({'license': ['наличие лицензии'], 'smp': ['субъектов малого предпринимательства']})
+        >>> automaton.find(card_data['comment'])
+        [('license', 120, 136)]
+    """
+
+    def __init__(self, rules: dict):
+        self.goto = [{}]  # переходы по символам
+        self.fail = [0]  # переход по несовпадению -- самый длинный собственный суффикс, который есть в боре
+        self.outputs = [()]  # (id правила, длина шаблона), заканчивающиеся в состоянии
+        self.rules = {rule_id: list(phrases) for rule_id, phrases in rules.items()}
+        for rule_id, phrases in self.rules.items():
+            for phrase in phrases:
+                pattern = normalize_phrase(phrase)
+                if pattern:
+                    self.add(rule_id, pattern)
+        self.build()
+        self.depth = max((length for output in self.outputs for _, length in output), default=1)
+
+    def add(self, rule_id, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        self.outputs[state] += ((rule_id, len(pattern)),)
+
+    def build(self):
+        """Функция вычисляет переходы по несовпадению обходом бора в ширину"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                # совпадения суффиксов наследуются, чтобы при поиске не проходить цепочку fail
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def find(self, text: str) -> list:
+        """Функция находит все вхождения фраз правил в тексте
+        Регистр, ё/е и число пробелов между словами не учитываются
+
+        :param text: str -- текст, например результат get_comment
+        :return: list -- список (id правила, начало, конец) по позициям в исходном тексте
+        """
+        matches = []
+        if not text:
+            return matches
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        previous = ''
+        # начала символов шаблона в исходном тексте, нужны, потому что пробелы схлопываются
+        starts = deque(maxlen=self.depth)
+        for position, char in enumerate(normalize_text(text)):
+            if char == ' ' and previous == ' ':
+                continue
+            previous = char
+            starts.append(position)
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for rule_id, length in outputs[state]:
+                matches.append((rule_id, starts[-length], position + 1))
+        return matches
+
+    def rule_ids(self, text: str) -> set:
+        """Функция возвращает id сработавших правил
+
+        :param text: str -- текст
+        :return: set -- id правил
+        """
+        return {rule_id for rule_id, _, _ in self.find(text)}
+
+
+def load_rules(path='../../../configs/restrictions.yaml') -> dict:
+    """Функция загружает правила из конфигурационного файла вида:
+        license:
+          - наличие лицензии
+          - лицензия ФСБ
+        smp:
+          - субъектов малого предпринимательства
+
+    :param path: str -- путь к конфигурационному файлу
+    :return: dict -- {id правила: [фразы]}
+    """
+    with open(path) as f:
+        rules = yaml.safe_load(f) or {}
+    return {rule_id: [phrases] if isinstance(phrases, str) else list(phrases) for rule_id, phrases in rules.items()}
+
+
+class RestrictionMatcher(object):
+    """Класс ищет скрытые ограничения в тексте закупки по правилам с горячей перезагрузкой
+    Новый автомат строится в фоновом потоке и подменяет текущий одним присваиванием,
+    поэтому поиск не останавливается на время перестроения
+
+    Атрибуты:
+    :param path: str -- путь к файлу правил, см. load_rules
+    :param interval: float -- период проверки изменения файла правил, сек., None -- не следить за файлом
+
+    Использование:
+        >>> matcher = RestrictionMatcher('../../../configs/restrictions.yaml', interval=60)
+        >>> matcher.find(card_data['comment'])
+        >>> matcher.close()
+    """
+
+    def __init__(self, path='../../../configs/restrictions.yaml', interval=None):
+        self.path = path
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self.mtime = os.path.getmtime(path)
+        self.automaton = Automaton(load_rules(path))
+        self.watcher = None
+        if interval is not None:
+            self.watcher = Thread(target=self.watch, name='restrictions-watch', daemon=True)
+            self.watcher.start()
+
+    def find(self, text: str) -> list:
+        """Функция находит вхождения правил в тексте, см. Automaton.find"""
+        return self.automaton.find(text)
+
+    def rule_ids(self, text: str) -> set:
+        """Функция возвращает id сработавших правил, см. Automaton.rule_ids"""
+        return self.automaton.rule_ids(text)
+
+    def reload(self, rules: dict = None, wait=False) -> Thread:
+        """Функция перестраивает автомат в фоне и подменяет текущий
+
+        :param rules: dict -- новые правила, по умолчанию перечитываются из файла
+        :param wait: bool -- дождаться окончания перестроения
+        :return: Thread -- поток перестроения
+        """
+        def rebuild():
+            try:
+                automaton = Automaton(rules if rules is not None else load_rules(self.path))
+            except Exception as e:
+                msg = f'Failed to reload restriction rules from {self.path}, keeping previous rules. {e!r}'
+                logging.error(logger(msg))
+                return
+            with self._lock:
+                self.automaton = automaton
+            msg = f'Restriction rules reloaded: {len(automaton.rules)} rules'
+            logging.info(logger(msg))
+
+        thread = Thread(target=rebuild, name='restrictions-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime != self.mtime:
+                self.mtime = mtime
+                self.reload(wait=True)
+
+    def close(self):
+        """Функция останавливает слежение за файлом правил"""
+        self._stop.set()
+        if self.watcher is not None:
+            self.watcher.join()
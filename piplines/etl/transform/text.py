@@ -0,0 +1,134 @@
+from functools import lru_cache
+import re
+
+TOKEN = re.compile(r'[а-яёa-z0-9]+')
+
+VOWELS = 'аеиоуыэюя'
+
+# окончания алгоритма Snowball для русского языка, группа 1 -- только после а или я
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+                  'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило',
+         'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+             'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья',
+             'я'))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ((), ('ост', 'ость'))
+
+
+def endings(groups: tuple) -> tuple:
+    """Функция упорядочивает окончания по убыванию длины, чтобы находить самое длинное
+
+    :param groups: tuple -- (окончания группы 1, окончания группы 2)
+    :return: tuple -- пары (окончание, требуется ли а или я перед ним)
+    """
+    pairs = [(ending, True) for ending in groups[0]] + [(ending, False) for ending in groups[1]]
+    return tuple(sorted(pairs, key=lambda pair: -len(pair[0])))
+
+
+PERFECTIVE_GERUND, ADJECTIVE, PARTICIPLE, REFLEXIVE, VERB, NOUN, SUPERLATIVE, DERIVATIONAL = map(
+    endings, (PERFECTIVE_GERUND, ADJECTIVE, PARTICIPLE, REFLEXIVE, VERB, NOUN, SUPERLATIVE, DERIVATIONAL))
+
+
+def remove_ending(word: str, groups: tuple, start=0):
+    """Функция удаляет самое длинное окончание из класса, окончание должно начинаться не раньше start
+
+    :param word: str -- часть слова в области RV
+    :param groups: tuple -- окончания, см. endings
+    :param start: int -- начало области, в которой должно лежать окончание
+    :return: str -- слово без окончания или None, если окончание не найдено
+    """
+    for ending, after_a in groups:
+        if word.endswith(ending):
+            position = len(word) - len(ending)
+            if position < start or (after_a and (position == 0 or word[position - 1] not in 'ая')):
+                return None
+            return word[:position]
+    return None
+
+
+def regions(word: str) -> tuple:
+    """Функция вычисляет начало областей RV и R2 алгоритма Snowball
+
+    :param word: str -- слово
+    :return: tuple -- (RV, R2)
+    """
+    rv = next((i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    r1 = next((i + 1 for i in range(1, len(word)) if word[i] not in VOWELS and word[i - 1] in VOWELS), len(word))
+    r2 = next((i + 1 for i in range(r1 + 1, len(word)) if word[i] not in VOWELS and word[i - 1] in VOWELS),
+              len(word))
+    return rv, r2
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    """Функция находит основу русского слова по алгоритму Snowball (Портера),
+    слова без русских гласных возвращаются без изменений
+
+    :param word: str -- слово в нижнем регистре
+    :return: str -- основа слова
+    """
+    word = word.replace('ё', 'е')
+    rv, r2 = regions(word)
+    prefix, rest = word[:rv], word[rv:]
+
+    # шаг 1: деепричастие, иначе возвратная частица и прилагательное, глагол или существительное
+    result = remove_ending(rest, PERFECTIVE_GERUND)
+    if result is None:
+        reflexive = remove_ending(rest, REFLEXIVE)
+        if reflexive is not None:
+            rest = reflexive
+        adjective = remove_ending(rest, ADJECTIVE)
+        if adjective is not None:
+            result = remove_ending(adjective, PARTICIPLE)
+            result = adjective if result is None else result
+        else:
+            result = remove_ending(rest, VERB)
+            if result is None:
+                result = remove_ending(rest, NOUN)
+        rest = rest if result is None else result
+    else:
+        rest = result
+
+    # шаг 2: и
+    if rest.endswith('и'):
+        rest = rest[:-1]
+
+    # шаг 3: словообразовательный суффикс в R2
+    result = remove_ending(rest, DERIVATIONAL, start=r2 - rv)
+    if result is not None:
+        rest = result
+
+    # шаг 4: превосходная степень, нн, ь
+    if rest.endswith('нн'):
+        rest = rest[:-1]
+    else:
+        result = remove_ending(rest, SUPERLATIVE)
+        if result is not None:
+            rest = result[:-1] if result.endswith('нн') else result
+        elif rest.endswith('ь'):
+            rest = rest[:-1]
+    return prefix + rest
+
+
+def tokenize(text: str) -> list:
+    """Функция разбивает текст на слова в нижнем регистре
+
+    :param text: str -- текст
+    :return: list -- список слов
+    """
+    return TOKEN.findall(text.lower()) if text else []
+
+
+def terms(text: str) -> list:
+    """Функция разбивает текст на основы слов, см. tokenize и stem
+
+    :param text: str -- текст
+    :return: list -- список основ в порядке следования слов
+    """
+    return [stem(token) for token in tokenize(text)]